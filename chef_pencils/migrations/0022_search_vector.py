@@ -0,0 +1,49 @@
+# Generated by Django 3.2.4 on 2026-10-18 01:59
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chef_pencils', '0021_auto_20211008_1401'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chefpencilrecord',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            sql='''
+                CREATE FUNCTION chef_pencil_search_vector_trigger() RETURNS trigger AS $$
+                BEGIN
+                    NEW.search_vector :=
+                        setweight(to_tsvector('pg_catalog.english', coalesce(NEW.title, '')), 'A') ||
+                        setweight(to_tsvector(
+                            'pg_catalog.english',
+                            regexp_replace(coalesce(NEW.html_content, ''), '<[^>]*>', ' ', 'g')
+                        ), 'B');
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql;
+
+                CREATE TRIGGER chef_pencil_search_vector_update
+                BEFORE INSERT OR UPDATE OF title, html_content ON chef_pencils_chefpencilrecord
+                FOR EACH ROW EXECUTE PROCEDURE chef_pencil_search_vector_trigger();
+
+                UPDATE chef_pencils_chefpencilrecord SET title = title;
+            ''',
+            reverse_sql='''
+                DROP TRIGGER IF EXISTS chef_pencil_search_vector_update ON chef_pencils_chefpencilrecord;
+                DROP FUNCTION IF EXISTS chef_pencil_search_vector_trigger();
+            ''',
+        ),
+        migrations.AddIndex(
+            model_name='chefpencilrecord',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='chef_pencil_search_gin'),
+        ),
+    ]
@@ -1,10 +1,13 @@
 from django.contrib.contenttypes.fields import GenericRelation
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from main.mixins import UpdatedFieldsMixin
 from main.validators import validate_images_file_max_size
 from social.models import Comment, Like, Rating
+from stats.models import StatRecord
 from utils.file_storage import chef_pencil_image_file_path
 
 
@@ -75,7 +78,10 @@ class ChefPencilRecord(UpdatedFieldsMixin, models.Model):
         default=0
     )
 
-    stat_records = GenericRelation(Like, related_query_name='chefpencil_record')
+    stat_records = GenericRelation(StatRecord, related_query_name='chefpencil_record')
+
+    # weighted title and text without tags, kept up to date by a database trigger, see migration 0022
+    search_vector = SearchVectorField(null=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     updated_at = models.DateTimeField(auto_now=True, editable=False)
@@ -85,6 +91,9 @@ class ChefPencilRecord(UpdatedFieldsMixin, models.Model):
     class Meta:
         verbose_name = "Chef's Pencil Record"
         verbose_name_plural = "Chef's Pencil Records"
+        indexes = [
+            GinIndex(fields=['search_vector'], name='chef_pencil_search_gin'),
+        ]
 
     def __str__(self):
         return f'#{self.pk} - {self.title[0:50]} (by {self.user}), likes: {self.likes_number}'
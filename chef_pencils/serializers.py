@@ -1,7 +1,9 @@
 from main.validators import validate_images_file_max_size
+from recipe.redis import SearchSuggestionsIndex
 from recipe.serializers import QuerySerializer
 from rest_framework import serializers
-from social.models import Like
+from social.serializers import (UserFlagsListSerializer,
+                                UserFlagsSerializerMixin)
 from users.serializers import UserCardSerializer, UserSerializer
 
 from chef_pencils.models import (ChefPencilCategory, ChefPencilImage,
@@ -18,16 +20,15 @@ class ChefPencilQuerySerializer(QuerySerializer):
     Based on and similar to Recipe search suggestions query serializer
     """
 
-    def get_results(self):
+    def get_index(self):
+        return SearchSuggestionsIndex(SearchSuggestionsIndex.CHEF_PENCILS)
 
-        results = ChefPencilRecord.objects.filter(
-            title__icontains=self.validated_data['search']
-        ).order_by('-created_at')[0:30]
 
-        return results
+class ChefPencilRecordSerializer(UserFlagsSerializerMixin, serializers.ModelSerializer):
 
-
-class ChefPencilRecordSerializer(serializers.ModelSerializer):
+    saved_key = 'user_saved_chef_pencil_record'
+    saved_model = SavedChefPencilRecord
+    saved_field = 'chef_pencil_record'
 
     user = UserSerializer(read_only=True)
 
@@ -45,6 +46,7 @@ class ChefPencilRecordSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ChefPencilRecord
+        list_serializer_class = UserFlagsListSerializer
         fields = [
             'pk',
             'user',
@@ -155,38 +157,11 @@ class ChefPencilRecordSerializer(serializers.ModelSerializer):
 
         ret['categories'] = [{'pk': i.pk, 'title': i.title} for i in instance.chefpencilcategory_set.all()]
 
-        try:
-            user = self.context['request'].user
-        except KeyError:
-            ret['user_liked'] = False
-            ret['user_saved_chef_pencil_record'] = False
-        else:
-            if not user.is_authenticated:
-                ret['user_liked'] = False
-                ret['user_saved_chef_pencil_record'] = False
-            else:
-                try:
-                    Like.objects.get(
-                        user=self.context['request'].user,
-                        content_type__model=instance.__class__.__name__.lower(),
-                        object_id=instance.pk
-                    )
-                except Like.DoesNotExist:
-                    ret['user_liked'] = False
-                else:
-                    ret['user_liked'] = True
+        # annotated by the search, see main.search.search_ranked
+        if hasattr(instance, 'search_headline'):
+            ret['search_headline'] = instance.search_headline
 
-                try:
-                    sr = SavedChefPencilRecord.objects.get(
-                        user=self.context['request'].user,
-                        chef_pencil_record=instance
-                    )
-                except SavedChefPencilRecord.DoesNotExist:
-                    ret['user_saved_chef_pencil_record'] = False
-                else:
-                    ret['user_saved_chef_pencil_record'] = sr.pk
-
-        return ret
+        return self.add_user_flags(instance, ret)
 
 
 class ChefPencilImageSerializer(serializers.ModelSerializer):
@@ -237,6 +212,7 @@ class SavedChefPencilRecordSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = SavedChefPencilRecord
+        list_serializer_class = UserFlagsListSerializer
         fields = ['pk', 'user', 'chef_pencil_record', 'created_at']
         read_only_fields = ['pk', 'user', 'created_at']
 
@@ -251,10 +227,22 @@ class SavedChefPencilRecordSerializer(serializers.ModelSerializer):
         )
         return saved
 
+    def load_user_flags(self, instances):
+        serializer = ChefPencilRecordSerializer(context=self.context)
+        user = serializer._get_user()
+        serializer.load_user_flags(
+            [i.chef_pencil_record for i in instances],
+            # nothing is saved without a user
+            saved={
+                i.chef_pencil_record_id: i.pk
+                for i in instances if i.user_id == user.pk
+            } if user is not None else None
+        )
+
     def to_representation(self, instance):
         ret = super().to_representation(instance)
         ret['chef_pencil_record'] = ChefPencilRecordSerializer(
             instance=instance.chef_pencil_record,
-            context={'request': self.context['request']}
+            context=self.context
         ).data
         return ret
@@ -9,14 +9,24 @@ from django.db.models.aggregates import Avg, Count
 
 class ChefPencilRatingCalculator:
 
-    def get_avg_ratings_for_chef_pencils(self):
-        ratings = Rating.objects.filter(content_type__model='chefpencilrecord').values_list(
+    def get_avg_ratings_for_chef_pencils(self, pks=None):
+        """
+        Calculate ratings for all records or only for records with given pks
+        """
+        ratings = Rating.objects.filter(content_type__model='chefpencilrecord')
+        if pks is not None:
+            ratings = ratings.filter(object_id__in=pks)
+        ratings = ratings.values_list(
             'object_id'
         ).annotate(
             rounded_avg_rating=Round1(Avg('rating'))
         )
         self.ratings = {p[0]: p[1] for p in ratings}
 
+        # records that lost all their ratings
+        for pk in pks or []:
+            self.ratings.setdefault(pk, None)
+
     def update_records(self):
         to_update = []
         for r in ChefPencilRecord.objects.filter(pk__in=self.ratings.keys()).only('pk'):
@@ -27,14 +37,24 @@ class ChefPencilRatingCalculator:
 
 class ChefPencilRecordLikeCalculator:
 
-    def get_total_likes_for_chef_pencil_records(self):
-        likes = Like.objects.filter(content_type__model='chefpencilrecord').values_list(
+    def get_total_likes_for_chef_pencil_records(self, pks=None):
+        """
+        Calculate likes for all records or only for records with given pks
+        """
+        likes = Like.objects.filter(content_type__model='chefpencilrecord')
+        if pks is not None:
+            likes = likes.filter(object_id__in=pks)
+        likes = likes.values_list(
             'object_id'
         ).annotate(
             Count('pk')
         )
         self.ratings = {p[0]: p[1] for p in likes}
 
+        # records that lost all their likes
+        for pk in pks or []:
+            self.ratings.setdefault(pk, 0)
+
     def update_records(self):
         to_update = []
         for r in ChefPencilRecord.objects.filter(pk__in=self.ratings.keys()).only('pk'):
@@ -45,10 +65,15 @@ class ChefPencilRecordLikeCalculator:
 
 class ChefPencilRecordViewsCalculator:
 
-    def get_total_views_for_chef_pencil_records(self):
-
-        rr = ChefPencilRecord.objects.all().select_related('user').annotate(
-            views_number_calculated=Sum('stat_records__views_counter__count')
+    def get_total_views_for_chef_pencil_records(self, pks=None):
+        """
+        Calculate views for all records or only for records with given pks
+        """
+        rr = ChefPencilRecord.objects.all()
+        if pks is not None:
+            rr = rr.filter(pk__in=pks)
+        rr = rr.annotate(
+            views_number_calculated=Sum('stat_records__views_count')
         )
         self.ratings = {r.pk: r.views_number_calculated for r in rr}
 
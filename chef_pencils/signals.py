@@ -1,9 +1,11 @@
 import django
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 from chef_pencils.models import ChefPencilRecord
 from notifications.service import NotifyService
+from recipe.redis import SearchSuggestionsIndex
 from utils.email import (
     send_chef_pencils_record_created_email,
     send_chef_pencils_record_review_result_email
@@ -15,7 +17,7 @@ S_new_chef_recipe_record_created = django.dispatch.Signal()
 @receiver(post_save, sender=ChefPencilRecord)
 def notify_about_chef_pencil_record_change(sender, instance, created, **kwargs):
     if not created:
-        if "status" in kwargs.get('update_fields', []) and instance.status in [
+        if "status" in (kwargs.get('update_fields') or []) and instance.status in [
             ChefPencilRecord.Status.APPROVED,
             ChefPencilRecord.Status.REJECTED,
         ]:
@@ -30,6 +32,19 @@ def notify_about_chef_pencil_record_change(sender, instance, created, **kwargs):
             )
 
 
+@receiver(post_save, sender=ChefPencilRecord)
+def index_chef_pencil_record_suggestions(sender, instance, created, **kwargs):
+    if 'title' in (kwargs.get('update_fields') or ['title']):
+        pk, title = instance.pk, str(instance.title)
+        transaction.on_commit(lambda: SearchSuggestionsIndex(SearchSuggestionsIndex.CHEF_PENCILS).update(pk, title))
+
+
+@receiver(post_delete, sender=ChefPencilRecord)
+def unindex_chef_pencil_record_suggestions(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: SearchSuggestionsIndex(SearchSuggestionsIndex.CHEF_PENCILS).update(pk, None))
+
+
 @receiver(S_new_chef_recipe_record_created)
 def notify_about_chef_pencil_record_creation(sender, instance, **kwargs):
     NotifyService().create_notify_chef_pencil_record_created(
@@ -7,6 +7,8 @@ from pprint import pprint
 from django.conf import settings
 from main.utils.test import (IsAuthClientTestCase, TestDataService,
                              create_random_sentence)
+from recipe.redis import SearchSuggestionsIndex
+from recipe.tasks import calculate_counters_for_changed_objects
 from rest_framework import status
 from rest_framework.reverse import reverse
 from social.models import Comment, CommentLike, Like, Rating
@@ -15,8 +17,6 @@ from utils.test import get_alt_test_files, get_test_files
 
 from chef_pencils.models import (ChefPencilCategory, ChefPencilImage,
                                  ChefPencilRecord, SavedChefPencilRecord)
-from chef_pencils.tasks import (calculate_avg_rating_for_chef_pencils,
-                                calculate_likes_for_chef_pencil_records)
 
 TEXT = """Maecenas enim lacus, rhoncus eu sagittis ut, tincidunt eu magna.
 Proin sit amet mollis eros. Suspendisse id tellus odio. Cras in nisl quis elit
@@ -383,27 +383,28 @@ class ChefPencilTestCase(IsAuthClientTestCase):
 
         ratings1 = [3, 4, 3]
         ratings2 = [5, 5, 4]
-        for i in range(3):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
 
-            user = self.create_random_user(extra_fields={'is_email_active': True})
-            client = self.create_client_with_auth(user)
+                user = self.create_random_user(extra_fields={'is_email_active': True})
+                client = self.create_client_with_auth(user)
 
-            response = client.post(
-                reverse('chef_pencil:chef_pencil_rate', args=[cpr1.pk]),
-                data={'rating': ratings1[i]}
-            )
-            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                response = client.post(
+                    reverse('chef_pencil:chef_pencil_rate', args=[cpr1.pk]),
+                    data={'rating': ratings1[i]}
+                )
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
-            response = client.post(
-                reverse('chef_pencil:chef_pencil_rate', args=[cpr2.pk]),
-                data={'rating': ratings2[i]}
-            )
-            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                response = client.post(
+                    reverse('chef_pencil:chef_pencil_rate', args=[cpr2.pk]),
+                    data={'rating': ratings2[i]}
+                )
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
         self.assertEqual(Rating.objects.filter(
             content_type__model='chefpencilrecord').count(), 6)
 
-        calculate_avg_rating_for_chef_pencils()
+        calculate_counters_for_changed_objects()
 
         cpr = ChefPencilRecord.objects.get(pk=cpr1.pk)
         self.assertEqual(cpr.avg_rating, 3.3)
@@ -464,6 +465,7 @@ class ChefPencilTestCase(IsAuthClientTestCase):
         self.assertEqual(len(response.data), 1)
 
     def test_search_suggestions_for_chef_pencils(self):
+        SearchSuggestionsIndex(SearchSuggestionsIndex.CHEF_PENCILS).reset()
 
         titles = [
             ('We have a new Coconut Curry Soup', 3,),
@@ -473,13 +475,14 @@ class ChefPencilTestCase(IsAuthClientTestCase):
         ]
 
         chef_records = []
-        for info in titles:
-            data = {
-                'user': self.home_chef_user,
-                'html_content': TEXT
-            }
-            data.update({'title': [info[0]], 'avg_rating': info[1]})
-            chef_records.append(ChefPencilRecord.objects.create(**data))
+        with self.captureOnCommitCallbacks(execute=True):
+            for info in titles:
+                data = {
+                    'user': self.home_chef_user,
+                    'html_content': TEXT
+                }
+                data.update({'title': [info[0]], 'avg_rating': info[1]})
+                chef_records.append(ChefPencilRecord.objects.create(**data))
 
         ChefPencilRecord.objects.update(status=ChefPencilRecord.Status.APPROVED)
 
@@ -515,43 +518,44 @@ class ChefPencilTestCase(IsAuthClientTestCase):
         response1 = self._create_chefpencil_record()
         response2 = self._create_chefpencil_record()
 
-        for i in range(3):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
 
-            user = self.create_random_user(extra_fields={'is_email_active': True})
-            client = self.create_client_with_auth(user)
+                user = self.create_random_user(extra_fields={'is_email_active': True})
+                client = self.create_client_with_auth(user)
 
-            # like #1
+                # like #1
 
-            response = client.get(reverse('chef_pencil:retrieve_update_destroy', args=[response1.data['pk']]))
-            self.assertEqual(response.status_code, status.HTTP_200_OK)
-            self.assertFalse(response.data['user_liked'])
+                response = client.get(reverse('chef_pencil:retrieve_update_destroy', args=[response1.data['pk']]))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertFalse(response.data['user_liked'])
 
-            response = client.post(
-                reverse('chef_pencil:chef_pencil_like', args=[response1.data['pk']])
-            )
-            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-            self.assertEqual(response.data['like_status'], 'created')
+                response = client.post(
+                    reverse('chef_pencil:chef_pencil_like', args=[response1.data['pk']])
+                )
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                self.assertEqual(response.data['like_status'], 'created')
 
-            response = client.get(reverse('chef_pencil:retrieve_update_destroy', args=[response1.data['pk']]))
-            self.assertEqual(response.status_code, status.HTTP_200_OK)
-            self.assertTrue(response.data['user_liked'])
+                response = client.get(reverse('chef_pencil:retrieve_update_destroy', args=[response1.data['pk']]))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertTrue(response.data['user_liked'])
 
-            # anonymous client has no likes
+                # anonymous client has no likes
 
-            response = self.anonymous_client.get(reverse('chef_pencil:retrieve_update_destroy', args=[response1.data['pk']]))
-            self.assertEqual(response.status_code, status.HTTP_200_OK)
-            self.assertFalse(response.data['user_liked'])
+                response = self.anonymous_client.get(reverse('chef_pencil:retrieve_update_destroy', args=[response1.data['pk']]))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertFalse(response.data['user_liked'])
 
-            # like #2
+                # like #2
 
-            response = client.post(
-                reverse('chef_pencil:chef_pencil_like', args=[response2.data['pk']])
-            )
-            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                response = client.post(
+                    reverse('chef_pencil:chef_pencil_like', args=[response2.data['pk']])
+                )
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
         self.assertEqual(Like.objects.count(), 6)
 
-        calculate_likes_for_chef_pencil_records()
+        calculate_counters_for_changed_objects()
 
         cp = ChefPencilRecord.objects.get(pk=response1.data['pk'])
         self.assertEqual(cp.likes_number, 3)
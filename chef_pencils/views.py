@@ -3,13 +3,14 @@ import random
 from datetime import datetime
 
 from django.db import transaction
-from django.db.models import Q
 from django_filters.rest_framework import FilterSet
 from django_filters.rest_framework.filters import CharFilter
 from drf_yasg.openapi import IN_QUERY, Parameter
 from drf_yasg.utils import swagger_auto_schema
 from main.pagination import StandardResultsSetPagination
 from main.permissions import IsHomeChef, IsOwner
+from main.search import search_ranked
+from main.utils.db import StripTags
 from rest_framework import generics, permissions, serializers, status
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
@@ -38,9 +39,8 @@ class ChefPencilRecordFilterSet(FilterSet):
         fields = []
 
     def search_filter(self, queryset, name, search):
-        return queryset.filter(
-            Q(title__search=search)|Q(html_content__search=search)
-        )
+        # weighted search_vector is kept up to date by a trigger, see migration 0022
+        return search_ranked(queryset, search, StripTags('html_content')).order_by('-search_rank', '-pk')
 
 
 class ChefPencilRecordListCreateView(generics.ListCreateAPIView):
@@ -29,21 +29,17 @@ app.conf.worker_max_memory_per_child = 12000
 
 
 app.conf.beat_schedule = {
-    'calculate_avg_rating_for_recipes': {
-        'task': 'recipe.tasks.calculate_avg_rating_for_recipes',
+    'flush_stat_counters': {
+        'task': 'stats.tasks.flush_stat_counters',
         'schedule': crontab(minute='*/1')  # every minute
     },
-    'calculate_likes_for_recipes': {
-        'task': 'recipe.tasks.calculate_likes_for_recipes',
+    'calculate_counters_for_changed_objects': {
+        'task': 'recipe.tasks.calculate_counters_for_changed_objects',
         'schedule': crontab(minute='*/1')  # every minute
     },
-    'calculate_views_for_recipes': {
-        'task': 'recipe.tasks.calculate_views_for_recipes',
-        'schedule': crontab(minute='*/1')  # every minute
-    },
-    'calculate_avg_rating_for_chef_pencils': {
-        'task': 'chef_pencils.tasks.calculate_avg_rating_for_chef_pencils',
-        'schedule': crontab(minute='*/1')  # every minute
+    'reconcile_counters': {
+        'task': 'recipe.tasks.reconcile_counters',
+        'schedule': crontab(minute=15, hour=3)  # every night
     },
     'check_new_comments_for_recipes': {
         'task': 'recipe.tasks.check_new_comments_for_recipes',
@@ -53,9 +49,25 @@ app.conf.beat_schedule = {
         'task': 'recipe.tasks.check_new_comments_for_chef_pencil_records',
         'schedule': crontab(minute='*/60')  # every hour
     },
-    'update_recommended_recipes': {
-        'task': 'recipe.tasks.update_recommended_recipes',
-        'schedule': crontab(minute='*/1')
+    'calculate_recipe_neighbours': {
+        'task': 'recipe.tasks.calculate_recipe_neighbours',
+        'schedule': crontab(minute=30, hour=3)  # every night
+    },
+    'update_recipe_neighbours': {
+        'task': 'recipe.tasks.update_recipe_neighbours',
+        'schedule': crontab(minute='*/5')
+    },
+    'update_popular_recipes': {
+        'task': 'recipe.tasks.update_popular_recipes',
+        'schedule': crontab(minute='*/10')
+    },
+    'rebuild_search_suggestions': {
+        'task': 'recipe.tasks.rebuild_search_suggestions',
+        'schedule': crontab(minute=45, hour=3)  # every night
+    },
+    'rebuild_recipe_leaderboards': {
+        'task': 'recipe.tasks.rebuild_recipe_leaderboards',
+        'schedule': crontab(minute=50, hour=3)  # every night, after reconcile_counters
     }
 }
 
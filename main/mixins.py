@@ -1,20 +1,115 @@
+import copy
+
+from rest_framework.response import Response
+
+from main.redis import ResponseCache
+
+
 class UpdatedFieldsMixin:
     """
-    Provides
+    Provides saving of changed fields only
+
+    Field values are remembered when an instance is loaded from the database,
+    so 'update_fields' is calculated on save without reading the row again.
+    It is passed to post_save receivers as usual
     """
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._get_field_values()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        # refreshed values are what the row has, they are not changes,
+        # other fields keep their loaded values when only some are refreshed
+        values = self._get_field_values()
+        if fields is not None:
+            refreshed = {self._meta.get_field(name).attname for name in fields}
+            values = {
+                **(getattr(self, '_loaded_values', None) or {}),
+                **{attname: value for attname, value in values.items() if attname in refreshed},
+            }
+        self._loaded_values = values
+
+    def _get_field_values(self):
+        # deferred fields are not in __dict__ and are not tracked
+        return {
+            field.attname: self._copy_value(self.__dict__[field.attname])
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+    @staticmethod
+    def _copy_value(value):
+        # only ArrayField and JSONField values can be changed in place,
+        # other values are immutable and are compared as they are
+        if isinstance(value, (list, dict)):
+            return copy.deepcopy(value)
+        return value
+
+    def _get_loaded_values(self):
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None:
+            # instance was not loaded from the database (e.g. created with a pk by hand)
+            loaded_values = self.__class__.objects.filter(pk=self.pk).values(
+                *[field.attname for field in self._meta.concrete_fields]
+            ).first()
+        return loaded_values
+
+    def get_changed_fields(self):
+        loaded_values = self._get_loaded_values()
+        if loaded_values is None:
+            return None
+        return [
+            field.name
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__ and (
+                field.attname not in loaded_values
+                or loaded_values[field.attname] != self.__dict__[field.attname]
+            )
+        ]
+
     def save(self, *args, **kwargs):
-        if self.pk:
-            cls = self.__class__
-            old = cls.objects.get(pk=self.pk)
-
-            new, changed_fields = self, []
-            for field in cls._meta.get_fields():
-                field_name = field.name
-                try:
-                    if getattr(old, field_name) != getattr(new, field_name):
-                        changed_fields.append(field_name)
-                except Exception:
-                    pass
+        if self.pk and kwargs.get('update_fields') is None:
+            changed_fields = self.get_changed_fields()
+            if changed_fields:
+                changed_fields += [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if getattr(field, 'auto_now', False) and field.name not in changed_fields
+                ]
             kwargs['update_fields'] = changed_fields
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+        self._loaded_values = self._get_field_values()
+
+
+class CachedResponseMixin:
+    """
+    Serves GET responses of a view from the shared ResponseCache.
+
+    Only the query params listed in 'response_cache_params' make a difference,
+    others are ignored and do not multiply cached copies
+    """
+    response_cache_name = None
+    response_cache_params = []
+
+    def is_response_shared(self, request):
+        """ Whether the response is the same for every visitor """
+        return True
+
+    def get(self, request, *args, **kwargs):
+        if not self.is_response_shared(request):
+            return super().get(request, *args, **kwargs)
+
+        cache = ResponseCache(self.response_cache_name)
+        params = {name: request.query_params.getlist(name) for name in self.response_cache_params}
+        data = cache.get(params)
+        if data is not None:
+            return Response(data)
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(params, response.data)
+        return response
@@ -1,4 +1,13 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.db.models import F, IntegerField, Q, Value
+from django.db.models.functions import Coalesce
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination, BasePagination
+from rest_framework.response import Response
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -15,3 +24,96 @@ class StandardResultsSetPagination(PageNumberPagination):
         if not self.page.has_previous():
             return None
         return self.page.previous_page_number()
+
+
+class KeysetResultsSetPagination(StandardResultsSetPagination):
+    """
+    Page number pagination by default and keyset (seek) pagination when
+    the 'cursor' query param is passed (empty for the first page)
+
+    In keyset mode there is no COUNT(*) and no OFFSET: the next page is selected
+    with a WHERE on the ordering values of the last item, so deep pages cost
+    the same as the first one. The view provides the ordering with
+    get_keyset_ordering(), e.g. ['source_rank', '-likes_number'];
+    '-pk' is added to make it unique unless it ends with 'pk' or '-pk'
+    """
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering = list(view.get_keyset_ordering())
+        if not ordering or ordering[-1].lstrip('-') != 'pk':
+            ordering = [o for o in ordering if o.lstrip('-') != 'pk'] + ['-pk']
+        self.keys = [f'_keyset_{i}' for i in range(len(ordering))]
+
+        annotations, order_by = {}, []
+        for key, field in zip(self.keys, ordering):
+            name = field.lstrip('-')
+            annotations[key] = self._get_not_null_expression(queryset.model, name)
+            order_by.append(F(key).desc() if field.startswith('-') else F(key).asc())
+        queryset = queryset.annotate(**annotations).order_by(*order_by)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self._get_position_filter(ordering, position))
+
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page_results = results[:page_size]
+        return self.page_results
+
+    @staticmethod
+    def _get_not_null_expression(model, name):
+        # NULLs can't be compared, nullable counters are sorted as 0
+        try:
+            nullable = model._meta.get_field(name).null
+        except FieldDoesNotExist:
+            nullable = False
+        return Coalesce(F(name), Value(0), output_field=IntegerField()) if nullable else F(name)
+
+    def _get_position_filter(self, ordering, position):
+        """ (a, b, c) after (x, y, z) == a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z) """
+        position_filter = Q()
+        for i, field in enumerate(ordering):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition = Q(**{f'{self.keys[i]}__{lookup}': position[i]})
+            for j in range(i):
+                condition &= Q(**{self.keys[j]: position[j]})
+            position_filter |= condition
+        return position_filter
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(cursor.encode('ascii')))
+        except (TypeError, ValueError):
+            raise NotFound('Invalid cursor')
+        if not isinstance(position, list) or len(position) != len(self.keys):
+            raise NotFound('Invalid cursor')
+        return position
+
+    def encode_cursor(self, item):
+        position = [getattr(item, key) for key in self.keys]
+        return urlsafe_b64encode(json.dumps(position, default=str).encode('utf-8')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page_results[-1])
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
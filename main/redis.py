@@ -0,0 +1,109 @@
+import hashlib
+import json
+from urllib.parse import urlencode
+
+from django.conf import settings
+from redis import Redis
+from rest_framework.utils.encoders import JSONEncoder
+
+from utils.redis import get_redis_instance
+
+
+class ResponseCache:
+    """
+    Shared cache of responses of endpoints that return the same data to every visitor.
+
+    Responses are kept per endpoint name and query params for RESPONSE_CACHE_TIMEOUT.
+    Keys of an endpoint are remembered in a set, so the endpoint is invalidated
+    without a scan when the data behind it changes, see the post_save and post_delete
+    receivers in recipe.signals and site_settings.signals and the refresh of popular
+    recipes in RecommendedRecipesService. The timeout bounds staleness
+    of what is not invalidated: denormalized counters and a response computed while
+    the data was being changed.
+
+    Requests and misses are counted per endpoint in a hash, see get_stats
+    """
+    PINNED_RECIPES = 'pinned_recipes'
+    TOP_RATED_RECIPES = 'top_rated_recipes'
+    MEAL_OF_THE_WEEK = 'meal_of_the_week'
+    HOMEPAGE_BANNERS = 'homepage_banners'
+    BLOCKS = 'blocks'
+    FAVORITE_CUISINES = 'favorite_cuisines'
+    POPULAR_RECIPES = 'popular_recipes'
+
+    NAMES = [
+        PINNED_RECIPES, TOP_RATED_RECIPES, MEAL_OF_THE_WEEK, HOMEPAGE_BANNERS,
+        BLOCKS, FAVORITE_CUISINES, POPULAR_RECIPES,
+    ]
+    # endpoints rendering recipes, invalidated by any change of a recipe
+    RECIPE_NAMES = [PINNED_RECIPES, TOP_RATED_RECIPES, MEAL_OF_THE_WEEK, FAVORITE_CUISINES, POPULAR_RECIPES]
+
+    STATS_KEY = 'response_cache:stats'
+
+    redis: Redis
+
+    def __init__(self, name):
+        self.name = name
+        self.redis = get_redis_instance()
+
+    @staticmethod
+    def _gen_keys_key(name):
+        return f'response_cache:{name}:keys'
+
+    def _gen_key(self, params: dict):
+        query = urlencode(sorted(params.items()), doseq=True)
+        return f'response_cache:{self.name}:{hashlib.md5(query.encode("utf-8")).hexdigest()}'
+
+    def get(self, params: dict):
+        """ Cached data of the response or None, the request is counted """
+        pipe = self.redis.pipeline()
+        pipe.get(self._gen_key(params))
+        pipe.hincrby(self.STATS_KEY, f'{self.name}:requests', 1)
+        value, _ = pipe.execute()
+        if value is None:
+            self.redis.hincrby(self.STATS_KEY, f'{self.name}:misses', 1)
+            return None
+        return json.loads(value)
+
+    def set(self, params: dict, data):
+        key = self._gen_key(params)
+        timeout = settings.RESPONSE_CACHE_TIMEOUT
+        pipe = self.redis.pipeline()
+        pipe.set(key, json.dumps(data, cls=JSONEncoder), ex=timeout)
+        pipe.sadd(self._gen_keys_key(self.name), key)
+        # the set outlives its keys, expired ones are deleted by the next invalidation
+        pipe.expire(self._gen_keys_key(self.name), timeout)
+        pipe.execute()
+
+    @classmethod
+    def invalidate(cls, *names):
+        """ Delete all cached responses of the endpoints """
+        redis = get_redis_instance()
+        pipe = redis.pipeline()
+        for name in names:
+            pipe.smembers(cls._gen_keys_key(name))
+            pipe.delete(cls._gen_keys_key(name))
+        results = pipe.execute()
+        keys = set().union(*results[::2])
+        if keys:
+            redis.delete(*keys)
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        """ {name: {'requests': int, 'hits': int, 'misses': int}} of all endpoints """
+        values = {
+            field.decode('utf-8'): int(value)
+            for field, value in get_redis_instance().hgetall(cls.STATS_KEY).items()
+        }
+        stats = {}
+        for name in cls.NAMES:
+            requests = values.get(f'{name}:requests', 0)
+            misses = values.get(f'{name}:misses', 0)
+            stats[name] = {'requests': requests, 'hits': requests - misses, 'misses': misses}
+        return stats
+
+    @classmethod
+    def reset(cls):
+        """ Invalidate all endpoints and reset the stats """
+        cls.invalidate(*cls.NAMES)
+        get_redis_instance().delete(cls.STATS_KEY)
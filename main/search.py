@@ -0,0 +1,30 @@
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+# stored search vectors are built with the same config by database triggers
+SEARCH_CONFIG = 'english'
+
+
+def search_ranked(queryset, text, headline_expression):
+    """
+    Filter by the stored 'search_vector' field with the web search syntax
+    ("quoted phrases", or, -excluded words) and annotate:
+
+    - search_rank, ts_rank of the weighted vector. It is cast to double precision,
+      so the value survives a round trip through a keyset pagination cursor
+    - search_headline, a snippet of headline_expression with matches wrapped in <b>
+    """
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(search_vector=query).annotate(
+        search_rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+        search_headline=SearchHeadline(
+            headline_expression,
+            query,
+            config=SEARCH_CONFIG,
+            start_sel='<b>',
+            stop_sel='</b>',
+            max_words=35,
+            min_words=15,
+        ),
+    )
@@ -38,6 +38,8 @@ EMAIL_FROM = os.environ.get('EMAIL_FROM')
 SEND_ACTIVATION_EMAIL = True
 CHECK_EMAIL_ACTIVATION = False
 
+STATS_WRITE_BEHIND = True
+
 STATIC_URL = '/static/'
 MEDIA_PATH = 'media'
 MEDIA_URL = '%s/%s/' % (BASE_URL, MEDIA_PATH)
@@ -32,6 +32,8 @@ ADMINS = [('Vlad', 'vladislav.levada@goodbit.dev')]
 SEND_ACTIVATION_EMAIL = True
 CHECK_EMAIL_ACTIVATION = False
 
+STATS_WRITE_BEHIND = True
+
 LOG_PATH = os.path.join(BASE_DIR, '../logs')
 LOGGING = {
     'version': 1,
@@ -9,3 +9,9 @@ class Round1(Func):
     """
     function = "ROUND"
     template = "%(function)s(%(expressions)s::numeric, 1)"
+
+
+class StripTags(Func):
+    """ Text of an HTML field without tags """
+    function = "REGEXP_REPLACE"
+    template = "%(function)s(%(expressions)s, '<[^>]*>', ' ', 'g')"
@@ -3,6 +3,7 @@ import random
 from rest_framework.test import APITestCase, APIClient
 
 import utils.random
+from main.redis import ResponseCache
 from users.models import User
 from utils.test import UserFactoryMixin
 from utils.vcr import VCRMixin
@@ -10,6 +11,7 @@ from users.enums import UserTypes
 
 from recipe.enums import RecipeTypes, Cuisines, Diets, CookingMethods, CookingSkills, Units
 from recipe.models import Recipe
+from recipe.redis import RecipeCandidatePool, RecipeLeaderboards, RecipeNeighboursVersion
 
 
 class BaseUserTestCase(VCRMixin, APITestCase, UserFactoryMixin):
@@ -23,6 +25,11 @@ class IsAuthClientTestCase(BaseUserTestCase):
 
     def setUp(self):
         super().setUp()
+        # shared across tests, on_commit invalidation does not run inside test transactions
+        ResponseCache.reset()
+        RecipeCandidatePool.reset()
+        RecipeLeaderboards().reset()
+        RecipeNeighboursVersion().reset()
 
         self.user = self.create_random_user(extra_fields={'is_email_active': True})
         self.client = self.create_client_with_auth(self.user)
@@ -4,6 +4,17 @@ from django.utils.translation import gettext_lazy as _
 from enum import IntEnum
 
 
+class PublishStatus(models.IntegerChoices):
+    NOT_PUBLISHED = 1, _('Not published')
+    PUBLISHED = 2, _('Published')
+
+
+class RecipeStatus(models.IntegerChoices):
+    AWAITING_ACCEPTANCE = 1, _('Awaiting acceptance')
+    ACCEPTED = 2, _('Accepted')
+    REJECTED = 3, _('Rejected')
+
+
 class Cuisines(models.IntegerChoices):
     # multi choice
     AMERICAN = 1, _('American')
@@ -177,6 +188,27 @@ UNITS_KEYS = OrderedDict([
     (("teaspoon", "teaspoons", "tsp", "tsps", "t"), Units.TEASPOON),
 ])
 
+# words dropped from ingredient titles before they are used as recommender features
+INGREDIENT_STOP_WORDS = frozenset([
+    'a',
+    'about',
+    'boneless',
+    'crushed',
+    'crusty',
+    'diced',
+    'for',
+    'good',
+    'kg',
+    'of',
+    'or',
+    'packages',
+    'segments',
+    'sweet',
+    'to',
+    'toasted',
+    *[word for keys in UNITS_KEYS for key in keys for word in key.split()],
+])
+
 
 class ThumbnailSize(IntEnum):
     WIDTH = 800
@@ -2,6 +2,7 @@ from django_filters.rest_framework.filters import CharFilter
 from django_filters.rest_framework import FilterSet
 from rest_framework.filters import OrderingFilter
 from datetime import timedelta
+from main.search import search_ranked
 from recipe.models import (
     Recipe,
     SavedRecipe
@@ -23,8 +24,16 @@ class RecipeFilterSet(FilterSet):
         model = Recipe
         fields = []
 
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.form.cleaned_data.get('title'):
+            # other filters order by id, the most relevant recipes go first
+            queryset = queryset.order_by('-search_rank', '-pk')
+        return queryset
+
     def filter_by_title(self, queryset, name, title):
-        return queryset.filter(title__search=title)
+        # weighted search_vector is kept up to date by triggers, see migration 0061
+        return search_ranked(queryset, title, 'description')
 
     def filter_by_types(self, queryset, name, types):
         if types is not None:
@@ -15,7 +15,7 @@ from pathlib import Path
 
 from users.models import User
 
-from recipe.models import Ingredient, Recipe, RecipeImage
+from recipe.models import CanonicalIngredient, Ingredient, Recipe, RecipeImage
 from recipe.enums import Cuisines, Diets, RecipeTypes, \
     Units, UNITS_KEYS
 from utils.helper import strip_links
@@ -124,13 +124,15 @@ class RecipeCreator:
                     return unit
             return Units.EMPTY
 
+        ingredients = []
         for ingredient_data in ingredients_list:
-            Ingredient.objects.create(
+            ingredients.append(Ingredient.objects.create(
                 recipe=recipe,
                 title=ingredient_data['originalName'],
                 quantity=round(ingredient_data['amount'], 3),
                 unit=_get_unit(ingredient_data['unit'])
-            )
+            ))
+        CanonicalIngredient.objects.link_ingredients(ingredients)
 
     def _get_valid_cuisines(self, cuisines_to_load: list) -> list:
         res = [v for v in Cuisines if v.label in cuisines_to_load]
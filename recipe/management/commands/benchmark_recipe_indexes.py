@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import re
+
+from django.contrib.postgres.search import SearchQuery
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F
+
+from recipe.enums import CookingMethods, Cuisines, Diets, RecipeTypes
+from recipe.models import Recipe
+from users.models import User
+
+TITLES = [
+    'Grilled Basil Chicken',
+    'Thai Curry Soup',
+    'Italian Tomato and Mozzarella Caprese',
+    'Red Lentil Curry',
+    'Banana Pancakes',
+    'Beef Stew with Potatoes',
+    'Vegan Chocolate Cake',
+    'Greek Salad',
+]
+
+
+class Command(BaseCommand):
+    help = "Seed recipes and compare EXPLAIN ANALYZE timings of the feed and filter queries " \
+           "with and without Recipe indexes. Everything is rolled back at the end"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=500000, help="Number of recipes to seed")
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError("At least one user is required to seed recipes")
+
+        with transaction.atomic():
+            self.stdout.write(f"Seeding {options['count']} recipes...")
+            self.seed(options['count'], user.pk)
+
+            with_indexes = self.run_queries()
+
+            # dropped inside the transaction, restored by the rollback
+            with connection.cursor() as cursor:
+                for index in Recipe._meta.indexes:
+                    cursor.execute(f'DROP INDEX {index.name}')
+            without_indexes = self.run_queries()
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{'query':<25}{'no indexes, ms':>18}{'indexes, ms':>18}")
+        for name in with_indexes:
+            self.stdout.write(f"{name:<25}{without_indexes[name]:>18.2f}{with_indexes[name]:>18.2f}")
+
+    def seed(self, count, user_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                '''
+                INSERT INTO recipe_recipe (
+                    title, cooking_time, description, publish_status, status,
+                    cuisines, types, cooking_methods, diet_restrictions,
+                    likes_number, views_number, user_id, is_parsed, canonical_ingredient_ids,
+                    created_at, updated_at
+                )
+                SELECT
+                    (%s::text[])[1 + gs %% %s], interval '30 minutes', 'benchmark', 1 + (gs %% 5 > 0)::int,
+                    1 + (gs %% 7 > 0)::int,
+                    ARRAY[1 + gs %% %s], ARRAY[1 + gs %% %s, 1 + (gs / 7) %% %s], ARRAY[1 + gs %% %s],
+                    ARRAY[gs %% %s], gs %% 1000, gs %% 5000, %s, false, '{}',
+                    now() - gs * interval '1 minute', now()
+                FROM generate_series(1, %s) AS gs
+                ''',
+                [
+                    TITLES, len(TITLES),
+                    len(Cuisines.values), len(RecipeTypes.values), len(RecipeTypes.values),
+                    len(CookingMethods.values), len(Diets.values), user_id, count
+                ]
+            )
+            cursor.execute('ANALYZE recipe_recipe')
+
+    def get_queries(self):
+        published = Recipe.objects.all().get_published_and_accepted()
+        return {
+            'feed by likes': published.order_by(F('likes_number').desc(nulls_last=True), '-id')[0:10],
+            'latest': published.order_by('-created_at')[0:10],
+            'deep page by id': published.order_by('-id')[10000:10010],
+            'types overlap': published.filter(types__overlap=[RecipeTypes.DINNER.value]).order_by('-id')[0:10],
+            'cuisines overlap': Recipe.objects.filter(cuisines__overlap=[Cuisines.THAI.value]).values('pk'),
+            'title search': Recipe.objects.filter(search_vector=SearchQuery('curry', config='english')).values('pk'),
+        }
+
+    def run_queries(self):
+        timings = {}
+        for name, query in self.get_queries().items():
+            plan = query.explain(analyze=True)
+            timings[name] = float(re.search(r'Execution Time: ([\d.]+) ms', plan).group(1))
+        return timings
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q
+
+from recipe.management.commands.benchmark_recipe_indexes import Command as RecipeIndexesBenchmark
+from recipe.models import CanonicalIngredient, Ingredient, Recipe
+from recipe.services import RecipesByIngredientsService
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Seed recipes with ingredients and compare latency of the search by ingredients " \
+           "over the inverted index with icontains scans of ingredient titles. " \
+           "Everything is rolled back at the end"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=100000, help="Number of recipes to seed")
+        parser.add_argument("--ingredients", type=int, default=2000, help="Number of canonical ingredients")
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError("At least one user is required to seed recipes")
+
+        with transaction.atomic():
+            self.stdout.write(f"Seeding {options['count']} recipes, {options['ingredients']} ingredients...")
+            first_recipe_id = (Recipe.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+            RecipeIndexesBenchmark().seed(options['count'], user.pk)
+            titles = self.seed_ingredients(options['ingredients'], first_recipe_id)
+
+            started = time.perf_counter()
+            CanonicalIngredient.objects.rebuild_index()
+            self.stdout.write(f"Index built in {time.perf_counter() - started:.2f} s")
+
+            # the first titles are the most common ingredients
+            queries = {
+                '1 common': titles[:1],
+                '3 common': titles[:3],
+                '3 rare': titles[-3:],
+                '8 mixed': titles[:4] + titles[len(titles) // 2:len(titles) // 2 + 4],
+            }
+            self.stdout.write(f"{'ingredients':<15}{'recipes':>10}{'icontains, ms':>18}{'index, ms':>14}")
+            for name, query in queries.items():
+                found, index_ms = self.measure(lambda: self.search_by_index(query), options['repeat'])
+                _, scan_ms = self.measure(lambda: self.search_by_titles(query), options['repeat'])
+                self.stdout.write(f"{name:<15}{found:>10}{scan_ms:>18.2f}{index_ms:>14.2f}")
+
+            recipe_id = Recipe.objects.all().get_published_and_accepted() \
+                .filter(pk__gte=first_recipe_id).values_list('pk', flat=True).first()
+            _, update_ms = self.measure(lambda: self.reindex_recipe(recipe_id), options['repeat'])
+            self.stdout.write(f"Unindex and index one recipe: {update_ms:.2f} ms")
+
+            transaction.set_rollback(True)
+
+    def seed_ingredients(self, count, first_recipe_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                '''
+                INSERT INTO recipe_canonicalingredient (title, recipe_ids, created_at)
+                SELECT 'ingredient ' || translate(gs::text, '0123456789', 'abcdefghij'), '{}', now()
+                FROM generate_series(1, %s) AS gs
+                RETURNING id, title
+                ''',
+                [count]
+            )
+            canonical = sorted(cursor.fetchall())
+            cursor.execute('SELECT setseed(0.5)')
+            # 4-11 ingredients per recipe, skewed to the first (common) ones
+            cursor.execute(
+                '''
+                INSERT INTO recipe_ingredient (title, normalized_title, canonical_id, quantity, unit, recipe_id, created_at)
+                SELECT canonical.title, canonical.title, canonical.id, 1, '', picks.recipe_id, now()
+                FROM (
+                    SELECT recipe_recipe.id AS recipe_id, %s + floor(%s * power(random(), 3))::int AS canonical_id
+                    FROM recipe_recipe, generate_series(1, 4 + recipe_recipe.id %% 8)
+                    WHERE recipe_recipe.id >= %s
+                ) AS picks
+                JOIN recipe_canonicalingredient AS canonical ON canonical.id = picks.canonical_id
+                ''',
+                [canonical[0][0], count, first_recipe_id]
+            )
+            cursor.execute('ANALYZE recipe_recipe')
+            cursor.execute('ANALYZE recipe_ingredient')
+        return [title for _, title in canonical]
+
+    def search_by_index(self, titles):
+        """ The number of found recipes and the first page, as the endpoint reads them """
+        results = RecipesByIngredientsService().search(titles)
+        results[:10]
+        return results.count()
+
+    def search_by_titles(self, titles):
+        """ A comparable query without the index: icontains scans of ingredient titles """
+        query = Q()
+        for title in titles:
+            query |= Q(title__icontains=title)
+        return list(
+            Ingredient.objects
+            .filter(query, recipe__publish_status=Recipe.PublishStatus.PUBLISHED, recipe__status=Recipe.Status.ACCEPTED)
+            .values('recipe_id')
+            .annotate(
+                matched=Count('canonical_id', distinct=True),
+                required=Count('recipe__ingredients__canonical_id', distinct=True)
+            )
+            .order_by('-matched', '-recipe_id')
+        )
+
+    def reindex_recipe(self, recipe_id):
+        # unindexed first, so that every run rewrites the postings
+        Recipe.objects.filter(pk=recipe_id).update(status=Recipe.Status.REJECTED)
+        CanonicalIngredient.objects.index_recipes([recipe_id])
+        Recipe.objects.filter(pk=recipe_id).update(status=Recipe.Status.ACCEPTED)
+        CanonicalIngredient.objects.index_recipes([recipe_id])
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return result, statistics.median(timings)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from recipe.services import RecipeNeighboursIndex, RecommendedRecipesService
+
+
+def score_users(users_activity):
+    """ Work of one update_users_recommendations subtask without the database reads and writes """
+    index = RecipeNeighboursIndex.load()
+    rs = RecommendedRecipesService()
+    neighbours = index.get(set().union(*users_activity))
+    for activity_ids in users_activity:
+        rs.get_recommended(activity_ids, neighbours=neighbours)
+    return len(users_activity)
+
+
+class Command(BaseCommand):
+    help = "Measure users/sec of recommendations scoring over the memory-mapped neighbours index " \
+           "split between different numbers of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100000, help="Number of simulated users")
+        parser.add_argument("--activity", type=int, default=6, help="Activity recipes per user")
+        parser.add_argument("--workers", type=int, nargs='+', default=[1, 2, 4], help="Numbers of processes to compare")
+
+    def handle(self, *args, **options):
+        index = RecipeNeighboursIndex.load()
+        if index is None or len(index.recipe_ids) == 0:
+            raise CommandError("Neighbours index is empty, run recipe.tasks.calculate_recipe_neighbours first")
+
+        rng = np.random.default_rng(0)
+        activity = rng.choice(index.recipe_ids, size=(options['users'], options['activity'])).tolist()
+        chunk_size = settings.RECOMMENDATIONS_USERS_CHUNK_SIZE
+        chunks = [activity[i:i + chunk_size] for i in range(0, len(activity), chunk_size)]
+
+        # forked processes must not share the database connection
+        connections.close_all()
+
+        self.stdout.write(f"{len(index.recipe_ids)} recipes in the index, {len(chunks)} chunks of {chunk_size} users")
+        self.stdout.write(f"{'workers':>8}{'seconds':>12}{'users/sec':>12}")
+        for workers in options['workers']:
+            started_at = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                count = sum(executor.map(score_users, chunks))
+            elapsed = time.perf_counter() - started_at
+            self.stdout.write(f"{workers:>8}{elapsed:>12.2f}{count / elapsed:>12.0f}")
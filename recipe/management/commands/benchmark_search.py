@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from chef_pencils.models import ChefPencilRecord
+from main.search import search_ranked
+from main.utils.db import StripTags
+from recipe.models import Recipe
+from users.models import User
+
+WORDS = [
+    'chicken', 'beef', 'pork', 'salmon', 'shrimp', 'tofu', 'lentil', 'chickpea', 'rice', 'noodles',
+    'pasta', 'potato', 'tomato', 'onion', 'garlic', 'ginger', 'basil', 'coriander', 'lemon', 'lime',
+    'coconut', 'curry', 'soup', 'stew', 'salad', 'roasted', 'grilled', 'baked', 'fried', 'spicy',
+    'sweet', 'sour', 'creamy', 'crispy', 'green', 'red', 'thai', 'italian', 'greek', 'mexican',
+    'chocolate', 'banana', 'honey', 'butter', 'cheese', 'mozzarella', 'spinach', 'mushroom', 'pepper',
+    'carrot', 'simmer', 'whisk', 'stir', 'serve', 'minutes', 'oven', 'pan', 'bowl', 'fresh', 'slowly',
+]
+
+QUERIES = ['curry', 'spicy coconut soup', '"green curry" -beef', 'mozzarella or tofu']
+
+
+class Command(BaseCommand):
+    help = "Seed a search corpus of recipes with ingredients and chef's pencil records, and compare " \
+           "EXPLAIN ANALYZE timings of the former on the fly search with the stored ranked search. " \
+           "Everything is rolled back at the end"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=100000, help="Number of recipes to seed")
+        parser.add_argument("--records", type=int, default=10000, help="Number of chef's pencil records to seed")
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError("At least one user is required to seed the corpus")
+
+        with transaction.atomic():
+            self.stdout.write(f"Seeding {options['count']} recipes and {options['records']} records...")
+            self.seed(options['count'], options['records'], user.pk)
+
+            self.stdout.write(f"{'query':<45}{'on the fly, ms':>18}{'stored, ms':>14}")
+            for text in QUERIES:
+                published = Recipe.objects.all().get_published_and_accepted()
+                self.write_timings(
+                    f'recipes: {text}',
+                    published.filter(title__search=text).order_by('-id')[0:10],
+                    search_ranked(published, text, 'description').order_by('-search_rank', '-pk')[0:10],
+                )
+                records = ChefPencilRecord.objects.all().get_approved()
+                self.write_timings(
+                    f'records: {text}',
+                    records.filter(Q(title__search=text) | Q(html_content__search=text)).order_by('-created_at')[0:10],
+                    search_ranked(records, text, StripTags('html_content')).order_by('-search_rank', '-pk')[0:10],
+                )
+
+            transaction.set_rollback(True)
+
+    def seed(self, count, records, user_id):
+        # random words of the corpus. "gs" makes the subquery correlated, so it is evaluated per row,
+        # and "n" keeps string_agg an aggregate of the subquery
+        words = 'words[1 + floor(random() * array_length(words, 1))::int]'
+        sentence = f"(SELECT string_agg({words} || left(n::text, 0), ' ') FROM generate_series(1, %s + gs * 0) AS n)"
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT setseed(0.5)')
+            cursor.execute(
+                f'''
+                INSERT INTO recipe_recipe (
+                    title, cooking_time, description, publish_status, status,
+                    likes_number, views_number, user_id, is_parsed, canonical_ingredient_ids,
+                    created_at, updated_at
+                )
+                SELECT
+                    initcap({sentence}), interval '30 minutes', {sentence}, 2, 2,
+                    gs %% 1000, gs %% 5000, %s, false, '{{}}', now(), now()
+                FROM generate_series(1, %s) AS gs, (SELECT %s::text[] AS words) AS corpus
+                RETURNING id
+                ''',
+                [3, 40, user_id, count, WORDS]
+            )
+            recipe_ids = [row[0] for row in cursor.fetchall()]
+            # a single statement, so the search vectors are refreshed once by the ingredients trigger
+            cursor.execute(
+                f'''
+                INSERT INTO recipe_ingredient (title, normalized_title, quantity, unit, recipe_id, created_at)
+                SELECT {words}, {words}, 1, '', recipe_id, now()
+                FROM unnest(%s::bigint[]) AS recipe_id, generate_series(1, 6) AS gs,
+                    (SELECT %s::text[] AS words) AS corpus
+                ''',
+                [recipe_ids, WORDS]
+            )
+            cursor.execute(
+                f'''
+                INSERT INTO chef_pencils_chefpencilrecord (
+                    title, user_id, html_content, status, rejection_reason, likes_number, views_number,
+                    created_at, updated_at
+                )
+                SELECT
+                    initcap({sentence}), %s, '<p>' || {sentence} || '</p><p><b>' || {sentence} || '</b></p>',
+                    2, '', 0, 0, now(), now()
+                FROM generate_series(1, %s) AS gs, (SELECT %s::text[] AS words) AS corpus
+                ''',
+                [5, user_id, 300, 300, records, WORDS]
+            )
+            cursor.execute('ANALYZE recipe_recipe')
+            cursor.execute('ANALYZE chef_pencils_chefpencilrecord')
+
+    def write_timings(self, name, on_the_fly, stored):
+        timings = []
+        for query in [on_the_fly, stored]:
+            plan = query.explain(analyze=True)
+            timings.append(float(re.search(r'Execution Time: ([\d.]+) ms', plan).group(1)))
+        self.stdout.write(f"{name:<45}{timings[0]:>18.2f}{timings[1]:>14.2f}")
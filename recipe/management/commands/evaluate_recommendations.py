@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.services import RecipeNeighboursIndex, RecommendedRecipesService
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Offline comparison of recommendation models: the latest interacted recipe of every user " \
+           "is held out and recall@k shows how often it is recommended from the rest of the history"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--k", type=int, default=settings.RECOMMENDATIONS_COUNT, help="Number of recommendations")
+        parser.add_argument("--min-recipes", type=int, default=2,
+                            help="Users with fewer distinct interacted recipes are skipped")
+
+    def handle(self, *args, **options):
+        rs = RecommendedRecipesService()
+        index = RecipeNeighboursIndex.load() or RecipeNeighboursIndex.from_table()
+        if len(index.recipe_ids) == 0:
+            raise CommandError("Neighbours index is empty, run recipe.tasks.calculate_recipe_neighbours first")
+
+        users_interactions = defaultdict(list)
+        for interaction in rs.get_interactions(User.objects.all()):
+            users_interactions[interaction[0]].append(interaction)
+
+        held_out = {}
+        train = []
+        for user_id, interactions in users_interactions.items():
+            if len({recipe_id for _, recipe_id, *_ in interactions}) < options['min_recipes']:
+                continue
+            held_out[user_id] = max(interactions, key=lambda i: i[4])[1]
+            train += [i for i in interactions if i[1] != held_out[user_id]]
+
+        if not held_out:
+            raise CommandError("No users with enough interactions to evaluate")
+
+        models = {
+            rs.ACTIVITY_MODEL: lambda: self.recommend_by_activity(rs, train, index, options['k']),
+            rs.INTERACTIONS_MODEL: lambda: rs.get_recommended_by_interactions(train, index, count=options['k']),
+        }
+
+        self.stdout.write(f"{len(held_out)} users, {len(train)} training interactions, k={options['k']}")
+        self.stdout.write(f"{'model':<15}{'recall@k':>10}{'seconds':>10}")
+        for name, recommend in models.items():
+            started_at = time.perf_counter()
+            recommended = recommend()
+            elapsed = time.perf_counter() - started_at
+
+            hits = sum(recipe_id in recommended.get(user_id, []) for user_id, recipe_id in held_out.items())
+            self.stdout.write(f"{name:<15}{hits / len(held_out):>10.3f}{elapsed:>10.2f}")
+
+    def recommend_by_activity(self, rs, interactions, index, k):
+        """ Same input as RecommendedRecipesService.get_users_activity: the latest views and likes """
+        users_activity = defaultdict(list)
+        for kind in [rs.VIEW, rs.LIKE]:
+            latest = defaultdict(list)
+            for user_id, recipe_id, interaction_kind, _, created_at in interactions:
+                if interaction_kind == kind:
+                    latest[user_id].append((created_at, recipe_id))
+            for user_id, records in latest.items():
+                for _, recipe_id in sorted(records, reverse=True)[:rs.ACTIVITY_RECIPES]:
+                    if recipe_id not in users_activity[user_id]:
+                        users_activity[user_id].append(recipe_id)
+
+        neighbours = index.get(set().union(*users_activity.values()))
+        return {
+            user_id: rs.get_recommended(activity_ids, neighbours=neighbours, count=k)
+            for user_id, activity_ids in users_activity.items()
+        }
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from recipe.models import CanonicalIngredient, Ingredient, normalize_ingredient_title
+
+
+class Command(BaseCommand):
+    help = "Link ingredients to canonical ingredients by their normalized titles " \
+           "and index their recipes for the search by ingredients"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="Normalize titles again and relink already linked ingredients")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        ingredients = Ingredient.objects.only('pk', 'title', 'normalized_title', 'canonical', 'recipe').order_by('pk')
+        if not options['all']:
+            ingredients = ingredients.filter(canonical__isnull=True)
+
+        last_pk = 0
+        linked = 0
+        while True:
+            batch = list(ingredients.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            if options['all']:
+                for ingredient in batch:
+                    ingredient.normalized_title = normalize_ingredient_title(ingredient.title)
+                Ingredient.objects.bulk_update(batch, ['normalized_title'])
+
+            CanonicalIngredient.objects.link_ingredients(batch)
+            linked += sum(1 for ingredient in batch if ingredient.canonical_id)
+
+        self.stdout.write(f"{linked} ingredients linked, {CanonicalIngredient.objects.count()} canonical ingredients")
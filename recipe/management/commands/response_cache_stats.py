@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from main.redis import ResponseCache
+
+
+class Command(BaseCommand):
+    help = "Show requests, hits and misses of the shared response cache of homepage endpoints"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Invalidate all endpoints and reset the counters")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'endpoint':<22}{'requests':>10}{'hits':>10}{'misses':>10}{'hit ratio':>12}")
+        for name, stats in ResponseCache.get_stats().items():
+            ratio = stats['hits'] / stats['requests'] if stats['requests'] else 0
+            self.stdout.write(
+                f"{name:<22}{stats['requests']:>10}{stats['hits']:>10}{stats['misses']:>10}{ratio:>12.1%}"
+            )
+        if options['reset']:
+            ResponseCache.reset()
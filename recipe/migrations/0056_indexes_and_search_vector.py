@@ -0,0 +1,66 @@
+# Generated by Django 3.2.4 on 2026-10-18 01:05
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.expressions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0055_recipeimage_order_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            sql='''
+                CREATE TRIGGER recipe_search_vector_update
+                BEFORE INSERT OR UPDATE OF title ON recipe_recipe
+                FOR EACH ROW EXECUTE PROCEDURE
+                tsvector_update_trigger(search_vector, 'pg_catalog.english', title);
+
+                UPDATE recipe_recipe SET search_vector = to_tsvector('pg_catalog.english', coalesce(title, ''));
+            ''',
+            reverse_sql='''
+                DROP TRIGGER IF EXISTS recipe_search_vector_update ON recipe_recipe;
+            ''',
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['types'], name='recipe_types_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['cuisines'], name='recipe_cuisines_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['diet_restrictions'], name='recipe_diets_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['cooking_methods'], name='recipe_cooking_methods_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(django.db.models.expressions.OrderBy(django.db.models.expressions.F('likes_number'), descending=True, nulls_last=True), django.db.models.expressions.OrderBy(django.db.models.expressions.F('id'), descending=True), condition=models.Q(('publish_status', 2), ('status', 2)), name='recipe_published_likes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('publish_status', 2), ('status', 2)), fields=['-created_at'], name='recipe_published_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('publish_status', 2), ('status', 2)), fields=['-id'], name='recipe_published_id_idx'),
+        ),
+    ]
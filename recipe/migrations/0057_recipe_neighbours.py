@@ -0,0 +1,24 @@
+# Generated by Django 3.2.4 on 2026-10-18 01:09
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0056_indexes_and_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeNeighbours',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='neighbours', serialize=False, to='recipe.recipe')),
+                ('neighbour_ids', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None)),
+                ('scores', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), default=list, size=None)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 3.2.4 on 2026-10-18 01:34
+
+import re
+
+from django.db import migrations, models
+
+# a frozen copy of recipe.models.normalize_ingredient_title as of this migration,
+# so later changes of the function do not change how the migration replays
+INGREDIENT_NOTES_RE = re.compile(r'\([^)]*\)?|,.*$')
+INGREDIENT_QUANTITY_RE = re.compile(r'[\d¼½¾⅓⅔⅛]\S*')
+INGREDIENT_WORD_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+INGREDIENT_STOP_WORDS = frozenset([
+    'a', 'about', 'bag', 'bags', 'boneless', 'box', 'boxes', 'bunch', 'bunches', 'c', 'can', 'cans',
+    'clove', 'cloves', 'crushed', 'crusty', 'cup', 'cups', 'dash', 'dashes', 'diced', 'for', 'g',
+    'good', 'gr', 'gram', 'grams', 'inch', 'inches', 'kg', 'large', 'lb', 'lbs', 'liter', 'liters',
+    'milliliters', 'ml', 'of', 'or', 'ounce', 'ounces', 'oz', 'packages', 'piece', 'pieces', 'pound',
+    'pounds', 'segments', 'serving', 'servings', 'sheet', 'sheets', 'slice', 'slices', 'sprig',
+    'sprigs', 'stalk', 'stalks', 'sweet', 't', 'tablespoon', 'tablespoons', 'tb', 'tbs', 'tbsp',
+    'teaspoon', 'teaspoons', 'to', 'toasted', 'tsp', 'tsps',
+])
+
+
+def normalize_ingredient_title(title):
+    title = INGREDIENT_NOTES_RE.sub(' ', title.lower())
+    title = INGREDIENT_QUANTITY_RE.sub(' ', title)
+    return ' '.join(
+        word for word in INGREDIENT_WORD_RE.findall(title)
+        if word not in INGREDIENT_STOP_WORDS
+    )
+
+
+def forwards_func(apps, schema_editor):
+    """
+    Fill normalized titles of existing ingredients
+    """
+
+    Ingredient = apps.get_model("recipe", "Ingredient")
+    db_alias = schema_editor.connection.alias
+
+    batch = []
+    for ingredient in Ingredient.objects.using(db_alias).only('pk', 'title').iterator(chunk_size=2000):
+        ingredient.normalized_title = normalize_ingredient_title(ingredient.title)
+        batch.append(ingredient)
+        if len(batch) == 2000:
+            Ingredient.objects.using(db_alias).bulk_update(batch, ['normalized_title'])
+            batch = []
+    Ingredient.objects.using(db_alias).bulk_update(batch, ['normalized_title'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0057_recipe_neighbours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='normalized_title',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.4 on 2026-10-18 01:37
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0058_ingredient_normalized_title'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name='CanonicalIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255, unique=True, verbose_name='Title')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='canonicalingredient',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='canonical_title_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='canonical',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingredients', to='recipe.canonicalingredient'),
+        ),
+    ]
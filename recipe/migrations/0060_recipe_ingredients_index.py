@@ -0,0 +1,43 @@
+# Generated by Django 3.2.4 on 2026-10-18 01:43
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0059_canonical_ingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='canonicalingredient',
+            name='recipe_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='canonical_ingredient_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.RunSQL(
+            sql='''
+                UPDATE recipe_recipe SET canonical_ingredient_ids = ARRAY(
+                    SELECT DISTINCT canonical_id FROM recipe_ingredient
+                    WHERE recipe_id = recipe_recipe.id AND canonical_id IS NOT NULL
+                    ORDER BY 1
+                )
+                WHERE publish_status = 2 AND status = 2;
+
+                UPDATE recipe_canonicalingredient SET recipe_ids = postings.recipe_ids
+                FROM (
+                    SELECT canonical_id, array_agg(recipe_recipe.id ORDER BY recipe_recipe.id) AS recipe_ids
+                    FROM recipe_recipe, unnest(canonical_ingredient_ids) AS canonical_id
+                    GROUP BY canonical_id
+                ) AS postings
+                WHERE recipe_canonicalingredient.id = postings.canonical_id;
+            ''',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,104 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0060_recipe_ingredients_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='''
+                CREATE FUNCTION recipe_search_vector(recipe_id bigint, title text, description text)
+                RETURNS tsvector AS $$
+                    SELECT
+                        setweight(to_tsvector('pg_catalog.english', coalesce(title, '')), 'A') ||
+                        setweight(to_tsvector('pg_catalog.english', coalesce(description, '') || ' ' || coalesce((
+                            SELECT string_agg(recipe_tag.text, ' ')
+                            FROM recipe_tagreciperelation
+                            JOIN recipe_tag ON recipe_tag.id = recipe_tagreciperelation.tag_id
+                            WHERE recipe_tagreciperelation.recipe_id = $1
+                        ), '')), 'B') ||
+                        setweight(to_tsvector('pg_catalog.english', coalesce((
+                            SELECT string_agg(recipe_ingredient.normalized_title, ' ')
+                            FROM recipe_ingredient
+                            WHERE recipe_ingredient.recipe_id = $1
+                        ), '')), 'C')
+                $$ LANGUAGE SQL STABLE;
+
+                CREATE FUNCTION recipe_search_vector_trigger() RETURNS trigger AS $$
+                BEGIN
+                    NEW.search_vector := recipe_search_vector(NEW.id, NEW.title, NEW.description);
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql;
+
+                -- statement level, changed_rows is the transition table of the trigger
+                CREATE FUNCTION recipe_search_vector_refresh() RETURNS trigger AS $$
+                BEGIN
+                    UPDATE recipe_recipe SET search_vector = recipe_search_vector(id, title, description)
+                    WHERE id IN (SELECT DISTINCT recipe_id FROM changed_rows);
+                    RETURN NULL;
+                END
+                $$ LANGUAGE plpgsql;
+
+                CREATE FUNCTION recipe_search_vector_refresh_row() RETURNS trigger AS $$
+                BEGIN
+                    UPDATE recipe_recipe SET search_vector = recipe_search_vector(id, title, description)
+                    WHERE id IN (OLD.recipe_id, NEW.recipe_id);
+                    RETURN NULL;
+                END
+                $$ LANGUAGE plpgsql;
+
+                DROP TRIGGER recipe_search_vector_update ON recipe_recipe;
+                CREATE TRIGGER recipe_search_vector_update
+                BEFORE INSERT OR UPDATE OF title, description ON recipe_recipe
+                FOR EACH ROW EXECUTE PROCEDURE recipe_search_vector_trigger();
+
+                CREATE TRIGGER recipe_ingredient_search_insert
+                AFTER INSERT ON recipe_ingredient REFERENCING NEW TABLE AS changed_rows
+                FOR EACH STATEMENT EXECUTE PROCEDURE recipe_search_vector_refresh();
+                CREATE TRIGGER recipe_ingredient_search_delete
+                AFTER DELETE ON recipe_ingredient REFERENCING OLD TABLE AS changed_rows
+                FOR EACH STATEMENT EXECUTE PROCEDURE recipe_search_vector_refresh();
+                -- linking to canonical ingredients updates rows too, only title changes matter
+                CREATE TRIGGER recipe_ingredient_search_update
+                AFTER UPDATE OF normalized_title, recipe_id ON recipe_ingredient
+                FOR EACH ROW WHEN (
+                    OLD.normalized_title IS DISTINCT FROM NEW.normalized_title
+                    OR OLD.recipe_id IS DISTINCT FROM NEW.recipe_id
+                )
+                EXECUTE PROCEDURE recipe_search_vector_refresh_row();
+
+                CREATE TRIGGER recipe_tag_search_insert
+                AFTER INSERT ON recipe_tagreciperelation REFERENCING NEW TABLE AS changed_rows
+                FOR EACH STATEMENT EXECUTE PROCEDURE recipe_search_vector_refresh();
+                CREATE TRIGGER recipe_tag_search_delete
+                AFTER DELETE ON recipe_tagreciperelation REFERENCING OLD TABLE AS changed_rows
+                FOR EACH STATEMENT EXECUTE PROCEDURE recipe_search_vector_refresh();
+
+                UPDATE recipe_recipe SET search_vector = recipe_search_vector(id, title, description);
+            ''',
+            reverse_sql='''
+                DROP TRIGGER recipe_tag_search_delete ON recipe_tagreciperelation;
+                DROP TRIGGER recipe_tag_search_insert ON recipe_tagreciperelation;
+                DROP TRIGGER recipe_ingredient_search_update ON recipe_ingredient;
+                DROP TRIGGER recipe_ingredient_search_delete ON recipe_ingredient;
+                DROP TRIGGER recipe_ingredient_search_insert ON recipe_ingredient;
+
+                DROP TRIGGER recipe_search_vector_update ON recipe_recipe;
+                CREATE TRIGGER recipe_search_vector_update
+                BEFORE INSERT OR UPDATE OF title ON recipe_recipe
+                FOR EACH ROW EXECUTE PROCEDURE
+                tsvector_update_trigger(search_vector, 'pg_catalog.english', title);
+
+                DROP FUNCTION recipe_search_vector_refresh_row();
+                DROP FUNCTION recipe_search_vector_refresh();
+                DROP FUNCTION recipe_search_vector_trigger();
+                DROP FUNCTION recipe_search_vector(bigint, text, text);
+
+                UPDATE recipe_recipe SET search_vector = to_tsvector('pg_catalog.english', coalesce(title, ''));
+            ''',
+        ),
+    ]
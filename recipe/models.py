@@ -1,8 +1,13 @@
-from django.conf import settings
+import re
+from collections import defaultdict
+
 from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField, TrigramSimilarity
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 from main.mixins import UpdatedFieldsMixin
@@ -10,14 +15,16 @@ from main.validators import (validate_decimals, validate_images_file_max_size,
                              validate_video_ext, validate_video_file_max_size)
 from social.models import Comment, Like, Rating
 from stats.models import StatRecord
-from users.models import User
+from users.models import EatChefsAccount
 from utils.file_storage import (recipe_image_file_path,
                                 recipe_new_image_file_path,
                                 recipe_thumbnail_file_path,
                                 recipe_video_file_path)
 
-from recipe.enums import (CookingMethods, CookingSkills, Cuisines, Diets,
-                          RecipeTypes, Units)
+from recipe.enums import (INGREDIENT_STOP_WORDS, CookingMethods,
+                          CookingSkills, Cuisines, Diets, PublishStatus,
+                          RecipeStatus, RecipeTypes, Units)
+from recipe.redis import RecipeLeaderboards
 
 
 class RecipeQuerySet(models.QuerySet):
@@ -26,22 +33,17 @@ class RecipeQuerySet(models.QuerySet):
         return self.filter(publish_status=Recipe.PublishStatus.PUBLISHED)
 
     def get_published_and_accepted(self):
-        return self.filter(
-            publish_status=Recipe.PublishStatus.PUBLISHED,
-            status=Recipe.Status.ACCEPTED
-        )
+        return self.filter(PUBLISHED_AND_ACCEPTED)
+
+    def with_details(self):
+        """ Load all relations rendered by RecipeSerializer """
+        return self.select_related('user', 'video') \
+            .prefetch_related('images', 'steps', 'ingredients')
 
     def get_filtered_by_source(self, only_eatchefs_recipes):
-        try:
-            user = User.objects.get(
-                full_name=settings.EATCHEFS_ACCOUNT_NAME,
-                is_staff=True
-            )
-        except User.DoesNotExist:
-            pass
-        else:
-            if only_eatchefs_recipes is not None:
-                return self.filter(user=user)
+        account_id = EatChefsAccount.get_id()
+        if account_id is not None and only_eatchefs_recipes is not None:
+            return self.filter(user_id=account_id)
         return self
 
 
@@ -51,16 +53,14 @@ class RecipeManager(models.Manager):
         return RecipeQuerySet(self.model, using=self._db)
 
 
-class Recipe(UpdatedFieldsMixin, models.Model):
+# condition of RecipeQuerySet.get_published_and_accepted and of the partial indexes
+PUBLISHED_AND_ACCEPTED = models.Q(publish_status=PublishStatus.PUBLISHED, status=RecipeStatus.ACCEPTED)
+
 
-    class PublishStatus(models.IntegerChoices):
-        NOT_PUBLISHED = 1, _('Not published')
-        PUBLISHED = 2, _('Published')
+class Recipe(UpdatedFieldsMixin, models.Model):
 
-    class Status(models.IntegerChoices):
-        AWAITING_ACCEPTANCE = 1, _('Awaiting acceptance')
-        ACCEPTED = 2, _('Accepted')
-        REJECTED = 3, _('Rejected')
+    PublishStatus = PublishStatus
+    Status = RecipeStatus
 
     title = models.CharField('title', max_length=255)
     cooking_time = models.DurationField('cooking time')
@@ -169,6 +169,12 @@ class Recipe(UpdatedFieldsMixin, models.Model):
         default=''
     )
 
+    # weighted title, description with tags and ingredients, kept up to date by triggers, see migration 0061
+    search_vector = SearchVectorField(null=True, editable=False)
+    # sorted canonical ingredients the recipe is listed under in CanonicalIngredient.recipe_ids,
+    # empty unless published and accepted
+    canonical_ingredient_ids = ArrayField(models.IntegerField(), default=list, blank=True, editable=False)
+
     # import-related fields
     source_id = models.PositiveIntegerField(unique=True, null=True, blank=True)
     source_url = models.URLField(unique=True, null=True, blank=True)
@@ -188,12 +194,41 @@ class Recipe(UpdatedFieldsMixin, models.Model):
     class Meta:
         verbose_name = 'Recipe'
         verbose_name_plural = 'Recipes'
+        indexes = [
+            GinIndex(fields=['types'], name='recipe_types_gin'),
+            GinIndex(fields=['cuisines'], name='recipe_cuisines_gin'),
+            GinIndex(fields=['diet_restrictions'], name='recipe_diets_gin'),
+            GinIndex(fields=['cooking_methods'], name='recipe_cooking_methods_gin'),
+            GinIndex(fields=['search_vector'], name='recipe_search_vector_gin'),
+            # feeds of published and accepted recipes
+            models.Index(
+                F('likes_number').desc(nulls_last=True), F('id').desc(),
+                name='recipe_published_likes_idx',
+                condition=PUBLISHED_AND_ACCEPTED
+            ),
+            models.Index(
+                fields=['-created_at'],
+                name='recipe_published_created_idx',
+                condition=PUBLISHED_AND_ACCEPTED
+            ),
+            models.Index(
+                fields=['-id'],
+                name='recipe_published_id_idx',
+                condition=PUBLISHED_AND_ACCEPTED
+            ),
+        ]
 
     def __str__(self):
         rating = self.avg_rating if self.avg_rating else '-'
         likes = self.likes_number if self.likes_number else '-'
         return f'#{self.pk} - {self.title[0:50]} (by {self.user}) rating: {rating}, likes: {likes}'
 
+    def get_leaderboard_entry(self):
+        """ (pk, likes_number, facet values) of RecipeLeaderboards, published recipes are ranked """
+        if self.publish_status != Recipe.PublishStatus.PUBLISHED:
+            return self.pk, self.likes_number, None
+        return self.pk, self.likes_number, {facet: getattr(self, facet) for facet in RecipeLeaderboards.FACETS}
+
     @property
     def video_url(self):
         if self.video:
@@ -274,9 +309,183 @@ class RecipeVideo(models.Model):
         return f'#{self.pk} by User: {self.user} File: {self.video} [{self.created_at}]'
 
 
+INGREDIENT_NOTES_RE = re.compile(r'\([^)]*\)?|,.*$')
+INGREDIENT_QUANTITY_RE = re.compile(r'[\d¼½¾⅓⅔⅛]\S*')
+INGREDIENT_WORD_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+
+
+def normalize_ingredient_title(title: str) -> str:
+    """
+    '2 1/2 cups boneless chicken breast (skinless), diced' -> 'chicken breast'
+    """
+    title = INGREDIENT_NOTES_RE.sub(' ', title.lower())
+    title = INGREDIENT_QUANTITY_RE.sub(' ', title)
+    return ' '.join(
+        word for word in INGREDIENT_WORD_RE.findall(title)
+        if word not in INGREDIENT_STOP_WORDS
+    )
+
+
+class CanonicalIngredientManager(models.Manager):
+
+    def link_ingredients(self, ingredients):
+        """
+        Link saved ingredients to canonical ingredients by their normalized titles,
+        creating missing ones, with three queries for any number of ingredients.
+        Recipes of the ingredients are indexed again once the transaction is committed
+        """
+        recipe_ids = {i.recipe_id for i in ingredients}
+        # titles without words (e.g. '1 tsp') have no canonical ingredient
+        unlinked = [i for i in ingredients if not i.normalized_title and i.canonical_id is not None]
+        for ingredient in unlinked:
+            ingredient.canonical_id = None
+        for ingredient in ingredients:
+            ingredient._linked_title = ingredient.normalized_title
+        ingredients = [i for i in ingredients if i.normalized_title]
+        titles = {i.normalized_title for i in ingredients}
+
+        if titles:
+            self.bulk_create([self.model(title=title) for title in titles], ignore_conflicts=True)
+            ids = dict(self.filter(title__in=titles).values_list('title', 'pk'))
+            for ingredient in ingredients:
+                ingredient.canonical_id = ids[ingredient.normalized_title]
+        if ingredients or unlinked:
+            Ingredient.objects.bulk_update(ingredients + unlinked, ['canonical'], batch_size=1000)
+        # postings of common ingredients are shared by many recipes, so their rows
+        # are not locked for the rest of the transaction saving the recipe
+        transaction.on_commit(lambda: self.index_recipes(recipe_ids))
+
+    def index_recipes(self, recipe_ids):
+        """
+        Bring the inverted index (CanonicalIngredient.recipe_ids) up to date for the recipes:
+        published and accepted recipes are listed under their canonical ingredients,
+        other recipes are removed from it. Only the changed postings are rewritten
+        """
+        if not recipe_ids:
+            return
+        recipes = Recipe.objects.filter(pk__in=recipe_ids)
+        indexed = dict(recipes.values_list('pk', 'canonical_ingredient_ids'))
+        published = recipes.get_published_and_accepted().values_list('pk', flat=True)
+
+        current = defaultdict(set)
+        for recipe_id, canonical_id in Ingredient.objects \
+                .filter(recipe_id__in=published, canonical__isnull=False) \
+                .values_list('recipe_id', 'canonical_id'):
+            current[recipe_id].add(canonical_id)
+
+        added, removed, changed = [], [], []
+        for recipe_id, old_ids in indexed.items():
+            old_ids, new_ids = set(old_ids), current[recipe_id]
+            if old_ids == new_ids:
+                continue
+            added += [(recipe_id, canonical_id) for canonical_id in new_ids - old_ids]
+            removed += [(recipe_id, canonical_id) for canonical_id in old_ids - new_ids]
+            changed.append(Recipe(pk=recipe_id, canonical_ingredient_ids=sorted(new_ids)))
+
+        if not changed:
+            return
+        with transaction.atomic():
+            self._update_postings(added, 'UNION')
+            self._update_postings(removed, 'EXCEPT')
+            Recipe.objects.bulk_update(changed, ['canonical_ingredient_ids'], batch_size=1000)
+
+    def rebuild_index(self):
+        """ Build the inverted index from scratch with two statements, e.g. after a bulk import """
+        recipes_table = Recipe._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                UPDATE {recipes_table} SET canonical_ingredient_ids = CASE
+                    WHEN publish_status = %s AND status = %s THEN ARRAY(
+                        SELECT DISTINCT canonical_id FROM {Ingredient._meta.db_table}
+                        WHERE recipe_id = {recipes_table}.id AND canonical_id IS NOT NULL
+                        ORDER BY 1
+                    )
+                    ELSE '{{}}'
+                END
+                ''',
+                [Recipe.PublishStatus.PUBLISHED, Recipe.Status.ACCEPTED]
+            )
+            cursor.execute(
+                f'''
+                UPDATE {self.model._meta.db_table} SET recipe_ids = COALESCE(postings.recipe_ids, '{{}}')
+                FROM {self.model._meta.db_table} AS canonical
+                LEFT JOIN (
+                    SELECT canonical_id, array_agg({recipes_table}.id ORDER BY {recipes_table}.id) AS recipe_ids
+                    FROM {recipes_table}, unnest(canonical_ingredient_ids) AS canonical_id
+                    GROUP BY canonical_id
+                ) AS postings ON postings.canonical_id = canonical.id
+                WHERE {self.model._meta.db_table}.id = canonical.id
+                '''
+            )
+
+    def unindex_recipe(self, recipe_id):
+        """ Remove a recipe about to be deleted from the inverted index """
+        canonical_ids = Recipe.objects.filter(pk=recipe_id) \
+            .values_list('canonical_ingredient_ids', flat=True).first() or []
+        self._update_postings([(recipe_id, canonical_id) for canonical_id in canonical_ids], 'EXCEPT')
+
+    def _update_postings(self, pairs, operator):
+        """ Add (UNION) or remove (EXCEPT) (recipe id, canonical id) pairs keeping the postings sorted """
+        if not pairs:
+            return
+        recipe_ids, canonical_ids = zip(*pairs)
+        table = self.model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                UPDATE {table} SET recipe_ids = ARRAY(
+                    SELECT unnest({table}.recipe_ids) {operator} SELECT unnest(postings.recipe_ids) ORDER BY 1
+                )
+                FROM (
+                    SELECT canonical_id, array_agg(recipe_id) AS recipe_ids
+                    FROM unnest(%s::int[], %s::int[]) AS pairs (recipe_id, canonical_id)
+                    GROUP BY canonical_id
+                ) AS postings
+                WHERE {table}.id = postings.canonical_id
+                ''',
+                [list(recipe_ids), list(canonical_ids)]
+            )
+
+    def find(self, title):
+        """ Canonical ingredients similar to the title, the closest first """
+        title = normalize_ingredient_title(title)
+        return self.filter(title__trigram_similar=title) \
+            .annotate(similarity=TrigramSimilarity('title', title)) \
+            .order_by('-similarity')
+
+
+class CanonicalIngredient(models.Model):
+
+    title = models.CharField('Title', max_length=255, unique=True)
+    # inverted index: sorted ids of published and accepted recipes with the ingredient
+    recipe_ids = ArrayField(models.IntegerField(), default=list, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True, editable=False)
+
+    objects = CanonicalIngredientManager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['title'], name='canonical_title_trgm', opclasses=['gin_trgm_ops']),
+        ]
+
+    def __str__(self):
+        return f'#{self.pk}: {self.title}'
+
+
 class Ingredient(models.Model):
 
     title = models.CharField('Title', max_length=255)
+    # title without quantities, units and notes, used by the recommender
+    normalized_title = models.CharField(max_length=255, blank=True, default='', editable=False)
+    canonical = models.ForeignKey(
+        CanonicalIngredient,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='ingredients'
+    )
     quantity = models.FloatField(
         validators=[validate_decimals]
     )
@@ -300,6 +509,25 @@ class Ingredient(models.Model):
     def __str__(self):
         return f'#{self.pk}: {self.title} ({self.quantity} {self.unit}) for [{self.recipe}]'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # a linked ingredient was linked by its normalized title, see CanonicalIngredientManager.link_ingredients
+        if instance.__dict__.get('canonical_id') is not None:
+            instance._linked_title = instance.__dict__.get('normalized_title')
+        return instance
+
+    def is_linked(self):
+        """ Whether the canonical ingredient is the one of the current normalized title """
+        return getattr(self, '_linked_title', None) == self.normalized_title \
+            and (self.canonical_id is not None or not self.normalized_title)
+
+    def save(self, *args, **kwargs):
+        self.normalized_title = normalize_ingredient_title(self.title)
+        if kwargs.get('update_fields') is not None and 'title' in kwargs['update_fields']:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'normalized_title'}
+        super().save(*args, **kwargs)
+
 
 class RecipeStep(models.Model):
 
@@ -351,3 +579,23 @@ class SavedRecipe(models.Model):
     class Meta:
 
         unique_together = ['user', 'recipe']
+
+
+class RecipeNeighbours(models.Model):
+    """
+    Top-k most similar recipes by ingredients, most similar first.
+    Filled by RecommendedRecipesService.calculate_recipes_data
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='neighbours'
+    )
+    neighbour_ids = ArrayField(models.IntegerField(), default=list)
+    scores = ArrayField(models.FloatField(), default=list)
+    updated_at = models.DateTimeField(auto_now=True, editable=False)
+
+    def __str__(self):
+        return f'Neighbours of #{self.recipe_id}: {self.neighbour_ids}'
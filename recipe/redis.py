@@ -0,0 +1,466 @@
+import datetime
+import functools
+import json
+import re
+import uuid
+from collections import Counter, defaultdict
+
+from redis import Redis
+from redis.exceptions import WatchError
+
+from recipe.enums import Cuisines, Diets, RecipeTypes
+from utils.redis import get_redis_instance
+
+
+class RecommendationsRunCache:
+    """
+    Time of the last run of the users recommendations job.
+    Users without activity after it are not recalculated
+    """
+    KEY = 'recommendations:last_run'
+
+    redis: Redis
+
+    def __init__(self):
+        self.redis = get_redis_instance()
+
+    def get_last_run(self):
+        value = self.redis.get(self.KEY)
+        if value is None:
+            return None
+        return datetime.datetime.fromisoformat(value.decode('utf-8'))
+
+    def set_last_run(self, value: datetime.datetime):
+        self.redis.set(self.KEY, value.isoformat())
+
+    def reset(self):
+        """ Next run recalculates all users """
+        self.redis.delete(self.KEY)
+
+
+class RecipeNeighboursVersion:
+    """
+    Version of the RecipeNeighbours table, a new one is set on every write of the table.
+    Hosts keep their local copies of the table per version, see RecipeNeighboursIndex
+    """
+    KEY = 'recommendations:neighbours_version'
+
+    redis: Redis
+
+    def __init__(self):
+        self.redis = get_redis_instance()
+
+    def get(self):
+        value = self.redis.get(self.KEY)
+        if value is None:
+            return None
+        return value.decode('utf-8')
+
+    @staticmethod
+    def generate() -> str:
+        return uuid.uuid4().hex
+
+    def set(self, version: str):
+        self.redis.set(self.KEY, version)
+
+    def update(self) -> str:
+        """ Set and return a new version """
+        version = self.generate()
+        self.set(version)
+        return version
+
+    def reset(self):
+        self.redis.delete(self.KEY)
+
+
+class RecommendationsCache:
+    """
+    Recommended recipe ids per user and the shared list of popular recipes
+    """
+    POPULAR_KEY = 'recommendations:popular'
+
+    redis: Redis
+
+    def __init__(self):
+        self.redis = get_redis_instance()
+
+    @staticmethod
+    def _gen_key(user_id):
+        return f'recommendations:user:{user_id}'
+
+    @staticmethod
+    def _gen_pending_key(user_id):
+        return f'recommendations:user:{user_id}:pending'
+
+    @staticmethod
+    def _loads(value):
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def get_user(self, user_id):
+        return self._loads(self.redis.get(self._gen_key(user_id)))
+
+    def set_user(self, user_id, recipe_ids: list, timeout: int):
+        self.redis.set(self._gen_key(user_id), json.dumps(recipe_ids), ex=timeout)
+
+    def set_users(self, users_recipe_ids: dict, timeout: int):
+        pipe = self.redis.pipeline()
+        for user_id, recipe_ids in users_recipe_ids.items():
+            pipe.set(self._gen_key(user_id), json.dumps(recipe_ids), ex=timeout)
+            pipe.delete(self._gen_pending_key(user_id))
+        pipe.execute()
+
+    def set_user_pending(self, user_id, timeout: int) -> bool:
+        """ Whether the caller should queue the calculation, only the first caller until the timeout does """
+        return bool(self.redis.set(self._gen_pending_key(user_id), 1, nx=True, ex=timeout))
+
+    def delete_user(self, user_id):
+        self.redis.delete(self._gen_key(user_id))
+
+    def get_popular(self):
+        return self._loads(self.redis.get(self.POPULAR_KEY))
+
+    def set_popular(self, recipe_ids: list, timeout: int):
+        self.redis.set(self.POPULAR_KEY, json.dumps(recipe_ids), ex=timeout)
+
+
+class SearchSuggestionsIndex:
+    """
+    Type-ahead suggestions for titles: 'curry' -> 'curry soup', 'mozza' -> 'mozzarella caprese'.
+
+    Phrases of up to MAX_WORDS words starting at every word of the indexed titles
+    are kept in lexicographically ordered sorted sets, one per phrase length, so a
+    query of N words is completed with a ZRANGEBYLEX prefix lookup over phrases
+    of N + 1 words. Weights (the number of titles with the phrase) are kept in hashes
+    and rank the matches. Indexed titles are remembered to update the index incrementally
+    """
+    RECIPES = 'recipe'
+    EATCHEFS_RECIPES = 'recipe:eatchefs'
+    CHEF_PENCILS = 'chef_pencils'
+
+    MAX_WORDS = 4
+    # prefix matches ranked by weight per lookup
+    SCAN_LIMIT = 100
+
+    # letters and spaces are kept, as in the former QuerySerializer.get_suggestions
+    NOT_LETTERS_RE = re.compile(r'[^\w\s]|[\d_]')
+
+    redis: Redis
+
+    def __init__(self, name):
+        self.name = name
+        self.redis = get_redis_instance()
+
+    def _gen_key(self, *parts):
+        return ':'.join(['search_suggestions', self.name, *[str(p) for p in parts]])
+
+    @classmethod
+    def normalize(cls, text) -> list:
+        """ Lowercase words of the text """
+        return cls.NOT_LETTERS_RE.sub('', text.lower()).split()
+
+    @classmethod
+    def get_phrases(cls, title) -> Counter:
+        """ {(length, phrase): count} of the title, phrases are cut short at the end of the title """
+        words = cls.normalize(title) if title else []
+        return Counter(
+            (length, ' '.join(words[i:i + length]))
+            for length in range(1, cls.MAX_WORDS + 1)
+            for i in range(len(words))
+        )
+
+    def get(self, query, count=8) -> list:
+        words = self.normalize(query)
+        if not words:
+            return []
+        length = min(len(words) + 1, self.MAX_WORDS)
+        prefix = ' '.join(words).encode('utf-8')
+
+        phrases = self.redis.zrangebylex(
+            self._gen_key(length), b'[' + prefix, b'[' + prefix + b'\xff', start=0, num=self.SCAN_LIMIT
+        )
+        if not phrases:
+            return []
+        weights = self.redis.hmget(self._gen_key(length, 'weights'), phrases)
+        ranked = sorted(zip(phrases, weights), key=lambda item: (-int(item[1] or 0), item[0]))
+        return [phrase.decode('utf-8') for phrase, _ in ranked[:count]]
+
+    def update(self, pk, title):
+        """ Index the title of an object, or remove the object if title is None """
+        indexed = self.redis.hget(self._gen_key('titles'), pk)
+        indexed = indexed.decode('utf-8') if indexed is not None else None
+        if indexed == title:
+            return
+
+        phrases = self.get_phrases(title)
+        phrases.subtract(self.get_phrases(indexed))
+        changes = [(length, phrase, amount) for (length, phrase), amount in phrases.items() if amount]
+
+        pipe = self.redis.pipeline()
+        for length, phrase, amount in changes:
+            pipe.hincrby(self._gen_key(length, 'weights'), phrase, amount)
+        if title is None:
+            pipe.hdel(self._gen_key('titles'), pk)
+        else:
+            pipe.hset(self._gen_key('titles'), pk, title)
+        weights = pipe.execute()
+
+        pipe = self.redis.pipeline()
+        for (length, phrase, _), weight in zip(changes, weights):
+            if weight > 0:
+                pipe.zadd(self._gen_key(length), {phrase: 0})
+            else:
+                pipe.zrem(self._gen_key(length), phrase)
+                pipe.hdel(self._gen_key(length, 'weights'), phrase)
+        pipe.execute()
+
+    def rebuild(self, titles, chunk_size=10000):
+        """ Replace the index with (pk, title) pairs, the old one is served until it is swapped """
+        phrases = Counter()
+        indexed = {}
+        for pk, title in titles:
+            phrases.update(self.get_phrases(title))
+            indexed[pk] = title
+
+        keys = [self._gen_key('titles')]
+        for length in range(1, self.MAX_WORDS + 1):
+            keys += [self._gen_key(length), self._gen_key(length, 'weights')]
+        self.redis.delete(*[f'{key}:rebuild' for key in keys])
+
+        pipe = self.redis.pipeline()
+        items = list(phrases.items())
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            for length in range(1, self.MAX_WORDS + 1):
+                weights = {phrase: weight for (phrase_length, phrase), weight in chunk if phrase_length == length}
+                if weights:
+                    pipe.zadd(f'{self._gen_key(length)}:rebuild', dict.fromkeys(weights, 0))
+                    pipe.hset(f'{self._gen_key(length, "weights")}:rebuild', mapping=weights)
+            pipe.execute()
+        pks = list(indexed)
+        for start in range(0, len(pks), chunk_size):
+            pipe.hset(
+                f'{self._gen_key("titles")}:rebuild',
+                mapping={pk: indexed[pk] for pk in pks[start:start + chunk_size]}
+            )
+            pipe.execute()
+
+        pipe = self.redis.pipeline(transaction=True)
+        existing = [key for key in keys if self.redis.exists(f'{key}:rebuild')]
+        for key in keys:
+            if key in existing:
+                pipe.rename(f'{key}:rebuild', key)
+            else:
+                pipe.delete(key)
+        pipe.execute()
+
+    def reset(self):
+        self.rebuild([])
+
+
+class RecipeCandidatePool:
+    """
+    Ids of recipes randomly sampled by homepage widgets, so a sample is taken
+    without reading the candidates from the database. A pool is deleted when
+    its candidates change, see recipe.signals and site_settings.signals, and is
+    built again by the next request.
+
+    Every invalidation increments the generation of the pool, and a pool read from
+    the database is only stored if no invalidation happened since the read started,
+    so a request racing a change doesn't store stale candidates
+    """
+    FEATURED = 'featured'
+    LATEST = 'latest'
+
+    NAMES = [FEATURED, LATEST]
+    # only a safety net, pools are deleted on changes
+    TIMEOUT = 60 * 60
+
+    redis: Redis
+
+    def __init__(self, name):
+        self.name = name
+        self.redis = get_redis_instance()
+
+    @staticmethod
+    def _gen_key(name):
+        return f'candidate_pool:{name}'
+
+    @staticmethod
+    def _gen_generation_key(name):
+        return f'candidate_pool:{name}:generation'
+
+    def get(self):
+        """ Ids of the pool or None if it is not built """
+        value = self.redis.get(self._gen_key(self.name))
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def get_generation(self) -> int:
+        """ Read before the candidates are read from the database, see set """
+        return int(self.redis.get(self._gen_generation_key(self.name)) or 0)
+
+    def set(self, recipe_ids: list, generation: int) -> bool:
+        """ Store the pool unless it was invalidated since the generation was read """
+        generation_key = self._gen_generation_key(self.name)
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(generation_key)
+                if int(pipe.get(generation_key) or 0) != generation:
+                    return False
+                pipe.multi()
+                pipe.set(self._gen_key(self.name), json.dumps(recipe_ids), ex=self.TIMEOUT)
+                pipe.execute()
+            except WatchError:
+                return False
+        return True
+
+    @classmethod
+    def invalidate(cls, *names):
+        pipe = get_redis_instance().pipeline()
+        for name in names:
+            pipe.incr(cls._gen_generation_key(name))
+        pipe.delete(*[cls._gen_key(name) for name in names])
+        pipe.execute()
+
+    @classmethod
+    def reset(cls):
+        cls.invalidate(*cls.NAMES)
+
+
+class RecipeLeaderboards:
+    """
+    Published recipes ranked by likes per facet value: a sorted set of recipe ids
+    scored by likes_number for every cuisine, type and diet, so the top of any
+    facet value is read with a single ZREVRANGE.
+
+    Recipes are (pk, likes_number, {facet: values}) entries, see Recipe.get_leaderboard_entry,
+    with None facets for recipes that are not ranked. Scores are updated by the likes
+    aggregation (RecipeLikeCalculator), membership by recipe.signals, and everything
+    is rebuilt nightly. The keys every recipe is in are kept in a hash, so an update
+    only touches the leaderboards the recipe leaves and joins.
+
+    Until the first rebuild the leaderboards are not 'built' and readers fall back
+    to the database, the first reader queues the rebuild, see request_rebuild
+    """
+    FACETS = {
+        'cuisines': Cuisines,
+        'types': RecipeTypes,
+        'diet_restrictions': Diets,
+    }
+
+    # leaderboards built before the recipe keys were kept are not used
+    BUILT_KEY = 'leaderboard:built:recipe_keys'
+    RECIPE_KEYS_KEY = 'leaderboard:recipe_keys'
+    REBUILD_REQUESTED_KEY = 'leaderboard:rebuild_requested'
+    # another rebuild is requested after it if the first one did not finish
+    REBUILD_REQUESTED_TIMEOUT = 15 * 60
+
+    redis: Redis
+
+    def __init__(self):
+        self.redis = get_redis_instance()
+
+    @staticmethod
+    def _gen_key(facet, value):
+        return f'leaderboard:{facet}:{value}'
+
+    @classmethod
+    @functools.lru_cache()
+    def _get_values(cls):
+        """ Known values of every facet """
+        return {facet: set(choices.values) for facet, choices in cls.FACETS.items()}
+
+    @classmethod
+    def _get_keys(cls):
+        return [cls._gen_key(facet, value) for facet, values in cls._get_values().items() for value in values]
+
+    @classmethod
+    def _get_recipe_keys(cls, facets):
+        """ Keys of the leaderboards of facet values, unknown values are skipped """
+        return [
+            cls._gen_key(facet, value)
+            for facet, values in (facets or {}).items()
+            for value in set(values or []) & cls._get_values()[facet]
+        ]
+
+    def is_built(self):
+        return bool(self.redis.exists(self.BUILT_KEY))
+
+    def get_top(self, facet, value, count) -> list:
+        return [int(pk) for pk in self.redis.zrevrange(self._gen_key(facet, value), 0, count - 1)]
+
+    def request_rebuild(self) -> bool:
+        """ Whether the caller should queue the rebuild, only the first caller does """
+        return bool(self.redis.set(self.REBUILD_REQUESTED_KEY, 1, nx=True, ex=self.REBUILD_REQUESTED_TIMEOUT))
+
+    def update(self, recipes):
+        """ Move recipes from the leaderboards they are in to the ones of their current facet values """
+        recipes = {pk: (likes_number, facets) for pk, likes_number, facets in recipes}
+        if not recipes:
+            return
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    # the keys are read again if a recipe is moved by someone else in between
+                    pipe.watch(self.RECIPE_KEYS_KEY)
+                    previous_keys = pipe.hmget(self.RECIPE_KEYS_KEY, list(recipes))
+                    pipe.multi()
+                    for (pk, (likes_number, facets)), previous in zip(recipes.items(), previous_keys):
+                        keys = self._get_recipe_keys(facets)
+                        for key in set(json.loads(previous) if previous else []) - set(keys):
+                            pipe.zrem(key, pk)
+                        for key in keys:
+                            pipe.zadd(key, {pk: likes_number or 0})
+                        if keys:
+                            pipe.hset(self.RECIPE_KEYS_KEY, pk, json.dumps(keys))
+                        else:
+                            pipe.hdel(self.RECIPE_KEYS_KEY, pk)
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    def rebuild(self, recipes, chunk_size=10000):
+        """ Replace the leaderboards with recipes, the old ones are served until they are swapped """
+        keys = self._get_keys() + [self.RECIPE_KEYS_KEY]
+        self.redis.delete(*[f'{key}:rebuild' for key in keys])
+
+        scores = defaultdict(dict)
+        recipe_keys = defaultdict(list)
+        for i, (pk, likes_number, facets) in enumerate(recipes, 1):
+            for key in self._get_recipe_keys(facets):
+                scores[key][pk] = likes_number or 0
+                recipe_keys[pk].append(key)
+            if i % chunk_size == 0:
+                self._add_scores(scores, recipe_keys)
+                scores.clear()
+                recipe_keys.clear()
+        self._add_scores(scores, recipe_keys)
+
+        existing = [key for key in keys if self.redis.exists(f'{key}:rebuild')]
+        pipe = self.redis.pipeline(transaction=True)
+        for key in keys:
+            if key in existing:
+                pipe.rename(f'{key}:rebuild', key)
+            else:
+                pipe.delete(key)
+        pipe.set(self.BUILT_KEY, 1)
+        pipe.delete(self.REBUILD_REQUESTED_KEY)
+        pipe.execute()
+
+    def _add_scores(self, scores, recipe_keys):
+        pipe = self.redis.pipeline()
+        for key, mapping in scores.items():
+            pipe.zadd(f'{key}:rebuild', mapping)
+        if recipe_keys:
+            pipe.hset(
+                f'{self.RECIPE_KEYS_KEY}:rebuild',
+                mapping={pk: json.dumps(keys) for pk, keys in recipe_keys.items()}
+            )
+        pipe.execute()
+
+    def reset(self):
+        self.redis.delete(self.BUILT_KEY, self.RECIPE_KEYS_KEY, self.REBUILD_REQUESTED_KEY, *self._get_keys())
@@ -4,15 +4,16 @@ from pathlib import Path
 
 from django.conf import settings
 from django.core.files.base import ContentFile
-from django.db.models import Sum
 from main.watermark_storage import WatermarkStorage
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.fields import SerializerMethodField
-from social.models import Like
+from social.serializers import (UserFlagsListSerializer,
+                                UserFlagsSerializerMixin)
 
-from recipe.models import (Ingredient, RecipeImage, RecipeStep, Tag,
-                           TagRecipeRelation)
+from recipe.models import (CanonicalIngredient, Ingredient, RecipeImage,
+                           RecipeStep, Tag, TagRecipeRelation)
+from recipe.redis import SearchSuggestionsIndex
 from recipe.signals import S_new_recipe_created
 
 logger = logging.getLogger('django')
@@ -20,6 +21,7 @@ logger = logging.getLogger('django')
 import sys
 
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from users.models import EatChefsAccount
 from users.serializers import UserCardSerializer
 
 from recipe.models import (Ingredient, Recipe, RecipeImage, RecipeStep,
@@ -205,40 +207,48 @@ class RecipeCardSerializer(serializers.ModelSerializer):
         except Exception:
             ret['video'] = None
 
+        # annotated by the title search, see main.search.search_ranked
+        if hasattr(instance, 'search_headline'):
+            ret['search_headline'] = instance.search_headline
+
         return ret
 
 
-class RecipeSavedRecipeSerializer(RecipeCardSerializer):
+class RecipeIngredientsMatchSerializer(RecipeCardSerializer):
+    """
+    Recipe card with the number of ingredients found in the search list,
+    set on instances by RecipesByIngredientsView
+    """
+    matched_ingredients = serializers.IntegerField(read_only=True)
+    required_ingredients = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeCardSerializer.Meta):
+        fields = RecipeCardSerializer.Meta.fields + ['matched_ingredients', 'required_ingredients']
+
+
+class RecipeSavedRecipeSerializer(UserFlagsSerializerMixin, RecipeCardSerializer):
     """
     This is slightly extended (has 'user_saved_recipe' returned) serializer
     for work with SavedRecipe to reduce number of SQL queries for them
     """
+    liked_key = None
+    saved_key = 'user_saved_recipe'
+    saved_model = SavedRecipe
+    saved_field = 'recipe'
+
+    class Meta(RecipeCardSerializer.Meta):
+        list_serializer_class = UserFlagsListSerializer
 
     def to_representation(self, instance):
         ret = super().to_representation(instance)
+        return self.add_user_flags(instance, ret)
 
-        try:
-            user = self.context['request'].user
-        except KeyError:
-            ret['user_saved_recipe'] = False
-        else:
-            if not user.is_authenticated:
-                ret['user_saved_recipe'] = False
-            else:
-                try:
-                    sr = SavedRecipe.objects.get(
-                        user=self.context['request'].user,
-                        recipe=instance
-                    )
-                except SavedRecipe.DoesNotExist:
-                    ret['user_saved_recipe'] = False
-                else:
-                    ret['user_saved_recipe'] = sr.pk
-
-        return ret
 
+class RecipeSerializer(UserFlagsSerializerMixin, serializers.ModelSerializer):
 
-class RecipeSerializer(serializers.ModelSerializer):
+    saved_key = 'user_saved_recipe'
+    saved_model = SavedRecipe
+    saved_field = 'recipe'
 
     user = UserCardSerializer(read_only=True)
 
@@ -307,6 +317,7 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
+        list_serializer_class = UserFlagsListSerializer
         fields = [
             'pk',
             'user',
@@ -421,11 +432,13 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         recipe = super().create(validated_data)
 
+        created_ingredients = []
         for ingredient_data in ingredients:
             ingredient_data['recipe'] = recipe.pk
             serializer = IngredientSerializer(data=ingredient_data)
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            created_ingredients.append(serializer.save())
+        CanonicalIngredient.objects.link_ingredients(created_ingredients)
 
         for step_data in steps:
             step_data['recipe'] = recipe.pk
@@ -491,11 +504,13 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         if ingredients is not None:
             Ingredient.objects.filter(recipe=recipe).delete()
+            created_ingredients = []
             for ingredient_data in ingredients:
                 ingredient_data['recipe'] = recipe.pk
                 serializer = IngredientSerializer(data=ingredient_data)
                 serializer.is_valid(raise_exception=True)
-                serializer.save()
+                created_ingredients.append(serializer.save())
+            CanonicalIngredient.objects.link_ingredients(created_ingredients)
 
         if steps:
             RecipeStep.objects.filter(recipe=recipe).delete()
@@ -594,12 +609,6 @@ class RecipeSerializer(serializers.ModelSerializer):
             })
         ret['ingredients'] = ingredients
 
-        try:
-            ret['views_number'] = instance.stat_records.aggregate(
-                views_counter=Sum('views_counter__count'))['views_counter']
-        except Exception:
-            ret['views_number'] = 0
-
         try:
             ret['video'] = instance.video.pk
         except Exception:
@@ -612,84 +621,23 @@ class RecipeSerializer(serializers.ModelSerializer):
         ret['tags'] = tags
         """
 
-        try:
-            user = self.context['request'].user
-        except KeyError:
-            ret['user_liked'] = False
-            ret['user_saved_recipe'] = False
-        else:
-            if not user.is_authenticated:
-                ret['user_liked'] = False
-                ret['user_saved_recipe'] = False
-            else:
-                try:
-                    Like.objects.get(
-                        user=self.context['request'].user,
-                        content_type__model=instance.__class__.__name__.lower(),
-                        object_id=instance.pk
-                    )
-                except Like.DoesNotExist:
-                    ret['user_liked'] = False
-                else:
-                    ret['user_liked'] = True
-
-                try:
-                    sr = SavedRecipe.objects.get(
-                        user=self.context['request'].user,
-                        recipe=instance
-                    )
-                except SavedRecipe.DoesNotExist:
-                    ret['user_saved_recipe'] = False
-                else:
-                    ret['user_saved_recipe'] = sr.pk
-
-        return ret
+        return self.add_user_flags(instance, ret)
 
 
 class QuerySerializer(serializers.Serializer):
     search = serializers.CharField(write_only=True)
 
-    def get_results(self):
-
-        results = Recipe.objects.filter(
-            title__icontains=self.validated_data['search']
-        ).get_filtered_by_source(
-            only_eatchefs_recipes=self.context['request'].query_params.get(
-                'only_eatchefs_recipes', None
-            )
-        ).order_by('-likes_number')[0:30]
-
-        return results
+    def get_index(self):
+        only_eatchefs_recipes = self.context['request'].query_params.get('only_eatchefs_recipes', None)
+        if only_eatchefs_recipes is not None and EatChefsAccount.get_id() is not None:
+            return SearchSuggestionsIndex(SearchSuggestionsIndex.EATCHEFS_RECIPES)
+        return SearchSuggestionsIndex(SearchSuggestionsIndex.RECIPES)
 
     def get_suggestions(self):
-
-        titles = []
-        for t in self.get_results():
-            title = ''.join(list(filter(lambda x: x.isalpha() or x == ' ', t.title.lower().strip())))
-            titles.append(title)
-
-        query = self.validated_data['search'].strip().lower()
-
-        res = []
-        for title in titles:
-            words_after = title.lower().split(query)[-1]
-            if words_after:
-                space = ' ' if words_after.lstrip() != words_after else ''
-
-                # CASE: searching 'curry', found 'thai curry soup and coconut', return 'curry soup'
-                if space:
-                    word_to_add = words_after.strip().split()[0]
-                    res.append(f'{query} {word_to_add}')
-
-                # CASE: searching 'mozza', found 'italian tomato and mozzarella caprese', return 'mozzarella caprese'
-                else:
-                    word_to_add = words_after.strip().split()[0:2]
-                    word_to_add = ' '.join(word_to_add)
-                    res.append(f'{query}{word_to_add}')
-            else:
-                res.append(query)
-        suggestions = [{'result': l} for l in sorted(set(res))[0:8]]
-        return suggestions
+        # CASE: searching 'curry', found 'thai curry soup and coconut', return 'curry soup'
+        # CASE: searching 'mozza', found 'italian tomato and mozzarella caprese', return 'mozzarella caprese'
+        suggestions = self.get_index().get(self.validated_data['search'])
+        return [{'result': suggestion} for suggestion in suggestions]
 
 
 class SavedRecipeSerializer(serializers.ModelSerializer):
@@ -698,6 +646,7 @@ class SavedRecipeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = SavedRecipe
+        list_serializer_class = UserFlagsListSerializer
         fields = ['pk', 'user', 'recipe', 'created_at']
         read_only_fields = ['pk', 'user', 'created_at']
 
@@ -712,13 +661,23 @@ class SavedRecipeSerializer(serializers.ModelSerializer):
         )
         return saved_recipe
 
+    def load_user_flags(self, instances):
+        serializer = RecipeSavedRecipeSerializer(context=self.context)
+        user = serializer._get_user()
+        serializer.load_user_flags(
+            [i.recipe for i in instances],
+            # nothing is saved without a user
+            saved={
+                i.recipe_id: i.pk
+                for i in instances if i.user_id == user.pk
+            } if user is not None else None
+        )
+
     def to_representation(self, instance):
         ret = super().to_representation(instance)
         ret['recipe'] = RecipeSavedRecipeSerializer(
             instance=instance.recipe,
-            context={
-                'request': self.context['request']
-            }
+            context=self.context
         ).data
         return ret
 
@@ -5,8 +5,10 @@ import requests
 
 import datetime
 from main.settings.common import RAPID_API_KEY
-from django.db.models import Sum
-from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from django.db import connection, transaction
+from django.contrib.contenttypes.models import ContentType
 from recipe.models import Recipe
 from social.models import Rating, Like
 from django.db.models.aggregates import Avg, Count
@@ -16,23 +18,30 @@ from recipe.management.commands.add_recipes import RecipeCreator
 from django.conf import settings
 
 from utils.loggers import current_func_name
-from users.models import User
-from django.conf import settings
+from users.models import EatChefsAccount, User
+
+import json
+import os
+import random
+import shutil
+from collections import defaultdict
 
 import numpy as np
+import scipy.sparse
 
-from users.models import User
-from social.models import Like
-from recipe.models import Recipe
+from users.models import UserViewHistoryRecord
+from recipe.models import (CanonicalIngredient, Ingredient, RecipeNeighbours,
+                           SavedRecipe, normalize_ingredient_title)
+from recipe.redis import (RecipeCandidatePool, RecipeLeaderboards, RecipeNeighboursVersion,
+                          RecommendationsCache)
+from main.redis import ResponseCache
 
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import linear_kernel
 
 from recipe.errors import (
     LimitsExceededError,
     RecipeAlreadyExists,
     RequestError,
-    UnexpectedResponse
 )
 
 
@@ -42,14 +51,24 @@ logger = logging.getLogger('django')
 
 class RecipeRatingCalculator:
 
-    def get_avg_ratings_for_recipes(self):
-        ratings = Rating.objects.filter(content_type__model='recipe').values_list(
+    def get_avg_ratings_for_recipes(self, pks=None):
+        """
+        Calculate ratings for all recipes or only for recipes with given pks
+        """
+        ratings = Rating.objects.filter(content_type__model='recipe')
+        if pks is not None:
+            ratings = ratings.filter(object_id__in=pks)
+        ratings = ratings.values_list(
             'object_id'
         ).annotate(
             rounded_avg_rating=Round1(Avg('rating'))
         )
         self.ratings = {p[0]: p[1] for p in ratings}
 
+        # recipes that lost all their ratings
+        for pk in pks or []:
+            self.ratings.setdefault(pk, None)
+
     def update_records(self):
         to_update = []
         for r in Recipe.objects.filter(pk__in=self.ratings.keys()).only('pk'):
@@ -60,28 +79,46 @@ class RecipeRatingCalculator:
 
 class RecipeLikeCalculator:
 
-    def get_total_likes_for_recipes(self):
-        likes = Like.objects.filter(content_type__model='recipe').values_list(
+    def get_total_likes_for_recipes(self, pks=None):
+        """
+        Calculate likes for all recipes or only for recipes with given pks
+        """
+        likes = Like.objects.filter(content_type__model='recipe')
+        if pks is not None:
+            likes = likes.filter(object_id__in=pks)
+        likes = likes.values_list(
             'object_id'
         ).annotate(
             Count('pk')
         )
         self.ratings = {p[0]: p[1] for p in likes}
 
+        # recipes that lost all their likes
+        for pk in pks or []:
+            self.ratings.setdefault(pk, 0)
+
     def update_records(self):
         to_update = []
-        for r in Recipe.objects.filter(pk__in=self.ratings.keys()).only('pk'):
+        recipes = Recipe.objects.filter(pk__in=self.ratings.keys()) \
+            .only('pk', 'publish_status', *RecipeLeaderboards.FACETS)
+        for r in recipes:
             r.likes_number = self.ratings[r.pk]
             to_update.append(r)
         Recipe.objects.bulk_update(to_update, ['likes_number'], batch_size=100)
+        RecipeLeaderboards().update(r.get_leaderboard_entry() for r in to_update)
 
 
 class RecipeViewsCalculator:
 
-    def get_total_views_for_recipes(self):
-
-        rr = Recipe.objects.all().select_related('user').annotate(
-            views_number_calculated=Sum('stat_records__views_counter__count')
+    def get_total_views_for_recipes(self, pks=None):
+        """
+        Calculate views for all recipes or only for recipes with given pks
+        """
+        rr = Recipe.objects.all()
+        if pks is not None:
+            rr = rr.filter(pk__in=pks)
+        rr = rr.annotate(
+            views_number_calculated=Sum('stat_records__views_count')
         )
         self.ratings = {r.pk: r.views_number_calculated for r in rr}
 
@@ -106,10 +143,7 @@ class RecipeApiParser:
             'x-rapidapi-host': 'spoonacular-recipe-food-nutrition-v1.p.rapidapi.com'
         }
 
-        self.user = User.objects.get(
-            full_name=settings.EATCHEFS_ACCOUNT_NAME,
-            is_staff=True
-        )
+        self.user = User.objects.get(pk=EatChefsAccount.get_id())
 
         self.today_requests = self.settings.today_requests
         self.today_results = self.settings.today_results
@@ -257,147 +291,756 @@ class RecipeApiParser:
             raise LimitsExceededError
 
 
+class RecipeNeighboursIndex:
+    """
+    Read-only local copy of the RecipeNeighbours table in .npy files.
+
+    Files are memory-mapped, so recommendation subtasks running in several
+    worker processes share the same pages instead of loading the table each.
+    Copies are kept per version of the table (RecipeNeighboursVersion), so a host
+    never reads a copy of a table rewritten by another host
+    """
+    FILES = ['recipe_ids', 'neighbour_ids', 'scores']
+
+    def __init__(self, recipe_ids, neighbour_ids, scores):
+        # recipe_ids are sorted, row i holds neighbours of recipe_ids[i] padded with -1
+        self.recipe_ids = recipe_ids
+        self.neighbour_ids = neighbour_ids
+        self.scores = scores
+
+    @staticmethod
+    def _get_path(version, name):
+        return os.path.join(settings.RECOMMENDATIONS_INDEX_DIR, version, f'{name}.npy')
+
+    @classmethod
+    def from_table(cls):
+        rows = list(RecipeNeighbours.objects.order_by('recipe_id').values_list('recipe_id', 'neighbour_ids', 'scores'))
+        k = max([len(ids) for _, ids, _ in rows], default=0)
+        index = cls(
+            np.array([recipe_id for recipe_id, _, _ in rows], dtype=np.int64),
+            np.full((len(rows), k), -1, dtype=np.int64),
+            np.zeros((len(rows), k), dtype=np.float32),
+        )
+        for i, (_, ids, scores) in enumerate(rows):
+            index.neighbour_ids[i, :len(ids)] = ids
+            index.scores[i, :len(scores)] = scores
+        return index
+
+    @classmethod
+    def save(cls, version):
+        """ Export the RecipeNeighbours table as the local copy of the version, copies of other versions are removed """
+        index = cls.from_table()
+        os.makedirs(os.path.join(settings.RECOMMENDATIONS_INDEX_DIR, version), exist_ok=True)
+        for name in cls.FILES:
+            path = cls._get_path(version, name)
+            with open(f'{path}.tmp', 'wb') as f:
+                np.save(f, getattr(index, name))
+            os.replace(f'{path}.tmp', path)
+
+        # files still memory-mapped by other processes stay readable until they are closed
+        for entry in os.scandir(settings.RECOMMENDATIONS_INDEX_DIR):
+            if entry.is_dir() and entry.name != version:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    @classmethod
+    def _load(cls, version):
+        try:
+            return cls(*[np.load(cls._get_path(version, name), mmap_mode='r') for name in cls.FILES])
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def load(cls):
+        """ Local copy of the current version of the table, None if this host has none """
+        version = RecipeNeighboursVersion().get()
+        if version is None:
+            return None
+        return cls._load(version)
+
+    @classmethod
+    def load_or_save(cls):
+        """ Local copy of the current version of the table, exported first if this host has none """
+        version = RecipeNeighboursVersion().get() or RecipeNeighboursVersion().update()
+        index = cls._load(version)
+        if index is None:
+            cls.save(version)
+            index = cls._load(version)
+        return index
+
+    def get_rows(self, recipe_ids):
+        """ Rows of the given recipe ids, -1 for recipes missing in the index """
+        recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        rows = np.searchsorted(self.recipe_ids, recipe_ids)
+        found = rows < len(self.recipe_ids)
+        found[found] = self.recipe_ids[rows[found]] == recipe_ids[found]
+        return np.where(found, rows, -1)
+
+    def get_similarity_matrix(self):
+        """ Sparse recipes x recipes matrix of neighbour scores, in the order of recipe_ids """
+        size = len(self.recipe_ids)
+        rows = np.repeat(np.arange(size), self.neighbour_ids.shape[1])
+        columns = self.get_rows(self.neighbour_ids.ravel())
+        mask = columns >= 0
+        return scipy.sparse.csr_matrix(
+            (self.scores.ravel()[mask], (rows[mask], columns[mask])),
+            shape=(size, size)
+        )
+
+    def get(self, recipe_ids):
+        """ {recipe_id: (neighbour_ids, scores)} like RecommendedRecipesService.get_neighbours """
+        recipe_ids = np.array(sorted(recipe_ids), dtype=np.int64)
+        rows = self.get_rows(recipe_ids)
+        found = rows >= 0
+
+        neighbours = {}
+        for recipe_id, row in zip(recipe_ids[found].tolist(), rows[found]):
+            ids = self.neighbour_ids[row]
+            mask = ids >= 0
+            neighbours[recipe_id] = (ids[mask].tolist(), self.scores[row][mask].tolist())
+        return neighbours
+
+
 class RecommendedRecipesService:
 
-    def get_recipes_related_to_user_activity(self, user):
+    # values of RECOMMENDATIONS_MODEL
+    ACTIVITY_MODEL = 'activity'
+    INTERACTIONS_MODEL = 'interactions'
 
-        viewed_recipes = Recipe.objects \
-            .filter(recipe_views__user=user) \
-            .order_by('-recipe_views__updated_at')[0:3]
+    # kinds of interactions, keys of RECOMMENDATIONS_INTERACTION_WEIGHTS
+    LIKE = 'like'
+    RATING = 'rating'
+    SAVED = 'saved'
+    VIEW = 'view'
 
-        liked_recipes_ids = Like.objects \
-            .filter(
-                user=user,
-                content_type__model='recipe'
-            ) \
-            .values_list('object_id', flat=True) \
-            .order_by('-created_at')[0:3]
-        liked_recipes = Recipe.objects.filter(pk__in=liked_recipes_ids)
+    # number of the latest viewed and the latest liked recipes used per user
+    ACTIVITY_RECIPES = 3
 
+    def get_users_activity(self, users):
         """
-        saved_recipes = Recipe.objects
-            .filter(saved_recipes__user=user) \
-            .order_by('-saved_recipes__created_at')[0:3]
+        Ids of the latest viewed and liked recipes for every user of `users` queryset
+        in two queries: {user_id: [recipe_id, ...]}
         """
+        users_sql, users_params = users.values('pk').query.sql_with_params()
+        views_table = UserViewHistoryRecord._meta.db_table
+        likes_table = Like._meta.db_table
+
+        users_activity = defaultdict(list)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                SELECT user_id, recipe_id FROM (
+                    SELECT user_id, recipe_id,
+                        ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY updated_at DESC) AS row_number
+                    FROM {views_table}
+                    WHERE recipe_id IS NOT NULL AND user_id IN ({users_sql})
+                ) AS views
+                WHERE row_number <= %s
+                ''',
+                [*users_params, self.ACTIVITY_RECIPES]
+            )
+            for user_id, recipe_id in cursor.fetchall():
+                users_activity[user_id].append(recipe_id)
+
+            cursor.execute(
+                f'''
+                SELECT user_id, object_id FROM (
+                    SELECT user_id, object_id,
+                        ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at DESC) AS row_number
+                    FROM {likes_table}
+                    WHERE content_type_id = %s AND user_id IN ({users_sql})
+                ) AS likes
+                WHERE row_number <= %s
+                ''',
+                [ContentType.objects.get_for_model(Recipe).pk, *users_params, self.ACTIVITY_RECIPES]
+            )
+            for user_id, recipe_id in cursor.fetchall():
+                if recipe_id not in users_activity[user_id]:
+                    users_activity[user_id].append(recipe_id)
+
+        return users_activity
+
+    def get_users_to_update(self, last_run=None):
+        """ Users who interacted with recipes since `last_run` (all users if it is unknown) """
+        users = User.objects.all().get_active().get_not_banned()
+        if last_run is not None:
+            users = users.filter(
+                Q(pk__in=UserViewHistoryRecord.objects.filter(updated_at__gte=last_run).values('user_id'))
+                | Q(pk__in=Like.objects.filter(
+                    content_type__model='recipe', created_at__gte=last_run
+                ).values('user_id'))
+                | Q(pk__in=Rating.objects.filter(
+                    content_type__model='recipe', created_at__gte=last_run
+                ).values('user_id'))
+                | Q(pk__in=SavedRecipe.objects.filter(created_at__gte=last_run).values('user_id'))
+            )
+        return users
 
-        user_activity_recipes = liked_recipes | viewed_recipes # | saved_recipes
+    def update_users_recommendations(self, users, neighbours_index=None):
+        """
+        Recalculate recommended recipes of `users`, reading neighbours from the memory-mapped
+        index when it is given. Returns the number of updated users
+        """
+        to_update = [
+            User(pk=user_id, recommended_recipes=recommended)
+            for user_id, recommended in self.recommend(users, neighbours_index).items()
+        ]
+        User.objects.bulk_update(to_update, ['recommended_recipes'], batch_size=1000)
+        RecommendationsCache().set_users(
+            {user.pk: user.recommended_recipes for user in to_update},
+            settings.RECOMMENDATIONS_CACHE_TIMEOUT
+        )
+
+        return len(to_update)
+
+    def get_user_recommendations(self, user):
+        """
+        Recommended recipe ids of the user from the cache. On a cache miss they are
+        calculated by a subtask and popular recipes are returned in the meantime
+        """
+        recommended = RecommendationsCache().get_user(user.pk)
+        if recommended is None:
+            if RecommendationsCache().set_user_pending(user.pk, settings.RECOMMENDATIONS_PENDING_TIMEOUT):
+                transaction.on_commit(lambda: self._queue_user_recommendations(user.pk))
+            return self.get_popular_recipes()
+        return recommended
 
-        return user_activity_recipes  # no duplicated here
+    @staticmethod
+    def _queue_user_recommendations(user_id):
+        from recipe.tasks import update_users_recommendations
+
+        try:
+            update_users_recommendations.delay([user_id])
+        except Exception as e:
+            # queued again by a request after the pending mark expires
+            logger.error(f'Unable to queue recommendations for user #{user_id}: {e}')
+
+    def update_popular_recipes(self):
+        """ Refresh the shared list of the most liked recipes """
+        recipe_ids = list(
+            Recipe.objects.all()
+            .get_published_and_accepted()
+            .order_by(F('likes_number').desc(nulls_last=True), '-id')
+            .values_list('pk', flat=True)[0:settings.RECOMMENDATIONS_COUNT]
+        )
+        RecommendationsCache().set_popular(recipe_ids, settings.POPULAR_RECIPES_CACHE_TIMEOUT)
+        ResponseCache.invalidate(ResponseCache.POPULAR_RECIPES)
+        return recipe_ids
+
+    def get_popular_recipes(self):
+        recipe_ids = RecommendationsCache().get_popular()
+        if not recipe_ids:
+            recipe_ids = self.update_popular_recipes()
+        return recipe_ids
+
+    def _get_recipes_ingredients(self, recipes):
+        """ {recipe_id: normalized titles of its ingredients} """
+        recipes_ingredients = {pk: '' for pk in recipes.order_by('pk').values_list('pk', flat=True)}
+        for recipe_id, title in Ingredient.objects \
+                .filter(recipe__in=recipes) \
+                .order_by('pk') \
+                .values_list('recipe_id', 'normalized_title'):
+            recipes_ingredients[recipe_id] += ' ' + title
+        return recipes_ingredients
+
+    def _create_vectorizer(self, vocabulary=None):
+        return TfidfVectorizer(analyzer='word',
+                               ngram_range=(1, 3),
+                               min_df=1,
+                               sublinear_tf=True,
+                               stop_words='english',
+                               vocabulary=vocabulary)
+
+    def _get_snapshot_path(self, version, name):
+        # next to the local copy of the neighbours index of the same version
+        return os.path.join(settings.RECOMMENDATIONS_INDEX_DIR, version, name)
+
+    def _load_snapshot(self):
+        """
+        Fitted vectorizer with the vectors of indexed recipes, saved with the current
+        version of the RecipeNeighbours table by the host which wrote it. None on other
+        hosts, their next run refits the index
+        """
+        version = RecipeNeighboursVersion().get()
+        if version is None:
+            return None
+        try:
+            with open(self._get_snapshot_path(version, 'vectorizer.json')) as f:
+                vectorizer_data = json.load(f)
+            matrix = scipy.sparse.load_npz(self._get_snapshot_path(version, 'vectors.npz'))
+            recipe_ids = np.load(self._get_snapshot_path(version, 'vector_recipe_ids.npy'))
+        except FileNotFoundError:
+            return None
+
+        vectorizer = self._create_vectorizer(vocabulary=vectorizer_data['vocabulary'])
+        vectorizer.idf_ = np.array(vectorizer_data['idf'], dtype=np.float64)
+        return {
+            'vectorizer': vectorizer,
+            'recipe_ids': recipe_ids,
+            'matrix': matrix.tocsr(),
+            'updated_at': datetime.datetime.fromisoformat(vectorizer_data['updated_at']),
+        }
+
+    def _save_snapshot(self, version, snapshot):
+        """ Vocabulary and IDF weights as JSON and vectors as .npz, so loading a snapshot runs no code """
+        os.makedirs(os.path.join(settings.RECOMMENDATIONS_INDEX_DIR, version), exist_ok=True)
+        vectorizer = snapshot['vectorizer']
+        with open(self._get_snapshot_path(version, 'vectorizer.json'), 'w') as f:
+            json.dump({
+                'vocabulary': {term: int(column) for term, column in vectorizer.vocabulary_.items()},
+                'idf': vectorizer.idf_.tolist(),
+                'updated_at': snapshot['updated_at'].isoformat(),
+            }, f)
+        scipy.sparse.save_npz(self._get_snapshot_path(version, 'vectors.npz'), snapshot['matrix'])
+        np.save(self._get_snapshot_path(version, 'vector_recipe_ids.npy'), snapshot['recipe_ids'])
+
+    def _save_neighbours(self, neighbours, snapshot, replaced_ids=None):
+        """
+        Write the RecipeNeighbours rows, all of them are replaced if replaced_ids is None,
+        and the snapshot they were calculated from under a new version of the table
+        """
+        version_cache = RecipeNeighboursVersion()
+        version = RecipeNeighboursVersion.generate()
+        if snapshot is not None:
+            self._save_snapshot(version, snapshot)
+
+        with transaction.atomic():
+            rows = RecipeNeighbours.objects.all()
+            if replaced_ids is not None:
+                rows = rows.filter(recipe_id__in=replaced_ids)
+            rows.delete()
+            RecipeNeighbours.objects.bulk_create(neighbours, batch_size=1000)
+        version_cache.set(version)
+        # snapshots of older versions are removed with their index copies
+        RecipeNeighboursIndex.save(version)
+
+    def _calculate_neighbours(self, tfidf_matrix, recipe_ids, rows):
+        """
+        Top-k neighbours for the given rows of the TF-IDF matrix.
+
+        Similarities are computed for RECOMMENDATIONS_CHUNK_SIZE rows at a time
+        with sparse products, so the N x N matrix is never materialized
+        """
+        neighbours = []
+        for start in range(0, len(rows), settings.RECOMMENDATIONS_CHUNK_SIZE):
+            chunk = rows[start:start + settings.RECOMMENDATIONS_CHUNK_SIZE]
+            # rows are L2-normalized, so their dot product is the cosine similarity
+            similarities = (tfidf_matrix[chunk] @ tfidf_matrix.T).tocsr()
+            for i, own_index in enumerate(chunk):
+                row = slice(similarities.indptr[i], similarities.indptr[i + 1])
+                neighbour_indexes, scores = self._get_top_neighbours(
+                    similarities.indices[row], similarities.data[row], own_index
+                )
+                neighbours.append(RecipeNeighbours(
+                    recipe_id=int(recipe_ids[own_index]),
+                    neighbour_ids=recipe_ids[neighbour_indexes].tolist(),
+                    scores=scores.tolist(),
+                ))
+        return neighbours
 
     def calculate_recipes_data(self):
+        """
+        Rebuild the RecipeNeighbours index from scratch: for every published recipe
+        keep only its RECOMMENDATIONS_NEIGHBOURS most similar recipes by ingredients.
+        Returns the number of indexed recipes
+        """
+        started_at = timezone.now()
+        recipes_ingredients = self._get_recipes_ingredients(
+            Recipe.objects.all().get_published_and_accepted()
+        )
 
-        recipes = Recipe.objects.all() \
-            .get_published_and_accepted() \
-            .prefetch_related('ingredients') \
-            .order_by('pk')
+        tf = self._create_vectorizer()
 
-        recipes_ingredients = {}
-        for r in recipes:
-            ingredients = ''
-            for ing in r.ingredients.all():
-                ingredients += ' ' + ing.title.lower()
-            recipes_ingredients[r.pk] = ingredients
+        recipe_ids = np.array(list(recipes_ingredients.keys()), dtype=np.int64)
+        try:
+            tfidf_matrix = tf.fit_transform(recipes_ingredients.values())
+        except ValueError:
+            # no recipes or no words to index in their ingredients
+            tfidf_matrix = None
 
-        tf = TfidfVectorizer(analyzer='word',
-                             ngram_range=(1, 3),
-                             min_df=0,
-                             sublinear_tf=True,
-                             stop_words='english')
+        neighbours = []
+        if tfidf_matrix is not None:
+            neighbours = self._calculate_neighbours(tfidf_matrix, recipe_ids, np.arange(len(recipe_ids)))
 
-        tfidf_matrix = tf.fit_transform(recipes_ingredients.values())
+        self._save_neighbours(neighbours, {
+            'vectorizer': tf,
+            'recipe_ids': recipe_ids,
+            'matrix': tfidf_matrix,
+            'updated_at': started_at,
+        } if tfidf_matrix is not None else None)
 
-        self.recipe_vectors = {}
-        for i, r in enumerate(recipes):
-            self.recipe_vectors[r.pk] = tfidf_matrix[i]
+        return len(neighbours)
 
-        self.cosine_similarities = linear_kernel(tfidf_matrix, tfidf_matrix)
+    def update_recipes_data(self):
+        """
+        Update the RecipeNeighbours index for recipes published, edited or removed
+        since the last run, reusing the vocabulary and IDF of the last full refit.
+        Only neighbour lists which can change are recalculated.
+        Returns the number of recalculated recipes
+        """
+        snapshot = self._load_snapshot()
+        if snapshot is None:
+            return self.calculate_recipes_data()
+
+        started_at = timezone.now()
+        recipe_ids = snapshot['recipe_ids']
+        tfidf_matrix = snapshot['matrix']
+
+        published = Recipe.objects.all().get_published_and_accepted()
+        published_ids = set(published.values_list('pk', flat=True))
+        indexed_ids = set(recipe_ids.tolist())
+
+        # ingredients are recreated on every recipe edit
+        changed_ids = set(
+            published.filter(
+                Q(updated_at__gte=snapshot['updated_at']) | Q(ingredients__created_at__gte=snapshot['updated_at'])
+            ).values_list('pk', flat=True)
+        ) | (published_ids - indexed_ids)
+        removed_ids = indexed_ids - published_ids
+
+        if not changed_ids and not removed_ids:
+            return 0
+
+        recipes_ingredients = self._get_recipes_ingredients(Recipe.objects.filter(pk__in=changed_ids))
+        changed = np.array(list(recipes_ingredients.keys()), dtype=np.int64)
+
+        kept = ~np.isin(recipe_ids, list(changed_ids | removed_ids))
+        recipe_ids = np.concatenate([recipe_ids[kept], changed])
+        tfidf_matrix = tfidf_matrix[kept]
+        if len(changed):
+            changed_matrix = snapshot['vectorizer'].transform(recipes_ingredients.values())
+            tfidf_matrix = scipy.sparse.vstack([tfidf_matrix, changed_matrix]).tocsr()
+
+        affected_ids = set(changed.tolist()) | set(
+            RecipeNeighbours.objects
+            .filter(neighbour_ids__overlap=list(changed_ids | removed_ids))
+            .values_list('recipe_id', flat=True)
+        )
+
+        # recipes which may get one of the changed recipes into their top-k
+        candidates = {}
+        if len(changed):
+            similarities = (tfidf_matrix @ changed_matrix.T).max(axis=1).toarray().ravel()
+            candidates = {
+                int(recipe_ids[i]): similarities[i]
+                for i in np.flatnonzero(similarities > 0)
+            }
+        for recipe_id, scores in RecipeNeighbours.objects \
+                .filter(recipe_id__in=candidates.keys()) \
+                .values_list('recipe_id', 'scores'):
+            if len(scores) < settings.RECOMMENDATIONS_NEIGHBOURS or candidates[recipe_id] > scores[-1]:
+                affected_ids.add(recipe_id)
+
+        affected_ids &= published_ids
+        neighbours = self._calculate_neighbours(
+            tfidf_matrix, recipe_ids, np.flatnonzero(np.isin(recipe_ids, list(affected_ids)))
+        )
+
+        self._save_neighbours(neighbours, {
+            'vectorizer': snapshot['vectorizer'],
+            'recipe_ids': recipe_ids,
+            'matrix': tfidf_matrix,
+            'updated_at': started_at,
+        }, replaced_ids=affected_ids | removed_ids)
+
+        return len(neighbours)
+
+    def _get_top(self, indexes, scores, k):
+        """ Top-k entries of a sparse row, highest score first """
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            indexes, scores = indexes[top], scores[top]
+
+        order = np.argsort(-scores, kind='stable')
+        return indexes[order], scores[order]
+
+    def _get_top_neighbours(self, indexes, scores, own_index):
+        """ Top-k of a sparse similarity row, most similar first, without the recipe itself """
+        mask = (indexes != own_index) & (scores > 0)
+        return self._get_top(indexes[mask], scores[mask], settings.RECOMMENDATIONS_NEIGHBOURS)
+
+    def get_neighbours(self, recipe_ids):
+        """ {recipe_id: (neighbour_ids, scores)} from the neighbours index """
+        return {
+            recipe_id: (neighbour_ids, scores)
+            for recipe_id, neighbour_ids, scores in RecipeNeighbours.objects
+            .filter(recipe_id__in=recipe_ids)
+            .values_list('recipe_id', 'neighbour_ids', 'scores')
+        }
 
-    def get_recommended(self, user_activity_recipes):
+    def get_recommended(self, activity_ids, neighbours=None, exclude_ids=(), count=None):
         """
         1. SIMILAR BY INGREDIENTS
+
+        Neighbours of all activity recipes are pooled, every candidate keeps its best score
+        and the `count` best candidates are returned, most similar first.
+        Activity recipes and `exclude_ids` are never recommended.
+        `neighbours` loaded by get_neighbours for many users at once may be passed
         """
+        count = count or settings.RECOMMENDATIONS_COUNT
+        if neighbours is None:
+            neighbours = self.get_neighbours(activity_ids)
+        interacted_ids = set(activity_ids) | set(exclude_ids)
 
-        top = []
-        for user_recipe in user_activity_recipes:
-            index = list(self.recipe_vectors.keys()).index(user_recipe.pk)  # index of cosine_similarity vector in recipe_vectors for current user recipe
-            second_max_value = np.partition(self.cosine_similarities[index], -2)[-2]
-            second_max_index_in_vector = list(self.cosine_similarities[index]).index(second_max_value)
-
-            similar_recipe_id = list(self.recipe_vectors.keys())[second_max_index_in_vector]
-
-            top.append((
-                similar_recipe_id,
-                second_max_value,
-                user_recipe.pk,
-            ))
-
-        top.sort(key=lambda x:x[1], reverse=True)
-
-        # debug info
-        for ur in user_activity_recipes:
-            logger.info(f'DEBUG: {ur}')
-        logger.info('-----------------')
-        for top_item in top[0:10]:
-            logger.info(f'DEBUG: {top_item}')
-
-        res = []
-        for r in top:
-            if r[0] not in res:
-                res.append(r[0])
-
-        return res[0:4]
-
-    def _prepare_ingredient_name(self, title):
-
-        SKIP_WORDS = [
-            'boneless',
-            'for',
-            'diced',
-            '1/2',
-            '1/3',
-            '1/4',
-            'lb',
-            'segments',
-            'sweet',
-            'to',
-            'tablespoon',
-            'cup',
-            '8s',
-            'of',
-            'to',
-            'packages',
-            'a',
-            'crusty'
-            'good',
-            'about',
-            'cups',
-            'tsp',
-            'teaspoon',
-            'toasted',
-            'crushed',
-            '¼',
-            '½',
-            '-',
-            '–',
-            '1kg'
-        ]
+        neighbour_ids, scores = [], []
+        for recipe_id in activity_ids:
+            ids, recipe_scores = neighbours.get(recipe_id, ([], []))
+            neighbour_ids += ids
+            scores += recipe_scores
+
+        neighbour_ids = np.array(neighbour_ids, dtype=np.int64)
+        scores = np.array(scores, dtype=np.float64)
+
+        mask = ~np.isin(neighbour_ids, list(interacted_ids))
+        neighbour_ids, scores = neighbour_ids[mask], scores[mask]
+
+        # best score first, so np.unique keeps it for every duplicated candidate
+        order = np.argsort(-scores, kind='stable')
+        neighbour_ids, first = np.unique(neighbour_ids[order], return_index=True)
+        scores = scores[order][first]
 
-        if ',' in title:
-            title = title.split(',')[0]
-        if '(' in title:
-            title = title.split('(')[0].strip()
+        neighbour_ids, _ = self._get_top(neighbour_ids, scores, count)
+        return neighbour_ids.tolist()
 
-        if ' or ' in title:
-            candidates = [t.lower() for t in title.split(' or ')]
+    def get_interacted_ids(self, users):
+        """
+        {user_id: {recipe_id, ...}} of all recipes `users` liked, rated, saved or viewed,
+        in one query
+        """
+        recipe_type = ContentType.objects.get_for_model(Recipe)
+        interacted = defaultdict(set)
+        for user_id, recipe_id in Like.objects \
+                .filter(user__in=users, content_type=recipe_type) \
+                .values_list('user_id', 'object_id') \
+                .union(
+                    Rating.objects.filter(user__in=users, content_type=recipe_type).values_list('user_id', 'object_id'),
+                    SavedRecipe.objects.filter(user__in=users).values_list('user_id', 'recipe_id'),
+                    UserViewHistoryRecord.objects
+                    .filter(user__in=users, recipe__isnull=False)
+                    .values_list('user_id', 'recipe_id'),
+                ):
+            interacted[user_id].add(recipe_id)
+        return interacted
+
+    def get_interactions(self, users):
+        """
+        (user_id, recipe_id, kind, value, time) records of likes, ratings,
+        saved recipes and views of `users`. Value is the rating or the number of views
+        """
+        recipe_type = ContentType.objects.get_for_model(Recipe)
+        interactions = []
+        for user_id, recipe_id, created_at in Like.objects \
+                .filter(user__in=users, content_type=recipe_type) \
+                .values_list('user_id', 'object_id', 'created_at'):
+            interactions.append((user_id, recipe_id, self.LIKE, 1, created_at))
+        for user_id, recipe_id, rating, created_at in Rating.objects \
+                .filter(user__in=users, content_type=recipe_type) \
+                .values_list('user_id', 'object_id', 'rating', 'created_at'):
+            interactions.append((user_id, recipe_id, self.RATING, rating, created_at))
+        for user_id, recipe_id, created_at in SavedRecipe.objects \
+                .filter(user__in=users) \
+                .values_list('user_id', 'recipe_id', 'created_at'):
+            interactions.append((user_id, recipe_id, self.SAVED, 1, created_at))
+        for user_id, recipe_id, count, updated_at in UserViewHistoryRecord.objects \
+                .filter(user__in=users, recipe__isnull=False) \
+                .values_list('user_id', 'recipe_id', 'count', 'updated_at'):
+            interactions.append((user_id, recipe_id, self.VIEW, count, updated_at))
+        return interactions
+
+    def _get_interaction_weight(self, kind, value):
+        weights = settings.RECOMMENDATIONS_INTERACTION_WEIGHTS
+        if kind == self.VIEW:
+            return weights[kind] * np.log1p(value)
+        if kind == self.RATING:
+            # 3 stars are neutral, low ratings push similar recipes down
+            return weights[kind] * (value - 3)
+        return weights[kind]
+
+    def get_recommended_by_interactions(self, interactions, neighbours_index, count=None):
+        """
+        2. WEIGHTED INTERACTIONS
+
+        Interactions form a sparse users x recipes matrix of weights, its product with
+        the recipes x recipes neighbours matrix scores every recipe for every user.
+        Returns {user_id: [recipe_id, ...]} without the recipes users interacted with
+        """
+        count = count or settings.RECOMMENDATIONS_COUNT
+        user_ids = sorted({user_id for user_id, *_ in interactions})
+        if not user_ids:
+            return {}
+        user_rows = {user_id: row for row, user_id in enumerate(user_ids)}
+
+        rows = np.array([user_rows[user_id] for user_id, *_ in interactions])
+        columns = neighbours_index.get_rows([recipe_id for _, recipe_id, *_ in interactions])
+        weights = np.array([self._get_interaction_weight(kind, value) for _, _, kind, value, _ in interactions])
+        # recipes missing in the index are skipped, weights of one (user, recipe) pair are summed
+        mask = columns >= 0
+        matrix = scipy.sparse.csr_matrix(
+            (weights[mask], (rows[mask], columns[mask])),
+            shape=(len(user_ids), len(neighbours_index.recipe_ids))
+        )
+        scores = (matrix @ neighbours_index.get_similarity_matrix()).tocsr()
+
+        interacted = defaultdict(set)
+        for row, column in zip(rows[mask], columns[mask]):
+            interacted[row].add(column)
+
+        recommended = {}
+        for row, user_id in enumerate(user_ids):
+            row_slice = slice(scores.indptr[row], scores.indptr[row + 1])
+            indexes, values = scores.indices[row_slice], scores.data[row_slice]
+            keep = ~np.isin(indexes, list(interacted[row])) & (values > 0)
+            indexes, _ = self._get_top(indexes[keep], values[keep], count)
+            recommended[user_id] = neighbours_index.recipe_ids[indexes].tolist()
+        return recommended
+
+    def recommend(self, users, neighbours_index=None):
+        """ {user_id: [recipe_id, ...]} for `users` by the model set in RECOMMENDATIONS_MODEL """
+        if settings.RECOMMENDATIONS_MODEL == self.INTERACTIONS_MODEL:
+            return self.get_recommended_by_interactions(
+                self.get_interactions(users),
+                neighbours_index if neighbours_index is not None else RecipeNeighboursIndex.from_table()
+            )
+
+        users_activity = self.get_users_activity(users)
+        # older interactions are not activity, but their recipes are not recommended either
+        interacted = self.get_interacted_ids(users)
+        recipe_ids = set().union(*users_activity.values())
+        if neighbours_index is not None:
+            neighbours = neighbours_index.get(recipe_ids)
         else:
-            candidates = [title.lower()]
-
-        res = []
-        for c in candidates:
-            words = [w.strip() for w in c.split() if w not in SKIP_WORDS]
-            words = [w for w in words if not w.isdigit()]
-            words = [w for w in words if len(w) > 0]
-            res.append(' '.join(words))
-        if res == ['']:
+            neighbours = self.get_neighbours(recipe_ids)
+        return {
+            user_id: self.get_recommended(activity_ids, neighbours=neighbours, exclude_ids=interacted[user_id])
+            for user_id, activity_ids in users_activity.items()
+        }
+
+
+class RecipeSamplingService:
+    """
+    Random recipes of homepage widgets, sampled from pools of candidate ids
+    kept in Redis (RecipeCandidatePool). The caller reads the sampled recipes
+    with one pk__in query
+    """
+    # the latest published recipes the latest widget samples from
+    LATEST_COUNT = 100
+
+    def get_candidates_queryset(self, name):
+        recipes = Recipe.objects.all().get_published_and_accepted()
+        if name == RecipeCandidatePool.FEATURED:
+            return recipes.filter(featured_recipe__isnull=False).order_by('pk')
+        return recipes.order_by('-created_at')[0:self.LATEST_COUNT]
+
+    def get_candidates(self, name) -> list:
+        pool = RecipeCandidatePool(name)
+        recipe_ids = pool.get()
+        if recipe_ids is None:
+            generation = pool.get_generation()
+            recipe_ids = list(self.get_candidates_queryset(name).values_list('pk', flat=True))
+            pool.set(recipe_ids, generation)
+        return recipe_ids
+
+    def sample(self, name, count) -> list:
+        recipe_ids = self.get_candidates(name)
+        return random.sample(recipe_ids, min(count, len(recipe_ids)))
+
+
+class RecipeIngredientsMatches:
+    """
+    Lazy ranked results of RecipesByIngredientsService.search: count() and slices
+    are single queries, so paginators read one page with LIMIT/OFFSET.
+
+    Recipes are read from the inverted index (CanonicalIngredient.recipe_ids), recipes
+    unpublished since they were indexed are filtered out, and their required ingredients
+    are counted from Recipe.canonical_ingredient_ids, so no Ingredient rows are scanned
+    """
+
+    def __init__(self, canonical_ids):
+        self.canonical_ids = canonical_ids
+
+    def _fetch(self, sql, **params):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql.format(recipes=f'''
+                    SELECT * FROM {Recipe._meta.db_table}
+                    WHERE id IN (
+                        SELECT unnest(recipe_ids) FROM {CanonicalIngredient._meta.db_table}
+                        WHERE id = ANY(%(canonical_ids)s)
+                    )
+                    AND publish_status = %(published)s AND status = %(accepted)s
+                    AND cardinality(canonical_ingredient_ids) > 0
+                '''),
+                {
+                    'canonical_ids': self.canonical_ids,
+                    'published': Recipe.PublishStatus.PUBLISHED,
+                    'accepted': Recipe.Status.ACCEPTED,
+                    **params,
+                }
+            )
+            return cursor.fetchall()
+
+    def count(self):
+        if not self.canonical_ids:
+            return 0
+        return self._fetch('SELECT count(*) FROM ({recipes}) AS recipe')[0][0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError('Only slices without a step are supported')
+        start, stop = key.start or 0, key.stop
+        if not self.canonical_ids or (stop is not None and stop <= start):
             return []
-        return res
+        rows = self._fetch(
+            '''
+            SELECT id, matched, required FROM (
+                SELECT recipe.id, cardinality(recipe.canonical_ingredient_ids) AS required, (
+                    SELECT count(*) FROM unnest(recipe.canonical_ingredient_ids) AS canonical_id
+                    WHERE canonical_id = ANY(%(canonical_ids)s)
+                ) AS matched
+                FROM ({recipes}) AS recipe
+            ) AS ranked
+            ORDER BY matched::float / required DESC, matched DESC, id DESC
+            LIMIT %(limit)s OFFSET %(offset)s
+            ''',
+            # coverage, then matched ingredients, then the newest
+            limit=None if stop is None else stop - start,
+            offset=start
+        )
+        return [tuple(row) for row in rows]
+
+
+class RecipesByIngredientsService:
+    """
+    Ranks published recipes by coverage: the share of their ingredients
+    found in a list of ingredients the user has
+    """
+
+    def get_canonical_ids(self, titles) -> list:
+        """ Canonical ingredients of the titles, the closest one by trigram similarity if there is no exact match """
+        titles = {normalize_ingredient_title(title) for title in titles} - {''}
+        ids = dict(CanonicalIngredient.objects.filter(title__in=titles).values_list('title', 'pk'))
+        unmatched = sorted(titles - ids.keys())
+        if unmatched:
+            # the same as CanonicalIngredient.objects.find(title).first() for each title, in one query
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'''
+                    SELECT (
+                        SELECT id FROM {CanonicalIngredient._meta.db_table}
+                        WHERE title %% unmatched.title
+                        ORDER BY similarity(title, unmatched.title) DESC LIMIT 1
+                    ) FROM unnest(%s::text[]) AS unmatched(title)
+                    ''',
+                    [unmatched]
+                )
+                ids.update({title: pk for title, (pk,) in zip(unmatched, cursor.fetchall()) if pk is not None})
+        return sorted(set(ids.values()))
+
+    def search(self, titles) -> RecipeIngredientsMatches:
+        """
+        Lazy [(recipe_id, matched, required), ...] of published recipes with at least one
+        of the ingredients, ordered by coverage, then by the number of matched ingredients
+        """
+        return RecipeIngredientsMatches(self.get_canonical_ids(titles))
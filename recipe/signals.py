@@ -1,12 +1,17 @@
 import os
 
+from django.db import transaction
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_delete
 import django
 
+from main.redis import ResponseCache
 from notifications.service import NotifyService
 
-from recipe.models import Recipe
+from recipe.models import CanonicalIngredient, Ingredient, Recipe
+from recipe.redis import RecipeCandidatePool, RecipeLeaderboards, SearchSuggestionsIndex
+from recipe.tasks import rebuild_eatchefs_search_suggestions
+from users.models import EatChefsAccount, User
 
 from utils.email import send_recipe_review_result_email, send_recipe_created_email
 
@@ -16,7 +21,7 @@ S_new_recipe_created = django.dispatch.Signal()
 @receiver(post_save, sender=Recipe)
 def notify_about_recipe_change(sender, instance, created, **kwargs):
     if not created:
-        if "status" in kwargs["update_fields"] and instance.status in [
+        if "status" in (kwargs.get('update_fields') or []) and instance.status in [
             Recipe.Status.ACCEPTED,
             Recipe.Status.REJECTED,
         ]:
@@ -28,6 +33,130 @@ def notify_about_recipe_change(sender, instance, created, **kwargs):
             )
 
 
+@receiver(post_save, sender=Recipe)
+def index_recipe_ingredients(sender, instance, created, **kwargs):
+    # ingredients are (re)linked after the recipe is saved, see CanonicalIngredientManager.link_ingredients
+    update_fields = kwargs.get('update_fields')
+    if update_fields is None or {'publish_status', 'status'} & set(update_fields):
+        transaction.on_commit(lambda: CanonicalIngredient.objects.index_recipes([instance.pk]))
+
+
+@receiver(pre_delete, sender=Recipe)
+def unindex_recipe_ingredients(sender, instance, **kwargs):
+    CanonicalIngredient.objects.unindex_recipe(instance.pk)
+
+
+@receiver(post_save, sender=Ingredient)
+def link_saved_ingredient(sender, instance, created, **kwargs):
+    # recipe serializers link new ingredients in bulk right after saving them,
+    # ingredients saved elsewhere (admin, scripts) are linked one by one
+    def link_ingredient():
+        if not instance.is_linked():
+            CanonicalIngredient.objects.link_ingredients([instance])
+
+    transaction.on_commit(link_ingredient)
+
+
+@receiver(post_delete, sender=Ingredient)
+def index_deleted_ingredient(sender, instance, **kwargs):
+    recipe_id = instance.recipe_id
+    transaction.on_commit(lambda: CanonicalIngredient.objects.index_recipes([recipe_id]))
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe_suggestions(sender, instance, created, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not {'title', 'publish_status', 'status', 'user'} & set(update_fields):
+        return
+    published = instance.publish_status == Recipe.PublishStatus.PUBLISHED \
+        and instance.status == Recipe.Status.ACCEPTED
+    pk, user_id, title = instance.pk, instance.user_id, str(instance.title) if published else None
+
+    def update_suggestions():
+        SearchSuggestionsIndex(SearchSuggestionsIndex.RECIPES).update(pk, title)
+        SearchSuggestionsIndex(SearchSuggestionsIndex.EATCHEFS_RECIPES).update(
+            pk,
+            title if user_id == EatChefsAccount.get_id() else None
+        )
+
+    # a rolled back save leaves the index as it is
+    transaction.on_commit(update_suggestions)
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe_suggestions(sender, instance, **kwargs):
+    pk = instance.pk
+
+    def remove_suggestions():
+        SearchSuggestionsIndex(SearchSuggestionsIndex.RECIPES).update(pk, None)
+        SearchSuggestionsIndex(SearchSuggestionsIndex.EATCHEFS_RECIPES).update(pk, None)
+
+    transaction.on_commit(remove_suggestions)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def rebuild_eatchefs_suggestions(sender, instance, **kwargs):
+    # recipes of the EatChefs account are indexed by the account id known when they were saved,
+    # see users.models.reset_eatchefs_account
+    if EatChefsAccount.is_related(instance):
+        transaction.on_commit(rebuild_eatchefs_search_suggestions.delay)
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_cached_responses(sender, instance, created, **kwargs):
+    if created and instance.publish_status != Recipe.PublishStatus.PUBLISHED:
+        # drafts are not shown on the homepage
+        return
+    transaction.on_commit(lambda: ResponseCache.invalidate(*ResponseCache.RECIPE_NAMES))
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_deleted_cached_responses(sender, instance, **kwargs):
+    transaction.on_commit(lambda: ResponseCache.invalidate(*ResponseCache.RECIPE_NAMES))
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_candidate_pools(sender, instance, created, **kwargs):
+    # pools keep ids of published and accepted recipes only
+    update_fields = kwargs.get('update_fields')
+    if created and instance.publish_status != Recipe.PublishStatus.PUBLISHED:
+        return
+    if update_fields is None or {'publish_status', 'status', 'created_at'} & set(update_fields):
+        transaction.on_commit(lambda: RecipeCandidatePool.invalidate(*RecipeCandidatePool.NAMES))
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_deleted_candidate_pools(sender, instance, **kwargs):
+    transaction.on_commit(lambda: RecipeCandidatePool.invalidate(*RecipeCandidatePool.NAMES))
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_leaderboards(sender, instance, created, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not {'publish_status', 'likes_number', *RecipeLeaderboards.FACETS} & set(update_fields):
+        return
+    if created and instance.publish_status != Recipe.PublishStatus.PUBLISHED:
+        # not ranked and not in the leaderboards yet
+        return
+
+    def update_leaderboards():
+        # read again, likes_number of the instance is not updated by the likes aggregation
+        recipe = Recipe.objects.filter(pk=instance.pk) \
+            .only('pk', 'publish_status', 'likes_number', *RecipeLeaderboards.FACETS).first()
+        if recipe is not None:
+            RecipeLeaderboards().update([recipe.get_leaderboard_entry()])
+
+    transaction.on_commit(update_leaderboards)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_recipe_leaderboards(sender, instance, **kwargs):
+    # the pk is cleared after the deletion
+    entry = (instance.pk, None, None)
+    transaction.on_commit(lambda: RecipeLeaderboards().update([entry]))
+
+
 @receiver(S_new_recipe_created)
 def notify_about_recipe_creation(sender, instance, **kwargs):
     NotifyService().create_notify_recipe_created(user=instance.user, recipe=instance)
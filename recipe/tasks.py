@@ -1,8 +1,11 @@
+import datetime
 import sys
 import subprocess
 from collections import defaultdict
+from celery import chord
 from main.celery_config import app
 from django.core.files import File
+from django.utils import timezone
 import os
 import tempfile
 import logging
@@ -17,45 +20,72 @@ from recipe.services import (
     RecipeViewsCalculator
 )
 from chef_pencils.services import (
+    ChefPencilRatingCalculator,
     ChefPencilRecordLikeCalculator,
     ChefPencilRecordViewsCalculator
 )
+from stats.redis import DirtyObjectsCache
 from social.models import Comment
 from recipe.services import LimitsExceededError
 from notifications.service import NotifyService
 
 from users.models import User
 
+from utils.loggers import current_func_name
 from utils.email import send_new_comments_for_recipe
 from utils.email import send_new_comments_for_chef_pencils_record
 
 from main.watermark_storage import WatermarkStorage
 from django.conf import settings
-from recipe.services import RecommendedRecipesService
+from recipe.services import RecipeNeighboursIndex, RecommendedRecipesService
+from recipe.redis import RecipeLeaderboards, RecommendationsRunCache, SearchSuggestionsIndex
+from recipe.models import Recipe
+from chef_pencils.models import ChefPencilRecord
+from users.models import EatChefsAccount
 
-import logging
-logger = logging.getLogger('django')
 
-
-@app.task(acks_late=True)
-def calculate_avg_rating_for_recipes():
-    calc = RecipeRatingCalculator()
-    calc.get_avg_ratings_for_recipes()
-    calc.update_records()
+# (model name, counter, calculator class, calculation method)
+DIRTY_COUNTERS_CALCULATORS = [
+    ('recipe', DirtyObjectsCache.RATING, RecipeRatingCalculator, 'get_avg_ratings_for_recipes'),
+    ('recipe', DirtyObjectsCache.LIKES, RecipeLikeCalculator, 'get_total_likes_for_recipes'),
+    ('recipe', DirtyObjectsCache.VIEWS, RecipeViewsCalculator, 'get_total_views_for_recipes'),
+    ('chefpencilrecord', DirtyObjectsCache.RATING, ChefPencilRatingCalculator, 'get_avg_ratings_for_chef_pencils'),
+    ('chefpencilrecord', DirtyObjectsCache.LIKES, ChefPencilRecordLikeCalculator, 'get_total_likes_for_chef_pencil_records'),
+    ('chefpencilrecord', DirtyObjectsCache.VIEWS, ChefPencilRecordViewsCalculator, 'get_total_views_for_chef_pencil_records'),
+]
 
 
 @app.task(acks_late=True)
-def calculate_likes_for_recipes():
-    calc = RecipeLikeCalculator()
-    calc.get_total_likes_for_recipes()
-    calc.update_records()
+def calculate_counters_for_changed_objects():
+    """
+    Recalculate rating, likes and views only for recipes and chef pencil records
+    that were rated, liked or viewed since the previous run
+    """
+    dirty_objects = DirtyObjectsCache()
+    for model_name, counter, calculator_class, method_name in DIRTY_COUNTERS_CALCULATORS:
+        pks = dirty_objects.pop_all(model_name, counter)
+        if not pks:
+            continue
+        try:
+            calc = calculator_class()
+            getattr(calc, method_name)(pks=pks)
+            calc.update_records()
+        except Exception:
+            # return ids back to be processed by the next run
+            dirty_objects.add(model_name, counter, *pks)
+            raise
 
 
 @app.task(acks_late=True)
-def calculate_views_for_recipes():
-    calc = RecipeViewsCalculator()
-    calc.get_total_views_for_recipes()
-    calc.update_records()
+def reconcile_counters():
+    """
+    Full recalculation of all counters to fix anything missed by
+    the incremental calculate_counters_for_changed_objects
+    """
+    for _, _, calculator_class, method_name in DIRTY_COUNTERS_CALCULATORS:
+        calc = calculator_class()
+        getattr(calc, method_name)()
+        calc.update_records()
 
 
 @app.task(acks_late=True)
@@ -223,30 +253,107 @@ def check_new_comments_for_chef_pencil_records():
         )
 
 
+@app.task(acks_late=True)
+def calculate_recipe_neighbours():
+    # full refit, keeps IDF in line with the current set of recipes
+    count = RecommendedRecipesService().calculate_recipes_data()
+    # neighbours of any recipe may change, recommendations of all users are recalculated
+    RecommendationsRunCache().reset()
+    logger.info(f'{current_func_name()}: {count} recipes indexed')
+    return count
+
+
+@app.task(acks_late=True)
+def update_recipe_neighbours():
+    count = RecommendedRecipesService().update_recipes_data()
+    logger.info(f'{current_func_name()}: {count} recipes recalculated')
+    return count
+
+
+@app.task(acks_late=True)
+def update_popular_recipes():
+    RecommendedRecipesService().update_popular_recipes()
+
+
 @app.task(acks_late=True)
 def update_recommended_recipes():
+    """
+    Shards users with new activity between update_users_recommendations subtasks,
+    each of them writes its own results. The time of the run is recorded once all
+    of them succeeded, so users of a failed shard are calculated again by the next run.
+
+    Not scheduled: recommendations are calculated on demand by PopularRecipesView,
+    the task can be run by hand to warm the cache
+    """
+    started_at = timezone.now()
+
+    user_ids = list(
+        RecommendedRecipesService()
+        .get_users_to_update(RecommendationsRunCache().get_last_run())
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+    chunk_size = settings.RECOMMENDATIONS_USERS_CHUNK_SIZE
+    chord(
+        [
+            update_users_recommendations.s(user_ids[i:i + chunk_size])
+            for i in range(0, len(user_ids), chunk_size)
+        ],
+        record_recommendations_run.s(started_at.isoformat())
+    ).apply_async()
+
+    logger.info(f'{current_func_name()}: {len(user_ids)} users dispatched')
+    return len(user_ids)
+
+
+@app.task(acks_late=True, ignore_result=False)
+def update_users_recommendations(user_ids):
+    count = RecommendedRecipesService().update_users_recommendations(
+        User.objects.filter(pk__in=user_ids),
+        neighbours_index=RecipeNeighboursIndex.load_or_save()
+    )
+    logger.info(f'{current_func_name()}: {count} users updated')
+    return count
+
 
-    rs = RecommendedRecipesService()
-    rs.calculate_recipes_data()
+@app.task(acks_late=True)
+def record_recommendations_run(counts, started_at):
+    """ Chord callback of update_recommended_recipes, not called if any of its subtasks failed """
+    RecommendationsRunCache().set_last_run(datetime.datetime.fromisoformat(started_at))
+    logger.info(f'{current_func_name()}: {sum(counts)} users updated')
 
-    users = User.objects.all().get_active().get_not_banned()
 
-    to_update = []
-    for user in users:
-        logger.info(f'DEBUG: {user}')
+@app.task(acks_late=True)
+def rebuild_search_suggestions():
+    """ Rebuild suggestion indexes from scratch, they are updated incrementally by signals in between """
+    recipes = Recipe.objects.all().get_published_and_accepted()
+    SearchSuggestionsIndex(SearchSuggestionsIndex.RECIPES).rebuild(
+        recipes.values_list('pk', 'title').iterator()
+    )
+    rebuild_eatchefs_search_suggestions()
+    SearchSuggestionsIndex(SearchSuggestionsIndex.CHEF_PENCILS).rebuild(
+        ChefPencilRecord.objects.values_list('pk', 'title').iterator()
+    )
 
-        ur = rs.get_recipes_related_to_user_activity(user=user)
-        logger.info(f'DEBUG: {ur}')
 
-        if ur.count() > 0:
-            recommended = rs.get_recommended(user_activity_recipes=ur)
-            logger.info(f'DEBUG: recommended {recommended}')
+@app.task(acks_late=True)
+def rebuild_eatchefs_search_suggestions():
+    """ Rebuild suggestions of EatChefs recipes, queued when the EatChefs account changes """
+    # the account was changed by another process, its id cached by this one may be stale
+    EatChefsAccount.reset()
+    SearchSuggestionsIndex(SearchSuggestionsIndex.EATCHEFS_RECIPES).rebuild(
+        Recipe.objects.all().get_published_and_accepted()
+        .filter(user_id=EatChefsAccount.get_id())
+        .values_list('pk', 'title').iterator()
+    )
 
-            user.recommended_recipes = recommended
-            to_update.append(user)
 
-    User.objects.bulk_update(
-        to_update,
-        ['recommended_recipes'],
-        batch_size=100
-    )
\ No newline at end of file
+@app.task(acks_late=True)
+def rebuild_recipe_leaderboards():
+    """ Rebuild leaderboards from scratch, scores and membership are updated incrementally in between """
+    recipes = Recipe.objects.all().get_published() \
+        .values_list('pk', 'likes_number', *RecipeLeaderboards.FACETS)
+    RecipeLeaderboards().rebuild(
+        (pk, likes_number, dict(zip(RecipeLeaderboards.FACETS, facets)))
+        for pk, likes_number, *facets in recipes.iterator()
+    )
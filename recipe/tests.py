@@ -1,35 +1,56 @@
 import copy
 import json
+import os
 import random
 import re
 import shutil
+import tempfile
+from io import StringIO
 from pathlib import Path
 from pprint import pprint
+from unittest import mock
 
 from celery.utils.functional import first
 from django.conf import settings
 from django.core import mail
+from django.core.management import call_command
 from django.core.files import File
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from main.celery_config import app
+from main.redis import ResponseCache
 from main.utils.test import IsAuthClientTestCase, TestDataService
 from rest_framework import status
 from rest_framework.reverse import reverse
+from rest_framework.test import APIRequestFactory
 from site_settings.models import (Banner, FeaturedRecipe, HomepagePinnedRecipe,
                                   MealOfTheWeekRecipe, ParserData,
                                   TopRatedRecipe)
 from social.models import Comment, CommentLike, Like, Rating
 from users.enums import UserTypes
-from users.models import User
+from users.models import EatChefsAccount, User, UserViewHistoryRecord
 from utils.helper import strip_links
 from utils.test import get_alt_test_files, get_test_files, get_test_video_file
 
 from recipe.enums import (CookingMethods, CookingSkills, Cuisines, Diets,
                           RecipeTypes, Units)
 from recipe.management.commands.add_recipes import RecipeCreator
-from recipe.models import (Ingredient, Recipe, RecipeImage, RecipeStep,
-                           RecipeVideo, SavedRecipe, Tag, TagRecipeRelation)
-from recipe.services import LimitsExceededError, RecipeApiParser
-from recipe.tasks import (calculate_avg_rating_for_recipes,
-                          calculate_likes_for_recipes)
+from recipe.models import (CanonicalIngredient, Ingredient, Recipe,
+                           RecipeImage, RecipeNeighbours, RecipeStep,
+                           RecipeVideo, SavedRecipe, Tag, TagRecipeRelation,
+                           normalize_ingredient_title)
+from recipe.redis import (RecipeCandidatePool, RecipeLeaderboards, RecipeNeighboursVersion,
+                          RecommendationsCache, RecommendationsRunCache, SearchSuggestionsIndex)
+from recipe.serializers import RecipeSerializer, SavedRecipeSerializer
+from recipe.services import (LimitsExceededError, RecipeApiParser, RecipesByIngredientsService,
+                             RecipeNeighboursIndex, RecommendedRecipesService)
+from recipe.tasks import (calculate_counters_for_changed_objects,
+                          rebuild_eatchefs_search_suggestions,
+                          rebuild_recipe_leaderboards, rebuild_search_suggestions,
+                          reconcile_counters, update_popular_recipes,
+                          update_recommended_recipes, update_users_recommendations)
 
 DESCRIPTION = """
 Wash hands with soap and water.
@@ -60,6 +81,15 @@ class RecipeTestCase(IsAuthClientTestCase):
             "publish_status": Recipe.PublishStatus.PUBLISHED
         }
 
+        # local copies of the neighbours index are not shared between tests
+        self.index_dir_settings = override_settings(RECOMMENDATIONS_INDEX_DIR=tempfile.mkdtemp())
+        self.index_dir_settings.enable()
+
+    def tearDown(self):
+        shutil.rmtree(settings.RECOMMENDATIONS_INDEX_DIR, ignore_errors=True)
+        self.index_dir_settings.disable()
+        super().tearDown()
+
     def _create_recipe(self, data, images=None, main_image=None):
 
         if images is not None:
@@ -934,26 +964,27 @@ class RecipeTestCase(IsAuthClientTestCase):
 
         ratings1 = [3,4,3]
         ratings2 = [5,5,4]
-        for i in range(3):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
 
-            user = self.create_random_user(extra_fields={'is_email_active': True})
-            client = self.create_client_with_auth(user)
+                user = self.create_random_user(extra_fields={'is_email_active': True})
+                client = self.create_client_with_auth(user)
 
-            response = client.post(
-                reverse('recipe:recipe_rate', args=[recipe1.pk]),
-                data={'rating': ratings1[i]}
-            )
-            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                response = client.post(
+                    reverse('recipe:recipe_rate', args=[recipe1.pk]),
+                    data={'rating': ratings1[i]}
+                )
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
-            response = client.post(
-                reverse('recipe:recipe_rate', args=[recipe2.pk]),
-                data={'rating': ratings2[i]}
-            )
-            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                response = client.post(
+                    reverse('recipe:recipe_rate', args=[recipe2.pk]),
+                    data={'rating': ratings2[i]}
+                )
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
         self.assertEqual(Rating.objects.filter(content_type__model='recipe').count(), 6)
 
-        calculate_avg_rating_for_recipes()
+        calculate_counters_for_changed_objects()
 
         recipe = Recipe.objects.get(pk=recipe1.pk)
         self.assertEqual(recipe.avg_rating, 3.3)
@@ -967,43 +998,44 @@ class RecipeTestCase(IsAuthClientTestCase):
         recipe1 = Recipe.objects.all().order_by('pk')[0]
         recipe2 = Recipe.objects.all().order_by('pk')[1]
 
-        for i in range(3):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
 
-            user = self.create_random_user(extra_fields={'is_email_active': True})
-            client = self.create_client_with_auth(user)
+                user = self.create_random_user(extra_fields={'is_email_active': True})
+                client = self.create_client_with_auth(user)
 
-            # like #1
+                # like #1
 
-            response = client.get(reverse('recipe:recipe_retrieve_update_destroy', args=[recipe1.pk]))
-            self.assertEqual(response.status_code, status.HTTP_200_OK)
-            self.assertFalse(response.data['user_liked'])
+                response = client.get(reverse('recipe:recipe_retrieve_update_destroy', args=[recipe1.pk]))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertFalse(response.data['user_liked'])
 
-            response = client.post(
-                reverse('recipe:recipe_like', args=[recipe1.pk])
-            )
-            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-            self.assertEqual(response.data['like_status'], 'created')
+                response = client.post(
+                    reverse('recipe:recipe_like', args=[recipe1.pk])
+                )
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                self.assertEqual(response.data['like_status'], 'created')
 
-            response = client.get(reverse('recipe:recipe_retrieve_update_destroy', args=[recipe1.pk]))
-            self.assertEqual(response.status_code, status.HTTP_200_OK)
-            self.assertTrue(response.data['user_liked'])
+                response = client.get(reverse('recipe:recipe_retrieve_update_destroy', args=[recipe1.pk]))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertTrue(response.data['user_liked'])
 
-            # anonymous client has no likes
+                # anonymous client has no likes
 
-            response = self.anonymous_client.get(reverse('recipe:recipe_retrieve_update_destroy', args=[recipe1.pk]))
-            self.assertEqual(response.status_code, status.HTTP_200_OK)
-            self.assertFalse(response.data['user_liked'])
+                response = self.anonymous_client.get(reverse('recipe:recipe_retrieve_update_destroy', args=[recipe1.pk]))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertFalse(response.data['user_liked'])
 
-            # like #2
+                # like #2
 
-            response = client.post(
-                reverse('recipe:recipe_like', args=[recipe2.pk])
-            )
-            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                response = client.post(
+                    reverse('recipe:recipe_like', args=[recipe2.pk])
+                )
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
         self.assertEqual(Like.objects.count(), 6)
 
-        calculate_likes_for_recipes()
+        calculate_counters_for_changed_objects()
 
         recipe = Recipe.objects.get(pk=recipe1.pk)
         self.assertEqual(recipe.likes_number, 3)
@@ -1011,6 +1043,52 @@ class RecipeTestCase(IsAuthClientTestCase):
         recipe = Recipe.objects.get(pk=recipe2.pk)
         self.assertEqual(recipe.likes_number, 3)
 
+    def test_calculate_counters_for_changed_objects(self):
+        recipe1 = Recipe.objects.create(**self.BASIC_TEST_DATA)
+        recipe2 = Recipe.objects.create(**self.BASIC_TEST_DATA)
+
+        # counters left from other runs should not affect this one
+        calculate_counters_for_changed_objects()
+
+        # objects are marked dirty once the change is committed
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('recipe:recipe_like', args=[recipe1.pk]))
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            response = self.client.post(
+                reverse('recipe:recipe_rate', args=[recipe1.pk]),
+                data={'rating': 4}
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            response = self.anonymous_client.get(
+                reverse('recipe:recipe_retrieve_update_destroy', args=[recipe1.pk]))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # recipe2 is not changed and should not be touched
+        Recipe.objects.filter(pk=recipe2.pk).update(likes_number=10)
+
+        calculate_counters_for_changed_objects()
+
+        recipe = Recipe.objects.get(pk=recipe1.pk)
+        self.assertEqual(recipe.likes_number, 1)
+        self.assertEqual(recipe.avg_rating, 4)
+        self.assertEqual(recipe.views_number, 1)
+        self.assertEqual(Recipe.objects.get(pk=recipe2.pk).likes_number, 10)
+
+        # unlike resets the counter
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('recipe:recipe_like', args=[recipe1.pk]))
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        calculate_counters_for_changed_objects()
+        self.assertEqual(Recipe.objects.get(pk=recipe1.pk).likes_number, 0)
+
+        # nightly reconciliation restores values changed without tracking
+        Recipe.objects.filter(pk=recipe1.pk).update(avg_rating=None, views_number=0)
+        reconcile_counters()
+        recipe = Recipe.objects.get(pk=recipe1.pk)
+        self.assertEqual(recipe.avg_rating, 4)
+        self.assertEqual(recipe.views_number, 1)
+
     def test_unlike_recipe(self):
 
         user = self.create_random_user(extra_fields={'is_email_active': True})
@@ -1041,20 +1119,21 @@ class RecipeTestCase(IsAuthClientTestCase):
             recipes.append(Recipe.objects.create(**data))
 
         ratings = [3, 3, 3, 4, 4, 4, 5, 5, 5]
-        for i in range(9):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(9):
 
-            user = self.create_random_user(extra_fields={'is_email_active': True})
-            client = self.create_client_with_auth(user)
+                user = self.create_random_user(extra_fields={'is_email_active': True})
+                client = self.create_client_with_auth(user)
 
-            response = client.post(
-                reverse('recipe:recipe_rate', args=[recipes[int(i / 3)].pk]),
-                data={'rating': ratings[i]}
-            )
-            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                response = client.post(
+                    reverse('recipe:recipe_rate', args=[recipes[int(i / 3)].pk]),
+                    data={'rating': ratings[i]}
+                )
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
         self.assertEqual(Rating.objects.count(), 9)
 
-        calculate_avg_rating_for_recipes()
+        calculate_counters_for_changed_objects()
 
         # 2. test
 
@@ -1078,6 +1157,75 @@ class RecipeTestCase(IsAuthClientTestCase):
         self.assertEqual(response.data[2]['pk'], recipes[0].pk)
         """
 
+    def test_recipe_leaderboards(self):
+        cuisine = Cuisines.INDIAN.value
+        recipes = []
+        for diets in [[Diets.VEGAN.value], [Diets.VEGAN.value, Diets.GLUTEN_FREE.value], [], []]:
+            data = copy.deepcopy(self.BASIC_TEST_DATA)
+            data.update({'cuisines': [cuisine], 'diet_restrictions': diets})
+            recipes.append(Recipe.objects.create(**data))
+        recipes[3].publish_status = Recipe.PublishStatus.NOT_PUBLISHED
+        recipes[3].save()
+
+        # the first read queues the rebuild, reads are served from the database until it is done
+        with mock.patch('recipe.views.rebuild_recipe_leaderboards.delay') as delay:
+            for diet, count in [(Diets.VEGAN.value, 2), (Diets.GLUTEN_FREE.value, 1)]:
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.anonymous_client.get(
+                        reverse('recipe:recipe_favorite_cuisines'), {'diet': diet})
+                self.assertEqual(len(response.data), count)
+        delay.assert_called_once_with()
+        self.assertFalse(RecipeLeaderboards().is_built())
+
+        rebuild_recipe_leaderboards()
+        self.assertTrue(RecipeLeaderboards().is_built())
+        self.assertEqual(
+            RecipeLeaderboards().get_top('cuisines', cuisine, 10),
+            [recipes[2].pk, recipes[1].pk, recipes[0].pk]
+        )
+
+        # scores are updated by the likes aggregation
+        calculate_counters_for_changed_objects()
+        with self.captureOnCommitCallbacks(execute=True):
+            for recipe, likes in [(recipes[0], 2), (recipes[1], 1), (recipes[3], 3)]:
+                for _ in range(likes):
+                    client = self.create_client_with_auth(self.create_random_user())
+                    response = client.post(reverse('recipe:recipe_like', args=[recipe.pk]))
+                    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        calculate_counters_for_changed_objects()
+        self.assertEqual(
+            RecipeLeaderboards().get_top('cuisines', cuisine, 10),
+            [recipes[0].pk, recipes[1].pk, recipes[2].pk]
+        )
+
+        # recipes, their users and images
+        with self.assertNumQueries(2):
+            response = self.anonymous_client.get(reverse('recipe:recipe_favorite_cuisines'), {'cuisine': cuisine})
+        self.assertEqual([r['pk'] for r in response.data], [recipes[0].pk, recipes[1].pk, recipes[2].pk])
+        response = self.anonymous_client.get(
+            reverse('recipe:recipe_favorite_cuisines'), {'diet': Diets.GLUTEN_FREE.value}
+        )
+        self.assertEqual([r['pk'] for r in response.data], [recipes[1].pk])
+        response = self.anonymous_client.get(reverse('recipe:recipe_favorite_cuisines'), {'diet': 1000})
+        self.assertEqual(response.data, [])
+
+        # membership follows publishing and facets
+        recipes[0].diet_restrictions = [Diets.GLUTEN_FREE.value]
+        recipes[3].publish_status = Recipe.PublishStatus.PUBLISHED
+        with self.captureOnCommitCallbacks(execute=True):
+            recipes[0].save()
+            recipes[3].save()
+            recipes[1].delete()
+        self.assertEqual(
+            RecipeLeaderboards().get_top('cuisines', cuisine, 10),
+            [recipes[3].pk, recipes[0].pk, recipes[2].pk]
+        )
+        self.assertEqual(RecipeLeaderboards().get_top('diet_restrictions', Diets.VEGAN.value, 10), [])
+        response = self.anonymous_client.get(
+            reverse('recipe:recipe_favorite_cuisines'), {'diet': Diets.GLUTEN_FREE.value}
+        )
+        self.assertEqual([r['pk'] for r in response.data], [recipes[0].pk])
+
     def test_homepage_banners(self):
 
         files = get_test_files()
@@ -1104,6 +1252,55 @@ class RecipeTestCase(IsAuthClientTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 3)
 
+    def test_homepage_response_cache(self):
+        recipe = Recipe.objects.create(**copy.deepcopy(self.BASIC_TEST_DATA))
+        HomepagePinnedRecipe.objects.create(recipe=recipe)
+
+        response = self.anonymous_client.get(reverse('recipe:recipe_pinned'))
+        self.assertEqual([r['pk'] for r in response.data], [recipe.pk])
+
+        # served from the cache
+        with self.assertNumQueries(0):
+            response = self.anonymous_client.get(reverse('recipe:recipe_pinned'))
+        self.assertEqual([r['pk'] for r in response.data], [recipe.pk])
+        self.assertEqual(
+            ResponseCache.get_stats()[ResponseCache.PINNED_RECIPES],
+            {'requests': 2, 'hits': 1, 'misses': 1}
+        )
+
+        # invalidated after a change of the pinned recipes or of a recipe
+        other_recipe = Recipe.objects.create(**copy.deepcopy(self.BASIC_TEST_DATA))
+        with self.captureOnCommitCallbacks(execute=True):
+            HomepagePinnedRecipe.objects.create(recipe=other_recipe)
+        response = self.anonymous_client.get(reverse('recipe:recipe_pinned'))
+        self.assertEqual({r['pk'] for r in response.data}, {recipe.pk, other_recipe.pk})
+
+        recipe.title = 'Pinned Soup'
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+        response = self.anonymous_client.get(reverse('recipe:recipe_pinned'))
+        self.assertIn('Pinned Soup', [r['title'] for r in response.data])
+
+        # other endpoints and their params are cached separately
+        response = self.anonymous_client.get(reverse('recipe:recipe_favorite_cuisines'), {'cuisine': 'x'})
+        self.assertEqual(response.data, [])
+        response = self.anonymous_client.get(
+            reverse('recipe:recipe_favorite_cuisines'), {'cuisine': recipe.cuisines[0], 'page': 2}
+        )
+        self.assertEqual(len(response.data), 2)
+        with self.assertNumQueries(0):
+            response = self.anonymous_client.get(
+                reverse('recipe:recipe_favorite_cuisines'), {'cuisine': recipe.cuisines[0]}
+            )
+        self.assertEqual(len(response.data), 2)
+
+        # not shared, user flags are rendered
+        MealOfTheWeekRecipe.objects.create(recipe=recipe)
+        for _ in range(2):
+            response = self.client.get(reverse('recipe:meal_of_the_week'))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(ResponseCache.get_stats()[ResponseCache.MEAL_OF_THE_WEEK]['requests'], 0)
+
     def test_meal_of_the_weak(self):
         for _ in range(5):
             data = copy.deepcopy(self.BASIC_TEST_DATA)
@@ -1118,6 +1315,55 @@ class RecipeTestCase(IsAuthClientTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
 
+    def test_retrieve_recipe_num_queries(self):
+        data = copy.deepcopy(self.BASIC_TEST_DATA)
+        recipe = Recipe.objects.create(**data)
+
+        for i in range(3):
+            # recipe, stats upsert, images, steps, ingredients
+            with self.assertNumQueries(5):
+                response = self.anonymous_client.get(
+                    reverse('recipe:recipe_retrieve_update_destroy', args=[recipe.pk]))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data['steps']), i)
+            self.assertEqual(len(response.data['ingredients']), i)
+
+            RecipeStep.objects.create(recipe=recipe, num=i + 1, title=f'Step {i}', description='test')
+            Ingredient.objects.create(recipe=recipe, title=f'Ingredient {i}', quantity=1)
+            RecipeImage.objects.create(recipe=recipe, user=self.home_chef_user)
+
+    def test_save_only_changed_fields(self):
+        data = copy.deepcopy(self.BASIC_TEST_DATA)
+        data['status'] = Recipe.Status.AWAITING_ACCEPTANCE
+        recipe = Recipe.objects.get(pk=Recipe.objects.create(**data).pk)
+        mail.outbox = []
+
+        with self.assertNumQueries(0):
+            recipe.save()
+
+        recipe.status = Recipe.Status.ACCEPTED
+        recipe.cuisines.append(Cuisines.INDIAN.value)
+        with CaptureQueriesContext(connection) as queries:
+            recipe.save()
+
+        # no re-read of the recipe, only changed and auto_now fields are updated
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT "recipe_recipe"')])
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "recipe_recipe"')]
+        self.assertEqual(len(updates), 1)
+        self.assertRegex(updates[0], r'SET "cuisines" = .*, "status" = .*, "updated_at" = .* WHERE')
+        self.assertNotIn('"title"', updates[0])
+
+        # notify_about_recipe_change received 'status' in update_fields
+        self.assertEqual(len(mail.outbox), 1)
+
+        # refreshed values are not changes, the status is not notified again
+        Recipe.objects.filter(pk=recipe.pk).update(status=Recipe.Status.REJECTED)
+        for fields in [['status'], None]:
+            recipe.refresh_from_db(fields=fields)
+            with self.assertNumQueries(0):
+                recipe.save()
+        self.assertEqual(len(mail.outbox), 1)
+
     def test_top_rated_meals(self):
 
         for _ in range(5):
@@ -1141,10 +1387,11 @@ class RecipeTestCase(IsAuthClientTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 0)
 
-        for _ in range(3):
-            data = copy.deepcopy(self.BASIC_TEST_DATA)
-            recipe = Recipe.objects.create(**data)
-            FeaturedRecipe.objects.create(recipe=recipe)
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                data = copy.deepcopy(self.BASIC_TEST_DATA)
+                recipe = Recipe.objects.create(**data)
+                FeaturedRecipe.objects.create(recipe=recipe)
 
         self.assertEqual(FeaturedRecipe.objects.count(), 3)
 
@@ -1154,10 +1401,11 @@ class RecipeTestCase(IsAuthClientTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 3)  # random
 
-        for _ in range(3):
-            data = copy.deepcopy(self.BASIC_TEST_DATA)
-            recipe = Recipe.objects.create(**data)
-            FeaturedRecipe.objects.create(recipe=recipe)
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                data = copy.deepcopy(self.BASIC_TEST_DATA)
+                recipe = Recipe.objects.create(**data)
+                FeaturedRecipe.objects.create(recipe=recipe)
 
         response = self.client.get(
             reverse('recipe:recipe_featured'),
@@ -1165,6 +1413,47 @@ class RecipeTestCase(IsAuthClientTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 5)  # random
 
+    def test_featured_candidate_pool(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipes = [Recipe.objects.create(**copy.deepcopy(self.BASIC_TEST_DATA)) for _ in range(7)]
+            for recipe in recipes[:6]:
+                FeaturedRecipe.objects.create(recipe=recipe)
+
+        response = self.anonymous_client.get(reverse('recipe:recipe_featured'))
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(
+            sorted(RecipeCandidatePool(RecipeCandidatePool.FEATURED).get()),
+            [recipe.pk for recipe in recipes[:6]]
+        )
+
+        # sampled from the pool: recipes and their images
+        with self.assertNumQueries(2):
+            response = self.anonymous_client.get(reverse('recipe:recipe_featured'))
+        self.assertEqual(len(response.data), 5)
+        self.assertTrue({r['pk'] for r in response.data} <= {recipe.pk for recipe in recipes[:6]})
+
+        # rejected recipes and removed featured recipes leave the pool
+        recipes[0].status = Recipe.Status.REJECTED
+        with self.captureOnCommitCallbacks(execute=True):
+            recipes[0].save()
+            FeaturedRecipe.objects.filter(recipe=recipes[1]).delete()
+        response = self.anonymous_client.get(reverse('recipe:recipe_featured'))
+        self.assertEqual({r['pk'] for r in response.data}, {recipe.pk for recipe in recipes[2:6]})
+
+        response = self.anonymous_client.get(reverse('recipe:recipe_latest'))
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(
+            RecipeCandidatePool(RecipeCandidatePool.LATEST).get(),
+            list(Recipe.objects.exclude(pk=recipes[0].pk).order_by('-created_at').values_list('pk', flat=True))
+        )
+
+        # a pool read before an invalidation is not stored
+        pool = RecipeCandidatePool(RecipeCandidatePool.LATEST)
+        generation = pool.get_generation()
+        RecipeCandidatePool.invalidate(RecipeCandidatePool.LATEST)
+        self.assertFalse(pool.set([recipes[0].pk], generation))
+        self.assertIsNone(pool.get())
+
     def test_create_comments_and_comment_likes(self):
         Recipe.objects.create(**self.BASIC_TEST_DATA)
         recipe1 = Recipe.objects.all().order_by('pk')[0]
@@ -1267,6 +1556,7 @@ class RecipeTestCase(IsAuthClientTestCase):
         self.assertEqual(CommentLike.objects.filter(is_dislike=True).count(), 1)
 
     def test_search_suggestions(self):
+        SearchSuggestionsIndex(SearchSuggestionsIndex.RECIPES).reset()
 
         titles = [
             ('Thai Coconut Curry Soup', 3,),
@@ -1276,10 +1566,11 @@ class RecipeTestCase(IsAuthClientTestCase):
         ]
 
         recipes = []
-        for info in titles:
-            data = copy.deepcopy(self.BASIC_TEST_DATA)
-            data.update({'title': [info[0]], 'avg_rating': info[1]})
-            recipes.append(Recipe.objects.create(**data))
+        with self.captureOnCommitCallbacks(execute=True):
+            for info in titles:
+                data = copy.deepcopy(self.BASIC_TEST_DATA)
+                data.update({'title': [info[0]], 'avg_rating': info[1]})
+                recipes.append(Recipe.objects.create(**data))
 
         response = self.anonymous_client.get(
             reverse('recipe:search_suggestions'),
@@ -1307,8 +1598,133 @@ class RecipeTestCase(IsAuthClientTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['count'], 2)
 
+    def test_search_suggestions_index(self):
+        index = SearchSuggestionsIndex(SearchSuggestionsIndex.RECIPES)
+        index.reset()
+        with self.captureOnCommitCallbacks(execute=True):
+            soup = Recipe.objects.create(**{**self.BASIC_TEST_DATA, 'title': 'Thai Curry Soup'})
+            Recipe.objects.create(**{**self.BASIC_TEST_DATA, 'title': 'Red Lentil Curry Soup!'})
+            Recipe.objects.create(**{**self.BASIC_TEST_DATA, 'title': 'Thai Curry Noodles'})
+            Recipe.objects.create(**{**self.BASIC_TEST_DATA, 'title': 'Curry Cake', 'status': Recipe.Status.REJECTED})
+
+        # more common phrases first
+        self.assertEqual(index.get('CURRY'), ['curry soup', 'curry noodles'])
+        self.assertEqual(index.get('thai cu'), ['thai curry noodles', 'thai curry soup'])
+        self.assertEqual(index.get('noodles'), ['noodles'])
+        self.assertEqual(index.get('urry'), [])
+
+        # the index is updated once the changes are committed
+        with self.captureOnCommitCallbacks(execute=True):
+            soup.title = 'Thai Curry Broth'
+            soup.save()
+            self.assertEqual(index.get('curry'), ['curry soup', 'curry noodles'])
+        self.assertEqual(index.get('curry'), ['curry broth', 'curry noodles', 'curry soup'])
+        with self.captureOnCommitCallbacks(execute=True):
+            soup.delete()
+        self.assertEqual(index.get('curry'), ['curry noodles', 'curry soup'])
+
+        index.reset()
+        self.assertEqual(index.get('curry'), [])
+        rebuild_search_suggestions()
+        self.assertEqual(index.get('curry'), ['curry noodles', 'curry soup'])
+
+        # suggestions of EatChefs recipes are rebuilt when the account changes
+        EatChefsAccount.reset()
+        self.addCleanup(EatChefsAccount.reset)
+        eatchefs_index = SearchSuggestionsIndex(SearchSuggestionsIndex.EATCHEFS_RECIPES)
+        eatchefs_index.reset()
+        account = User.objects.get(full_name=settings.EATCHEFS_ACCOUNT_NAME, is_staff=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.create(**{**self.BASIC_TEST_DATA, 'user': account, 'title': 'Curry Pie'})
+        self.assertEqual(eatchefs_index.get('curry'), ['curry pie'])
+        with mock.patch.object(rebuild_eatchefs_search_suggestions, 'delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                account.full_name = 'Not EatChefs'
+                account.save()
+        delay.assert_called_once_with()
+        rebuild_eatchefs_search_suggestions()
+        self.assertEqual(eatchefs_index.get('curry'), [])
+
+    def test_ranked_title_search(self):
+        recipes = []
+        for title, description, ingredient in [
+            ('Rice Bowl', 'Cook the rice', '2 tbsp curry paste'),
+            ('Chicken Soup', 'A soup with mild curry flavour', 'chicken'),
+            ('Green Curry', 'Simmer the vegetables', 'coconut milk'),
+            ('Beef Curry', 'Simmer the beef', 'beef'),
+        ]:
+            recipe = Recipe.objects.create(**{**self.BASIC_TEST_DATA, 'title': title, 'description': description})
+            Ingredient.objects.create(recipe=recipe, title=ingredient, quantity=1)
+            recipes.append(recipe)
+
+        # title matches first, then description and ingredient ones, web search syntax excludes words
+        expected = [recipes[2].pk, recipes[1].pk, recipes[0].pk]
+        response = self.anonymous_client.get(reverse('recipe:recipe_list_create'), {'title': 'curry -beef'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['pk'] for r in response.data['results']], expected)
+        self.assertEqual(response.data['results'][1]['search_headline'], 'A soup with mild <b>curry</b> flavour')
+
+        pks, cursor = [], ''
+        while cursor is not None:
+            response = self.anonymous_client.get(
+                reverse('recipe:recipe_list_create'),
+                {'title': 'curry -beef', 'cursor': cursor, 'page_size': 1}
+            )
+            pks += [r['pk'] for r in response.data['results']]
+            cursor = response.data['next']
+        self.assertEqual(pks, expected)
+
+    def test_list_recipes_with_cursor(self):
+        EatChefsAccount.reset()
+        eatchefs_user = User.objects.get(pk=EatChefsAccount.get_id())
+        for i in range(7):
+            data = copy.deepcopy(self.BASIC_TEST_DATA)
+            data.update({
+                'user': eatchefs_user if i % 2 else self.home_chef_user,
+                'likes_number': i % 3
+            })
+            Recipe.objects.create(**data)
+
+        # users' recipes go first, ordered by likes
+        response = self.anonymous_client.get(reverse('recipe:recipe_list_create'), {'page_size': 100})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = [r['pk'] for r in response.data['results']]
+        self.assertEqual(
+            [r['user']['pk'] for r in response.data['results']],
+            [self.home_chef_user.pk] * 4 + [eatchefs_user.pk] * 3
+        )
+
+        pks, cursor = [], ''
+        while cursor is not None:
+            # no COUNT and no OFFSET, every page takes the same queries
+            with self.assertNumQueries(2):  # recipes + images
+                response = self.anonymous_client.get(
+                    reverse('recipe:recipe_list_create'),
+                    {'cursor': cursor, 'page_size': 2}
+                )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pks += [r['pk'] for r in response.data['results']]
+            cursor = response.data['next']
+        self.assertEqual(pks, expected)
+
+        response = self.anonymous_client.get(
+            reverse('recipe:recipe_list_create'),
+            {'cursor': '', 'page_size': 3, 'ordering': '-created_at'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.anonymous_client.get(
+            reverse('recipe:recipe_list_create'),
+            {'cursor': response.data['next'], 'page_size': 3, 'ordering': '-created_at'}
+        )
+        self.assertEqual(
+            [r['pk'] for r in response.data['results']],
+            list(Recipe.objects.order_by('-created_at', '-pk').values_list('pk', flat=True)[3:6])
+        )
+
     def test_popular_recipes(self):
         recipes = []
+        # no recommendations for the user
+        RecommendationsCache().set_user(self.user.pk, [], 60)
 
         response = self.client.get(
             reverse('recipe:recipe_popular'),
@@ -1325,6 +1741,7 @@ class RecipeTestCase(IsAuthClientTestCase):
                 'avg_rating': 4 + i / 10
             })
             recipes.append(Recipe.objects.create(**data))
+        update_popular_recipes()
 
         response = self.client.get(
             reverse('recipe:recipe_popular'),
@@ -1340,6 +1757,319 @@ class RecipeTestCase(IsAuthClientTestCase):
         self.assertEqual(response.data[3]['pk'], recipes[-4].pk)
         """
 
+    def test_normalize_ingredient_title(self):
+        self.assertEqual(normalize_ingredient_title('2 1/2 cups boneless chicken breast (skinless), diced'), 'chicken breast')
+        self.assertEqual(normalize_ingredient_title('Olive oil (extra virgin) or butter'), 'olive oil butter')
+        self.assertEqual(normalize_ingredient_title('½ tsp salt'), 'salt')
+        self.assertEqual(normalize_ingredient_title('1kg potatoes'), 'potatoes')
+
+        recipe = Recipe.objects.create(**self.BASIC_TEST_DATA)
+        ingredient = Ingredient.objects.create(recipe=recipe, title='3 large cloves garlic, minced', quantity=1)
+        self.assertEqual(Ingredient.objects.get(pk=ingredient.pk).normalized_title, 'garlic')
+
+    def test_canonical_ingredients(self):
+        recipe = Recipe.objects.create(**self.BASIC_TEST_DATA)
+        garlic = Ingredient.objects.create(recipe=recipe, title='3 cloves garlic, minced', quantity=1)
+        Ingredient.objects.create(recipe=recipe, title='2 tbsp olive oil', quantity=2)
+        Ingredient.objects.create(recipe=recipe, title='1 tsp', quantity=1)
+
+        out = StringIO()
+        call_command('link_canonical_ingredients', stdout=out)
+        self.assertIn('2 ingredients linked', out.getvalue())
+
+        # ingredients with the same normalized title share the canonical one
+        ingredients = [
+            Ingredient.objects.create(recipe=recipe, title='Garlic (peeled)', quantity=1),
+            Ingredient.objects.create(recipe=recipe, title='fresh basil', quantity=1),
+        ]
+        with self.assertNumQueries(3):
+            CanonicalIngredient.objects.link_ingredients(ingredients)
+        self.assertEqual(ingredients[0].canonical_id, Ingredient.objects.get(pk=garlic.pk).canonical_id)
+        self.assertEqual(CanonicalIngredient.objects.count(), 3)
+
+        self.assertEqual(CanonicalIngredient.objects.find('garlics').first().title, 'garlic')
+
+        # ingredients edited outside of recipe serializers are linked again
+        ingredient = Ingredient.objects.get(pk=garlic.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            ingredient.title = '1 onion, chopped'
+            ingredient.save()
+        # the recipe is indexed once the linking is committed
+        with self.captureOnCommitCallbacks(execute=True):
+            for callback in callbacks:
+                callback()
+        onion = CanonicalIngredient.objects.get(title='onion')
+        self.assertEqual(Ingredient.objects.get(pk=garlic.pk).canonical_id, onion.pk)
+        self.assertIn(recipe.pk, onion.recipe_ids)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.delete()
+        self.assertNotIn(recipe.pk, CanonicalIngredient.objects.get(pk=onion.pk).recipe_ids)
+
+    def test_recipes_by_ingredients(self):
+        ingredients = [
+            ['garlic', 'basil', 'chicken breast'],
+            ['garlic', 'basil'],
+            ['garlic', 'rice', 'chicken breast', 'onion'],
+            ['chocolate', 'sugar'],
+        ]
+        recipes = []
+        for titles in ingredients:
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe = Recipe.objects.create(**self.BASIC_TEST_DATA)
+                CanonicalIngredient.objects.link_ingredients([
+                    Ingredient.objects.create(recipe=recipe, title=title, quantity=1) for title in titles
+                ])
+            recipes.append(recipe)
+
+        garlic = CanonicalIngredient.objects.get(title='garlic')
+        self.assertEqual(garlic.recipe_ids, sorted(r.pk for r in recipes[:3]))
+
+        url = reverse('Recipe api:recipe_by_ingredients')
+        response = self.client.get(url, {'ingredients': 'Garlic, 2 tbsp basil,chicken breasts'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([r['pk'] for r in response.data['results']], [recipes[0].pk, recipes[1].pk, recipes[2].pk])
+        self.assertEqual(
+            [(r['matched_ingredients'], r['required_ingredients']) for r in response.data['results']],
+            [(3, 3), (2, 2), (2, 4)]
+        )
+
+        # the index follows publishing and ingredient changes
+        with self.captureOnCommitCallbacks(execute=True):
+            recipes[1].publish_status = Recipe.PublishStatus.NOT_PUBLISHED
+            recipes[1].save()
+            Ingredient.objects.filter(recipe=recipes[0], title='basil').delete()
+            CanonicalIngredient.objects.link_ingredients(list(recipes[0].ingredients.all()))
+        self.assertEqual(CanonicalIngredient.objects.get(title='basil').recipe_ids, [])
+
+        # misspelled titles are matched by trigram similarity in one query
+        with self.assertNumQueries(2):
+            canonical_ids = RecipesByIngredientsService().get_canonical_ids(['garlics', 'chiken breast', 'basil'])
+        self.assertEqual(len(canonical_ids), 3)
+        results = RecipesByIngredientsService().search(['garlic', 'basil'])
+        self.assertEqual(results.count(), 2)
+        self.assertEqual(results[1:], [(recipes[2].pk, 1, 4)])
+
+        response = self.client.get(url, {'ingredients': 'garlic,basil', 'page_size': 1})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['results'][0]['pk'], recipes[0].pk)
+
+        # recipes rejected after the ranking was read are not returned
+        ranking = RecipesByIngredientsService().search(['garlic', 'basil'])[0:2]
+        Recipe.objects.filter(pk=recipes[0].pk).update(status=Recipe.Status.REJECTED)
+        with mock.patch.object(RecipesByIngredientsService, 'search', return_value=ranking):
+            response = self.client.get(url, {'ingredients': 'garlic,basil'})
+        self.assertEqual([r['pk'] for r in response.data['results']], [recipes[2].pk])
+
+        recipes[0].delete()
+        self.assertEqual(CanonicalIngredient.objects.get(title='garlic').recipe_ids, [recipes[2].pk])
+
+    @override_settings(RECOMMENDATIONS_NEIGHBOURS=2, RECOMMENDATIONS_CHUNK_SIZE=2)
+    def test_recipe_neighbours(self):
+        ingredients = [
+            ['chicken breast', 'basil', 'garlic'],
+            ['chicken breast', 'basil', 'tomato'],
+            ['chicken breast', 'rice'],
+            ['chocolate', 'sugar'],
+        ]
+        recipes = []
+        for titles in ingredients:
+            recipe = Recipe.objects.create(**self.BASIC_TEST_DATA)
+            for title in titles:
+                Ingredient.objects.create(recipe=recipe, title=title, quantity=1)
+            recipes.append(recipe)
+
+        rs = RecommendedRecipesService()
+        rs.calculate_recipes_data()
+
+        neighbours = RecipeNeighbours.objects.get(recipe=recipes[0])
+        self.assertEqual(neighbours.neighbour_ids, [recipes[1].pk, recipes[2].pk])
+        self.assertGreater(neighbours.scores[0], neighbours.scores[1])
+        # recipes without common ingredients are not neighbours
+        self.assertEqual(RecipeNeighbours.objects.get(recipe=recipes[3]).neighbour_ids, [])
+
+        # neighbours of all activity recipes are pooled, activity recipes are skipped
+        self.assertEqual(rs.get_recommended([recipes[0].pk, recipes[3].pk]), [recipes[1].pk, recipes[2].pk])
+        self.assertEqual(rs.get_recommended([recipes[0].pk, recipes[2].pk]), [recipes[1].pk])
+        self.assertEqual(rs.get_recommended([recipes[0].pk], exclude_ids=[recipes[1].pk]), [recipes[2].pk])
+        self.assertEqual(rs.get_recommended([recipes[0].pk], count=1), [recipes[1].pk])
+
+    def test_recommend_excludes_interacted_recipes(self):
+        ingredients = [
+            ['chicken breast', 'basil', 'garlic'],
+            ['chicken breast', 'basil', 'tomato'],
+            ['chocolate', 'sugar'],
+            ['rice', 'onion'],
+            ['salmon', 'lemon'],
+        ]
+        recipes = []
+        for titles in ingredients:
+            recipe = Recipe.objects.create(**self.BASIC_TEST_DATA)
+            for title in titles:
+                Ingredient.objects.create(recipe=recipe, title=title, quantity=1)
+            recipes.append(recipe)
+
+        rs = RecommendedRecipesService()
+        rs.calculate_recipes_data()
+
+        # the like of the neighbour is older than the latest likes used as activity
+        for recipe in recipes[1:]:
+            Like.objects.create(user=self.user, content_object=recipe)
+        UserViewHistoryRecord.objects.add_counts(self.user.pk, recipes[0].pk, 1)
+        self.assertNotIn(recipes[1].pk, rs.get_users_activity(User.objects.filter(pk=self.user.pk))[self.user.pk])
+
+        self.assertEqual(rs.recommend(User.objects.filter(pk=self.user.pk)), {self.user.pk: []})
+
+    @override_settings(RECOMMENDATIONS_MODEL='interactions')
+    def test_recommend_by_interactions(self):
+        ingredients = [
+            ['chicken breast', 'basil', 'garlic'],
+            ['chicken breast', 'basil', 'tomato'],
+            ['chicken breast', 'rice'],
+            ['chocolate', 'sugar'],
+            ['dark chocolate'],
+        ]
+        recipes = []
+        for titles in ingredients:
+            recipe = Recipe.objects.create(**self.BASIC_TEST_DATA)
+            for title in titles:
+                Ingredient.objects.create(recipe=recipe, title=title, quantity=1)
+            recipes.append(recipe)
+
+        rs = RecommendedRecipesService()
+        rs.calculate_recipes_data()
+
+        UserViewHistoryRecord.objects.add_counts(self.user.pk, recipes[0].pk, 1)
+        SavedRecipe.objects.create(user=self.user, recipe=recipes[3])
+
+        # saved recipe outweighs a single view, interacted recipes are skipped
+        self.assertEqual(
+            rs.recommend(User.objects.filter(pk=self.user.pk)),
+            {self.user.pk: [recipes[4].pk, recipes[1].pk, recipes[2].pk]}
+        )
+
+        out = StringIO()
+        call_command('evaluate_recommendations', stdout=out)
+        self.assertIn('recall@k', out.getvalue())
+
+    def test_update_recipe_neighbours(self):
+        ingredients = [
+            ['chicken breast', 'basil', 'garlic'],
+            ['chicken breast', 'basil', 'tomato'],
+            ['chocolate', 'sugar'],
+        ]
+        recipes = []
+        for titles in ingredients:
+            recipe = Recipe.objects.create(**self.BASIC_TEST_DATA)
+            for title in titles:
+                Ingredient.objects.create(recipe=recipe, title=title, quantity=1)
+            recipes.append(recipe)
+
+        rs = RecommendedRecipesService()
+        self.assertEqual(rs.calculate_recipes_data(), 3)
+        self.assertEqual(rs.update_recipes_data(), 0)
+        # the vectorizer is kept without pickles next to the index copy of the same version
+        first_version = RecipeNeighboursVersion().get()
+        self.assertTrue(os.path.exists(rs._get_snapshot_path(first_version, 'vectorizer.json')))
+
+        # only the new recipe and the recipe with a free slot are recalculated
+        recipe = Recipe.objects.create(**self.BASIC_TEST_DATA)
+        Ingredient.objects.create(recipe=recipe, title='dark chocolate', quantity=1)
+        self.assertEqual(rs.update_recipes_data(), 2)
+        self.assertEqual(RecipeNeighbours.objects.get(recipe=recipes[2]).neighbour_ids, [recipe.pk])
+        self.assertEqual(RecipeNeighbours.objects.get(recipe=recipe).neighbour_ids, [recipes[2].pk])
+        self.assertFalse(os.path.exists(rs._get_snapshot_path(first_version, 'vectorizer.json')))
+
+        # unpublished recipe is removed from the lists which contain it
+        Recipe.objects.filter(pk=recipes[1].pk).update(publish_status=Recipe.PublishStatus.NOT_PUBLISHED)
+        self.assertEqual(rs.update_recipes_data(), 1)
+        self.assertFalse(RecipeNeighbours.objects.filter(recipe=recipes[1]).exists())
+        self.assertEqual(RecipeNeighbours.objects.get(recipe=recipes[0]).neighbour_ids, [])
+
+        # copies of the index written by other hosts are not read, the local copy is exported again
+        table_version = RecipeNeighboursVersion().get()
+        version = RecipeNeighboursVersion().update()
+        self.assertIsNone(RecipeNeighboursIndex.load())
+        self.assertEqual(RecipeNeighboursIndex.load_or_save().get([recipe.pk]), {recipe.pk: ([recipes[2].pk], [mock.ANY])})
+        self.assertEqual(os.listdir(settings.RECOMMENDATIONS_INDEX_DIR), [version])
+        RecipeNeighboursVersion().set(table_version)
+
+    def test_update_recommended_recipes(self):
+        ingredients = [
+            ['chicken breast', 'basil', 'garlic'],
+            ['chicken breast', 'basil', 'tomato'],
+            ['chocolate', 'sugar'],
+        ]
+        recipes = []
+        for titles in ingredients:
+            recipe = Recipe.objects.create(**self.BASIC_TEST_DATA)
+            for title in titles:
+                Ingredient.objects.create(recipe=recipe, title=title, quantity=1)
+            recipes.append(recipe)
+
+        RecommendedRecipesService().calculate_recipes_data()
+        RecommendationsRunCache().set_last_run(timezone.now())
+
+        index = RecipeNeighboursIndex.load()
+        self.assertEqual(index.get([recipes[0].pk, recipes[2].pk, 0]), {
+            recipes[0].pk: ([recipes[1].pk], [mock.ANY]),
+            recipes[2].pk: ([], []),
+        })
+
+        UserViewHistoryRecord.objects.add_counts(self.user.pk, recipes[0].pk, 1)
+        Like.objects.create(user=self.staff_user, content_object=recipes[2])
+
+        # subtasks are run in place
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, 'task_always_eager', False)
+
+        with self.settings(RECOMMENDATIONS_USERS_CHUNK_SIZE=1):
+            self.assertEqual(update_recommended_recipes(), 2)
+        self.assertEqual(User.objects.get(pk=self.user.pk).recommended_recipes, [recipes[1].pk])
+        self.assertEqual(User.objects.get(pk=self.staff_user.pk).recommended_recipes, [])
+
+        self.assertEqual(RecommendationsCache().get_user(self.user.pk), [recipes[1].pk])
+
+        # calculated by a subtask after the cache expired, popular recipes are shown meanwhile
+        RecommendationsCache().delete_user(self.user.pk)
+        User.objects.filter(pk=self.user.pk).update(recommended_recipes=None)
+        RecommendationsCache().set_popular([recipes[2].pk], 60)
+        with mock.patch.object(update_users_recommendations, 'delay', side_effect=OSError) as delay:
+            # a broker error doesn't fail the request
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.get(reverse('recipe:recipe_popular'))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([r['pk'] for r in response.data], [recipes[2].pk])
+            delay.assert_called_once_with([self.user.pk])
+
+            # queued once until the pending mark expires
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.get(reverse('recipe:recipe_popular'))
+            self.assertEqual([r['pk'] for r in response.data], [recipes[2].pk])
+            self.assertEqual(delay.call_count, 1)
+        self.assertIsNone(RecommendationsCache().get_user(self.user.pk))
+
+        update_users_recommendations([self.user.pk])
+        response = self.client.get(reverse('recipe:recipe_popular'))
+        self.assertEqual([r['pk'] for r in response.data], [recipes[1].pk])
+        self.assertEqual(User.objects.get(pk=self.user.pk).recommended_recipes, [recipes[1].pk])
+
+        # users without new activity are skipped
+        self.assertEqual(update_recommended_recipes(), 0)
+
+        Like.objects.create(user=self.user, content_object=recipes[1])
+        last_run = RecommendationsRunCache().get_last_run()
+        # the run is not recorded when a subtask fails, its users are updated by the next run
+        with mock.patch.object(RecommendedRecipesService, 'update_users_recommendations', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                update_recommended_recipes()
+        self.assertEqual(RecommendationsRunCache().get_last_run(), last_run)
+
+        self.assertEqual(update_recommended_recipes(), 1)
+        self.assertEqual(User.objects.get(pk=self.user.pk).recommended_recipes, [])
+        self.assertGreater(RecommendationsRunCache().get_last_run(), last_run)
+
     def test_latest_recipes_by_user(self):
 
         response = self.client.get(reverse('recipe:recipe_latest'))
@@ -1347,16 +2077,18 @@ class RecipeTestCase(IsAuthClientTestCase):
         self.assertEqual(len(response.data), 0)
 
         data = copy.deepcopy(self.BASIC_TEST_DATA)
-        Recipe.objects.create(**data)
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.create(**data)
 
         response = self.client.get(reverse('recipe:recipe_latest'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
 
         recipes = []
-        for i in range(7):
-            data = copy.deepcopy(self.BASIC_TEST_DATA)
-            recipes.append(Recipe.objects.create(**data))
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(7):
+                data = copy.deepcopy(self.BASIC_TEST_DATA)
+                recipes.append(Recipe.objects.create(**data))
 
         response = self.client.get(reverse('recipe:recipe_latest'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -1378,6 +2110,17 @@ class RecipeTestCase(IsAuthClientTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 7)
 
+        pks, cursor = [], ''
+        while cursor is not None:
+            response = self.anonymous_client.get(
+                reverse('recipe:recipe_user_list', args=(self.home_chef_user.pk,)),
+                {'cursor': cursor, 'page_size': 3}
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pks += [r['pk'] for r in response.data['results']]
+            cursor = response.data['next']
+        self.assertEqual(pks, [r.pk for r in reversed(recipes)])
+
     def test_upload_video(self):
 
         # is not used if googlecloud is enabled
@@ -1547,6 +2290,26 @@ class SavedRecipeTestCase(IsAuthClientTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['count'], 2)
 
+        response = self.home_chef_client.get(
+            reverse('recipe:recipe_saved_recipe'),
+            {'types': "1,4", 'cursor': '', 'page_size': 1}
+        )
+        first_page = [r['pk'] for r in response.data['results']]
+        response = self.home_chef_client.get(
+            reverse('recipe:recipe_saved_recipe'),
+            {'types': "1,4", 'cursor': response.data['next'], 'page_size': 1}
+        )
+        self.assertEqual(
+            first_page + [r['pk'] for r in response.data['results']],
+            list(SavedRecipe.objects.filter(recipe__types__overlap=[1, 4]).order_by('pk').values_list('pk', flat=True))
+        )
+        self.assertIsNone(response.data['next'])
+
+        # without a request (tasks, shell) there are no flags of a user
+        data = SavedRecipeSerializer(SavedRecipe.objects.order_by('pk'), many=True).data
+        self.assertEqual(len(data), 3)
+        self.assertFalse(data[0]['recipe']['user_saved_recipe'])
+
     def test_create_saved_recipe(self):
 
         data = copy.deepcopy(self.BASIC_TEST_DATA)
@@ -1572,6 +2335,33 @@ class SavedRecipeTestCase(IsAuthClientTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertGreater(response.data['user_saved_recipe'], 0)
 
+    def test_user_flags_for_list(self):
+
+        for _ in range(3):
+            Recipe.objects.create(**copy.deepcopy(self.BASIC_TEST_DATA))
+        recipes = list(Recipe.objects.order_by('pk'))
+        Like.objects.create(user=self.home_chef_user, content_object=recipes[0])
+        saved_recipe = SavedRecipe.objects.create(recipe=recipes[1], user=self.home_chef_user)
+
+        request = APIRequestFactory().get('/')
+        request.user = self.home_chef_user
+
+        with CaptureQueriesContext(connection) as queries:
+            data = RecipeSerializer(recipes, many=True, context={'request': request}).data
+        # one query per flag for the whole list
+        self.assertEqual(len([q for q in queries if '"social_like"' in q['sql']]), 1)
+        self.assertEqual(len([q for q in queries if '"recipe_savedrecipe"' in q['sql']]), 1)
+
+        self.assertEqual([r['user_liked'] for r in data], [True, False, False])
+        self.assertEqual([r['user_saved_recipe'] for r in data], [False, saved_recipe.pk, False])
+
+        # flags of saved recipes are known from the list itself
+        with CaptureQueriesContext(connection) as queries:
+            response = self.home_chef_client.get(reverse('recipe:recipe_saved_recipe'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['recipe']['user_saved_recipe'], saved_recipe.pk)
+        self.assertEqual(len([q for q in queries if '"recipe_savedrecipe"' in q['sql']]), 2)  # count + page
+
     def test_delete_saved_recipe(self):
 
         data = copy.deepcopy(self.BASIC_TEST_DATA)
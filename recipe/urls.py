@@ -18,6 +18,7 @@ from recipe.views import (
     SavedRecipeListCreateView,
     SavedRecipeRetrieveDestroyView,
     PopularRecipesView,
+    RecipesByIngredientsView,
     LatestRecipesView,
     MyRecipeListView,
     UserRecipeListView,
@@ -51,6 +52,7 @@ urlpatterns = [
     path('top_rated_meals', TopRatedRecipeView.as_view(), name='recipe_top_rated'),
     path('featured_meals', FeaturedRecipeView.as_view(), name='recipe_featured'),
     path('search_suggestions', SearchSuggestionsView.as_view(), name='search_suggestions'),
+    path('by_ingredients', RecipesByIngredientsView.as_view(), name='recipe_by_ingredients'),
     path('popular_recipes', PopularRecipesView.as_view(), name='recipe_popular'),
     path('latest_user_recipes', LatestRecipesView.as_view(), name='recipe_latest'),
     path('upload_video', UploadVideoView.as_view(), name='upload_video'),
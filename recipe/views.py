@@ -1,40 +1,42 @@
 import json
 import logging
-import random
 from datetime import datetime
 
-from django.conf import settings
 from django.db import transaction
-from django.db.models import Case, Count, F, IntegerField, When
+from django.db.models import Case, Count, F, IntegerField, Value, When
 from django.http.response import Http404
 from drf_yasg.openapi import IN_QUERY, Parameter
 from drf_yasg.utils import swagger_auto_schema
-from main.pagination import StandardResultsSetPagination
+from main.mixins import CachedResponseMixin
+from main.pagination import KeysetResultsSetPagination, StandardResultsSetPagination
 from main.permissions import IsHomeChef, IsOwner
+from main.redis import ResponseCache
 from rest_framework import generics, permissions, serializers, status
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from site_settings.models import (Banner, FeaturedRecipe, HomepagePinnedRecipe,
-                                  MealOfTheWeekRecipe, TopRatedRecipe)
+from site_settings.models import Banner, HomepagePinnedRecipe, TopRatedRecipe
 from site_settings.serializers import BannerSerializer
 from social.models import Comment
 from social.serializers import (CommentLikeSerializer, CommentSerializer,
                                 LikeSerializer, RatingSerializer)
 from stats.models import StatRecord
-from users.models import User, UserViewHistoryRecord
+from users.models import EatChefsAccount, User, UserViewHistoryRecord
 
-from recipe.enums import Cuisines
 from recipe.filters import (NullsAlwaysLastOrderingFilter, RecipeFilterSet,
                             SavedRecipeFilterSet)
 from recipe.models import Recipe, RecipeVideo, SavedRecipe
+from recipe.redis import RecipeCandidatePool, RecipeLeaderboards
 from recipe.serializers import (IngredientSerializer, QuerySerializer,
                                 RecipeCardSerializer, RecipeImageSerializer,
+                                RecipeIngredientsMatchSerializer,
                                 RecipeSavedRecipeSerializer, RecipeSerializer,
                                 RecipeStepSerializer, RecipeVideoSerializer,
                                 SavedRecipeSerializer)
+from recipe.services import RecipesByIngredientsService, RecipeSamplingService, RecommendedRecipesService
 from recipe.signals import S_new_recipe_created
+from recipe.tasks import rebuild_recipe_leaderboards
 
 logger = logging.getLogger('django')
 
@@ -42,12 +44,12 @@ logger = logging.getLogger('django')
 class RecipeListCreateView(generics.ListCreateAPIView):
 
     queryset = Recipe.objects.all() \
-        .select_related('user') \
+        .select_related('user', 'video') \
         .prefetch_related('images') \
         .get_published_and_accepted() \
         .order_by('-likes_number')
 
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetResultsSetPagination
     filterset_class = RecipeFilterSet
     filter_backends = [NullsAlwaysLastOrderingFilter]
     ordering_fields = [
@@ -68,32 +70,30 @@ class RecipeListCreateView(generics.ListCreateAPIView):
         return [AllowAny()]
 
     def get_queryset(self):
-        try:
-            user = User.objects.get(
-                full_name=settings.EATCHEFS_ACCOUNT_NAME,
-                is_staff=True
+        queryset = self.filterset_class(self.request.GET, queryset=self.queryset).qs
+        account_id = EatChefsAccount.get_id()
+
+        if self.request.query_params.get('only_eatchefs_recipes', None) is not None and account_id is not None:
+            queryset = queryset.filter(user_id=account_id)
+
+        if self.request.query_params.get('title', '').strip():
+            # ordered by relevance, see RecipeFilterSet
+            return queryset
+
+        # recipes of users first, then imported recipes of the EatChefs account
+        return queryset.annotate(
+            source_rank=Case(
+                When(user_id=account_id, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField()
             )
-        except User.DoesNotExist:
-            queryset = self.queryset
-        else:
-            queryset_from_api = self.queryset.filter(user=user)
-
-            if self.request.query_params.get('only_eatchefs_recipes', None) is None:
-
-                queryset_by_users = self.filterset_class(
-                    self.request.GET,
-                    queryset=self.queryset.exclude(user=user)
-                ).qs
+        ).order_by('source_rank', F('likes_number').desc(nulls_last=True), '-pk')
 
-                queryset_from_api = self.filterset_class(
-                    self.request.GET,
-                    queryset=self.queryset.filter(user=user)
-                ).qs
-
-                return queryset_by_users.union(queryset_from_api, all=True)
-            else:
-                queryset = queryset_from_api
-                return self.filterset_class(self.request.GET, queryset=queryset_from_api).qs
+    def get_keyset_ordering(self):
+        ordering = NullsAlwaysLastOrderingFilter().get_ordering(self.request, self.queryset, self)
+        if not ordering and self.request.query_params.get('title', '').strip():
+            return ['-search_rank']
+        return ordering or ['source_rank', '-likes_number']
 
     @swagger_auto_schema(
         manual_parameters=[
@@ -105,6 +105,7 @@ class RecipeListCreateView(generics.ListCreateAPIView):
             Parameter('diet_restrictions', IN_QUERY, type='list'),
             Parameter('cooking_methods', IN_QUERY, type='list'),
             Parameter('only_eatchefs_recipes', IN_QUERY, type='str'),
+            Parameter('cursor', IN_QUERY, type='str'),
         ]
     )
     def get(self, request, *args, **kwargs):
@@ -128,9 +129,7 @@ class RecipeListCreateView(generics.ListCreateAPIView):
 
 class RecipeRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
 
-    queryset = Recipe.objects.select_related(
-        'user',
-    ).all()
+    queryset = Recipe.objects.all().with_details()
     serializer_class = RecipeSerializer
 
     def get_permissions(self):
@@ -161,20 +160,9 @@ class RecipeRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
         if obj.status == Recipe.Status.ACCEPTED and obj.publish_status == Recipe.PublishStatus.PUBLISHED:
             StatRecord.objects.increment_views(obj)
             if self.request.user.is_authenticated:
-                try:
-                    uv = UserViewHistoryRecord.objects.get(
-                        user=self.request.user,
-                        recipe=obj
-                    )
-                    uv.count += 1
-                    uv.save()
-                except UserViewHistoryRecord.DoesNotExist:
-                    UserViewHistoryRecord.objects.create(
-                        user=self.request.user,
-                        recipe=obj,
-                        count=1
-                    )
-        return super().get(self, request, *args, **kwargs)
+                UserViewHistoryRecord.objects.increment(self.request.user.pk, obj.pk)
+        serializer = self.get_serializer(obj)
+        return Response(serializer.data)
 
     @transaction.atomic
     def update(self, request, *args, **kwargs):
@@ -199,10 +187,13 @@ class UserRecipeListView(generics.ListAPIView):
         .prefetch_related('images') \
         .order_by("-id")
     serializer_class = RecipeCardSerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetResultsSetPagination
     filterset_class = RecipeFilterSet
     permission_classes = [permissions.AllowAny]
 
+    def get_keyset_ordering(self):
+        return ['-pk']
+
     def get_queryset(self):
         user_id = self.kwargs.get('user_id')
         try:
@@ -234,9 +225,12 @@ class MyRecipeListView(generics.ListAPIView):
         .order_by("-id")
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = RecipeCardSerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetResultsSetPagination
     filterset_class = RecipeFilterSet
 
+    def get_keyset_ordering(self):
+        return ['-pk']
+
     def get_queryset(self):
         queryset = super().get_queryset().filter(user=self.request.user)
         return self.filterset_class(self.request.GET, queryset=queryset).qs
@@ -363,28 +357,61 @@ class RecipeCommentLikeView(generics.CreateAPIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class RecipeFavoriteCuisinesView(generics.ListAPIView):
+class RecipeFavoriteCuisinesView(CachedResponseMixin, generics.ListAPIView):
 
     permission_classes = [permissions.AllowAny]
     serializer_class = RecipeCardSerializer
+    response_cache_name = ResponseCache.FAVORITE_CUISINES
+    response_cache_params = ['cuisine', 'type', 'diet']
+
+    # query param: ranked facet
+    FACETS = {
+        'cuisine': 'cuisines',
+        'type': 'types',
+        'diet': 'diet_restrictions',
+    }
 
     def get_queryset(self):
-        cuisine = self.request.query_params.get('cuisine')
+        """ The most liked published recipes of a cuisine, a type or a diet """
+        param = next((p for p in self.FACETS if p in self.request.query_params), 'cuisine')
+        facet = self.FACETS[param]
         try:
-            cuisine = int(cuisine)
+            value = int(self.request.query_params.get(param))
         except (ValueError, TypeError):
             return []
-        if cuisine not in [c.value for c in Cuisines]:
+        if value not in RecipeLeaderboards.FACETS[facet].values:
             return []
-        return Recipe.objects.all().get_published() \
-            .select_related('user') \
-            .prefetch_related('images') \
-            .filter(cuisines__contains=[cuisine]) \
-            .order_by(F('likes_number').desc(nulls_last=True))[0:3]
+
+        queryset = Recipe.objects.all().get_published() \
+            .select_related('user', 'video') \
+            .prefetch_related('images')
+        leaderboards = RecipeLeaderboards()
+        if not leaderboards.is_built():
+            if leaderboards.request_rebuild():
+                transaction.on_commit(self.queue_leaderboards_rebuild)
+            return queryset \
+                .filter(**{f'{facet}__contains': [value]}) \
+                .order_by(F('likes_number').desc(nulls_last=True))[0:3]
+
+        recipe_ids = leaderboards.get_top(facet, value, 3)
+        return queryset.filter(pk__in=recipe_ids).order_by(Case(
+            *[When(pk=pk, then=Value(i)) for i, pk in enumerate(recipe_ids)],
+            output_field=IntegerField()
+        ))
+
+    @staticmethod
+    def queue_leaderboards_rebuild():
+        try:
+            rebuild_recipe_leaderboards.delay()
+        except Exception as e:
+            # requested again by a reader after the request expires
+            logger.error(f'Unable to queue the recipe leaderboards rebuild: {e}')
 
     @swagger_auto_schema(
         manual_parameters=[
             Parameter('cuisine', IN_QUERY, type='int'),
+            Parameter('type', IN_QUERY, type='int'),
+            Parameter('diet', IN_QUERY, type='int'),
         ],
         responses={200: ""}
     )
@@ -424,20 +451,22 @@ class SearchSuggestionsView(APIView):
         return Response(res_serializer.data, status=status.HTTP_200_OK)
 
 
-class HomepageBannersView(generics.ListAPIView):
+class HomepageBannersView(CachedResponseMixin, generics.ListAPIView):
 
     permission_classes = [permissions.AllowAny]
     serializer_class = BannerSerializer
+    response_cache_name = ResponseCache.HOMEPAGE_BANNERS
 
     def get_queryset(self):
         # should not be too many (5 max)
         return Banner.objects.all()[:5]
 
 
-class PinnedRecipeView(generics.ListAPIView):
+class PinnedRecipeView(CachedResponseMixin, generics.ListAPIView):
 
     permission_classes = [permissions.AllowAny]
     serializer_class = RecipeCardSerializer
+    response_cache_name = ResponseCache.PINNED_RECIPES
 
     def get_queryset(self):
         return Recipe.objects.filter(
@@ -450,22 +479,27 @@ class PinnedRecipeView(generics.ListAPIView):
         .order_by(F('likes_number').desc(nulls_last=True))[0:3]
 
 
-class MealOfTheWeekView(generics.ListAPIView):
+class MealOfTheWeekView(CachedResponseMixin, generics.ListAPIView):
 
     permission_classes = [permissions.AllowAny]
     serializer_class = RecipeSerializer
+    response_cache_name = ResponseCache.MEAL_OF_THE_WEEK
+
+    def is_response_shared(self, request):
+        # liked and saved flags of the user are rendered
+        return not request.user.is_authenticated
 
     def get_queryset(self):
-        mealoftheweek = MealOfTheWeekRecipe.objects.first()
-        if mealoftheweek:
-            return [mealoftheweek.recipe]
-        return []
+        return Recipe.objects.all().with_details() \
+            .filter(meal_of_the_week__isnull=False) \
+            .order_by('meal_of_the_week__pk')[0:1]
 
 
-class TopRatedRecipeView(generics.ListAPIView):
+class TopRatedRecipeView(CachedResponseMixin, generics.ListAPIView):
 
     permission_classes = [permissions.AllowAny]
     serializer_class = RecipeCardSerializer
+    response_cache_name = ResponseCache.TOP_RATED_RECIPES
 
     def get_queryset(self):
         return Recipe.objects.filter(
@@ -484,26 +518,26 @@ class FeaturedRecipeView(generics.ListAPIView):
     serializer_class = RecipeCardSerializer
 
     def get_queryset(self):
-        frs = FeaturedRecipe.objects.all()
-        select_num = frs.count() if frs.count() < 5 else 5
-        recipe_ids = [f.recipe.pk for f in random.sample(list(frs), select_num)]
+        recipe_ids = RecipeSamplingService().sample(RecipeCandidatePool.FEATURED, 5)
         return Recipe.objects.filter(pk__in=recipe_ids) \
-            .select_related('user') \
+            .select_related('user', 'video') \
             .prefetch_related('images') \
             .get_published_and_accepted() \
-            .distinct() \
-            .order_by(F('likes_number').desc(nulls_last=True))[0:18]
+            .order_by(F('likes_number').desc(nulls_last=True))
 
 
 class SavedRecipeListCreateView(generics.ListCreateAPIView):
 
     serializer_class = SavedRecipeSerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetResultsSetPagination
     filterset_class = SavedRecipeFilterSet
 
     def get_permissions(self):
         return [IsAuthenticated()]
 
+    def get_keyset_ordering(self):
+        return ['pk']
+
     def get_queryset(self):
         queryset = SavedRecipe.objects.filter(
             user=self.request.user
@@ -536,34 +570,35 @@ class SavedRecipeRetrieveDestroyView(generics.RetrieveDestroyAPIView):
         return get_object_or_404(self.get_queryset(), pk=self.kwargs['pk'])
 
 
-class PopularRecipesView(generics.ListAPIView):
+class PopularRecipesView(CachedResponseMixin, generics.ListAPIView):
 
     permission_classes = [permissions.AllowAny]
     serializer_class = RecipeCardSerializer
+    response_cache_name = ResponseCache.POPULAR_RECIPES
     # filterset_class = RecipeFilterSet
 
+    def is_response_shared(self, request):
+        # users get their own recommendations
+        return not request.user.is_authenticated
+
     def get_queryset(self):
+        rs = RecommendedRecipesService()
 
-        if not self.request.user.is_authenticated:
-            return Recipe.objects.all() \
-                            .select_related('user') \
-                            .prefetch_related('images') \
-                            .get_published_and_accepted() \
-                            .order_by('-likes_number')[0:4]
+        recipe_ids = []
+        if self.request.user.is_authenticated:
+            recipe_ids = rs.get_user_recommendations(self.request.user)
+        if not recipe_ids:
+            recipe_ids = rs.get_popular_recipes()
 
-        elif self.request.user.recommended_recipes:
-            queryset = Recipe.objects.filter(
-                pk__in=self.request.user.recommended_recipes
-            ) \
+        queryset = Recipe.objects.all() \
+            .get_published_and_accepted() \
+            .filter(pk__in=recipe_ids) \
             .select_related('user') \
-            .prefetch_related('images')
-
-        else:
-            queryset = Recipe.objects.all() \
-                            .select_related('user') \
-                            .prefetch_related('images') \
-                            .get_published_and_accepted() \
-                            .order_by('-likes_number')[0:4]
+            .prefetch_related('images') \
+            .order_by(Case(
+                *[When(pk=pk, then=Value(i)) for i, pk in enumerate(recipe_ids)],
+                output_field=IntegerField()
+            ))
 
         return queryset
 
@@ -575,12 +610,49 @@ class PopularRecipesView(generics.ListAPIView):
         ]
     )
     """
-    def get(self, request, *args, **kwargs):
+    def list(self, request, *args, **kwargs):
         # queryset = self.filter_queryset(self.get_queryset())
         serializer = self.get_serializer(self.get_queryset(), many=True)
         return Response(serializer.data)
 
 
+class RecipesByIngredientsView(generics.ListAPIView):
+
+    permission_classes = [permissions.AllowAny]
+    serializer_class = RecipeIngredientsMatchSerializer
+    pagination_class = StandardResultsSetPagination
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            Parameter('ingredients', IN_QUERY, type='list'),
+            Parameter('page', IN_QUERY, type='int'),
+            Parameter('page_size', IN_QUERY, type='int'),
+        ]
+    )
+    def get(self, request, *args, **kwargs):
+        """ Get published recipes ranked by the share of their ingredients found in the list """
+        titles = request.query_params.get('ingredients', '').split(',')
+        page = self.paginate_queryset(RecipesByIngredientsService().search(titles))
+
+        # the ranking is read without locks, recipes unpublished since then are skipped
+        recipes = Recipe.objects.all() \
+            .get_published_and_accepted() \
+            .select_related('user') \
+            .prefetch_related('images') \
+            .in_bulk([recipe_id for recipe_id, _, _ in page])
+        items = []
+        for recipe_id, matched, required in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.matched_ingredients = matched
+            recipe.required_ingredients = required
+            items.append(recipe)
+
+        serializer = self.get_serializer(items, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
 class LatestRecipesView(generics.ListAPIView):
 
     permission_classes = [permissions.AllowAny]
@@ -591,13 +663,10 @@ class LatestRecipesView(generics.ListAPIView):
 
     @swagger_auto_schema(responses={200: ''})
     def get(self, request, *args, **kwargs):
-        ids = list(self.get_queryset().values_list('pk', flat=True)[0:100])
-        number_of_items = 2 if len(ids) >= 2 else len(ids)
-
-        items = Recipe.objects \
-            .select_related('user') \
+        items = self.get_queryset() \
+            .select_related('user', 'video') \
             .prefetch_related('images') \
-            .filter(pk__in=random.sample(ids, number_of_items))
+            .filter(pk__in=RecipeSamplingService().sample(RecipeCandidatePool.LATEST, 2))
 
         serializer = self.get_serializer(items, many=True)
         return Response(serializer.data)
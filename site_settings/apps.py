@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SiteSettingsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'site_settings'
+
+    def ready(self):
+        import site_settings.signals
@@ -0,0 +1,36 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from main.redis import ResponseCache
+from recipe.redis import RecipeCandidatePool
+from site_settings.models import (Banner, Block, FeaturedRecipe, HomepagePinnedRecipe,
+                                  MealOfTheWeekRecipe, TopRatedRecipe)
+
+CACHED_RESPONSES = {
+    Banner: ResponseCache.HOMEPAGE_BANNERS,
+    Block: ResponseCache.BLOCKS,
+    HomepagePinnedRecipe: ResponseCache.PINNED_RECIPES,
+    MealOfTheWeekRecipe: ResponseCache.MEAL_OF_THE_WEEK,
+    TopRatedRecipe: ResponseCache.TOP_RATED_RECIPES,
+}
+
+
+def invalidate_cached_responses(sender, **kwargs):
+    name = CACHED_RESPONSES[sender]
+    # after the commit, so the old data is not cached again by a concurrent request
+    transaction.on_commit(lambda: ResponseCache.invalidate(name))
+
+
+for model in CACHED_RESPONSES:
+    post_save.connect(invalidate_cached_responses, sender=model,
+                      dispatch_uid=f'invalidate_cached_responses_{model.__name__}_save')
+    post_delete.connect(invalidate_cached_responses, sender=model,
+                        dispatch_uid=f'invalidate_cached_responses_{model.__name__}_delete')
+
+
+@receiver(post_save, sender=FeaturedRecipe)
+@receiver(post_delete, sender=FeaturedRecipe)
+def invalidate_featured_candidates(sender, **kwargs):
+    # FeaturedRecipeView samples random recipes, so only its candidates are cached
+    transaction.on_commit(lambda: RecipeCandidatePool.invalidate(RecipeCandidatePool.FEATURED))
@@ -1,6 +1,9 @@
 from django.shortcuts import render
 from rest_framework import generics, permissions
 
+from main.mixins import CachedResponseMixin
+from main.redis import ResponseCache
+
 from site_settings.serializers import (
     SupportSerializer,
     BlockSerializer
@@ -13,7 +16,8 @@ class SupportCreateView(generics.CreateAPIView):
     serializer_class = SupportSerializer
 
 
-class BlocksListView(generics.ListAPIView):
+class BlocksListView(CachedResponseMixin, generics.ListAPIView):
     serializer_class = BlockSerializer
     queryset = Block.objects.filter(is_active=True)
     permission_classes = [permissions.AllowAny]
+    response_cache_name = ResponseCache.BLOCKS
@@ -7,6 +7,74 @@ from rest_framework.exceptions import ValidationError
 from social.models import Comment, Rating, Like, CommentLike
 
 
+class UserFlagsListSerializer(serializers.ListSerializer):
+    """
+    Resolves flags of the current user (liked, saved) for all items
+    at once instead of per item, see UserFlagsSerializerMixin
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        self.child.load_user_flags(items)
+        return super().to_representation(items)
+
+
+class UserFlagsSerializerMixin:
+    """
+    Adds 'liked' and 'saved' flags of the current user to the representation
+
+    Flags are loaded with two IN queries for the whole list when used with
+    UserFlagsListSerializer, or for a single instance otherwise
+    """
+    liked_key = 'user_liked'
+    saved_key = None
+    saved_model = None
+    saved_field = None  # saved_model field pointing to the instance
+
+    def _get_user(self):
+        try:
+            user = self.context['request'].user
+        except KeyError:
+            return None
+        return user if user.is_authenticated else None
+
+    def load_user_flags(self, instances, saved=None):
+        """
+        Attach flags to instances, 'saved' may be passed as {instance pk: saved pk}
+        if already known by the caller
+        """
+        user = self._get_user()
+        pks = [i.pk for i in instances]
+
+        liked = set()
+        if user is not None and self.liked_key and pks:
+            liked = set(Like.objects.filter(
+                user=user,
+                content_type=ContentType.objects.get_for_model(self.Meta.model),
+                object_id__in=pks
+            ).values_list('object_id', flat=True))
+
+        if saved is None:
+            saved = {}
+            if user is not None and pks:
+                saved = dict(self.saved_model.objects.filter(
+                    user=user,
+                    **{f'{self.saved_field}__in': pks}
+                ).values_list(self.saved_field, 'pk'))
+
+        for instance in instances:
+            instance._user_liked = instance.pk in liked
+            instance._user_saved = saved.get(instance.pk, False)
+
+    def add_user_flags(self, instance, ret):
+        if not hasattr(instance, '_user_saved'):
+            self.load_user_flags([instance])
+        if self.liked_key:
+            ret[self.liked_key] = instance._user_liked
+        ret[self.saved_key] = instance._user_saved
+        return ret
+
+
 class RatingSerializer(serializers.ModelSerializer):
 
     class Meta:
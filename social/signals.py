@@ -0,0 +1,25 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from social.models import Like, Rating
+from stats.redis import DirtyObjectsCache
+
+
+def mark_object_dirty(content_type_id, kind, object_id):
+    model = ContentType.objects.get_for_id(content_type_id).model
+    # after the commit, so the counters task cannot pop the id before the change is visible
+    transaction.on_commit(lambda: DirtyObjectsCache().add(model, kind, object_id))
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def mark_rated_object_dirty(sender, instance, **kwargs):
+    mark_object_dirty(instance.content_type_id, DirtyObjectsCache.RATING, instance.object_id)
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def mark_liked_object_dirty(sender, instance, **kwargs):
+    mark_object_dirty(instance.content_type_id, DirtyObjectsCache.LIKES, instance.object_id)
@@ -1,19 +1,9 @@
 # -*- coding: utf-8 -*-
 
-from .models import ViewsCounter, SharesCounter, StatRecord
+from .models import StatRecord
 from django.contrib import admin
 
 
-@admin.register(ViewsCounter)
-class ViewsCounterAdmin(admin.ModelAdmin):
-    list_display = ('id', 'count')
-
-
-@admin.register(SharesCounter)
-class SharesCounterAdmin(admin.ModelAdmin):
-    list_display = ('id', 'count')
-
-
 @admin.register(StatRecord)
 class StatRecordAdmin(admin.ModelAdmin):
     list_display = (
@@ -21,8 +11,8 @@ class StatRecordAdmin(admin.ModelAdmin):
         'content_type',
         'object_id',
         'date',
-        'views_counter',
-        'shares_counter',
+        'views_count',
+        'shares_count',
     )
     list_filter = ('content_type', 'date')
     search_fields = ['object_id']
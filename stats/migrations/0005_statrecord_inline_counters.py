@@ -0,0 +1,32 @@
+# Generated by Django 3.2.4 on 2026-10-18 00:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0004_merge_0003_auto_20210727_0858_0003_auto_20210728_1246'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statrecord',
+            name='shares_count',
+            field=models.IntegerField(default=0, verbose_name='Shares'),
+        ),
+        migrations.AddField(
+            model_name='statrecord',
+            name='views_count',
+            field=models.IntegerField(default=0, verbose_name='Views'),
+        ),
+        migrations.RunSQL(
+            sql='''
+                UPDATE stats_statrecord SET views_count = c.count
+                FROM stats_viewscounter c WHERE c.id = stats_statrecord.views_counter_id;
+                UPDATE stats_statrecord SET shares_count = c.count
+                FROM stats_sharescounter c WHERE c.id = stats_statrecord.shares_counter_id;
+            ''',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.4 on 2026-10-18 00:42
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0005_statrecord_inline_counters'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='statrecord',
+            name='shares_counter',
+        ),
+        migrations.RemoveField(
+            model_name='statrecord',
+            name='views_counter',
+        ),
+        migrations.DeleteModel(
+            name='SharesCounter',
+        ),
+        migrations.DeleteModel(
+            name='ViewsCounter',
+        ),
+    ]
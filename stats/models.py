@@ -1,7 +1,8 @@
+from collections import namedtuple
 from enum import Enum
 
-from django.db import models
-from django.db.models import F
+from django.conf import settings
+from django.db import connection, models, transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.utils import timezone, dateformat
@@ -10,57 +11,61 @@ from django.db import IntegrityError
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 
+from stats.redis import DirtyObjectsCache, StatCountersBuffer
 
-class BaseStatCounter(models.Model):
 
-    count = models.IntegerField(verbose_name='Quantity', default=0)
-
-    class Meta:
-        abstract = True
-
-
-class ViewsCounter(BaseStatCounter):
-
-    def __str__(self):
-        return f'#{self.pk}: {self.count}'
-
-    class Meta:
-        ordering = ['count']
+class CounterKeys(Enum):
 
+    VIEWS_COUNTER = 'views_count'
+    SHARES_COUNTER = 'shares_count'
 
-class SharesCounter(BaseStatCounter):
+    @classmethod
+    def choices(cls):
+        return [key.name for key in cls]
 
-    def __str__(self):
-        return f'#{self.pk}: {self.count}'
 
-    class Meta:
-        ordering = ['count']
+# read-only stand-in for the former ViewsCounter/SharesCounter rows
+StatCounter = namedtuple('StatCounter', ['count'])
 
 
 class StatRecordManager(models.Manager):
 
-    def increment(self, content_object, model):
-        try:
-            stat_record = self.get(
-                content_type__model=content_object.__class__.__name__.lower(),
-                object_id=content_object.pk,
-                date=dateformat.format(timezone.now(), 'Y-m-d')
-            )
-        except StatRecord.DoesNotExist:
-            stat_record = self.create(
-                content_object=content_object,
-                date=dateformat.format(timezone.now(), 'Y-m-d')
+    def increment(self, content_object, counter: CounterKeys):
+        content_type = ContentType.objects.get_for_model(content_object)
+        date = dateformat.format(timezone.now(), 'Y-m-d')
+        if settings.STATS_WRITE_BEHIND:
+            # applied later by stats.tasks.flush_stat_counters
+            StatCountersBuffer().add(content_type.pk, content_object.pk, date, counter.name)
+            return 1
+        return self.add_counts(content_type.pk, content_object.pk, date, counter, 1)
+
+    def add_counts(self, content_type_id, object_id, date, counter: CounterKeys, amount):
+        """ Create the daily record or increase its counter in a single query """
+        table = self.model._meta.db_table
+        field = counter.value
+        counts = {key.value: amount if key is counter else 0 for key in CounterKeys}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                INSERT INTO {table} (content_type_id, object_id, date, views_count, shares_count)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (date, content_type_id, object_id)
+                DO UPDATE SET {field} = {table}.{field} + EXCLUDED.{field}
+                ''',
+                [content_type_id, object_id, date, counts['views_count'], counts['shares_count']]
             )
-        return model.objects.filter(
-            stat_record__id=stat_record.pk,
-            stat_record__date=stat_record.date
-        ).update(count=F('count') + 1)
+            updated = cursor.rowcount
+        if counter is CounterKeys.VIEWS_COUNTER:
+            model = ContentType.objects.get_for_id(content_type_id).model
+            # after the commit, so the counters task cannot pop the id before the change is visible
+            transaction.on_commit(lambda: DirtyObjectsCache().add(model, DirtyObjectsCache.VIEWS, object_id))
+        return updated
 
     def increment_views(self, content_object):
-        return self.increment(content_object, ViewsCounter)
+        return self.increment(content_object, CounterKeys.VIEWS_COUNTER)
 
     def increment_shares(self, content_object):
-        return self.increment(content_object, SharesCounter)
+        return self.increment(content_object, CounterKeys.SHARES_COUNTER)
 
 
 class StatRecord(models.Model):
@@ -76,23 +81,8 @@ class StatRecord(models.Model):
     object_id = models.BigIntegerField(null=False)
     content_object = GenericForeignKey('content_type', 'object_id')
 
-    views_counter = models.OneToOneField(
-        ViewsCounter,
-        on_delete=models.SET_NULL,
-        related_name='stat_record',
-        null=True,
-        default=None,
-        verbose_name='Views counter'
-    )
-
-    shares_counter = models.OneToOneField(
-        SharesCounter,
-        on_delete=models.SET_NULL,
-        related_name='stat_record',
-        null=True,
-        default=None,
-        verbose_name='Shares counter'
-    )
+    views_count = models.IntegerField(verbose_name='Views', default=0)
+    shares_count = models.IntegerField(verbose_name='Shares', default=0)
 
     date = models.DateField(verbose_name='Day')
 
@@ -101,22 +91,13 @@ class StatRecord(models.Model):
     class Meta:
         unique_together = [['date', 'content_type', 'object_id']]
 
-    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
-        if self.views_counter is None:
-            self.views_counter = ViewsCounter.objects.create()
-        if self.shares_counter is None:
-            self.shares_counter = SharesCounter.objects.create()
-        super().save(force_insert, force_update, using, update_fields)
-
+    @property
+    def views_counter(self):
+        return StatCounter(self.views_count)
 
-class CounterKeys(Enum):
-
-    VIEWS_COUNTER = ViewsCounter
-    SHARES_COUNTER = SharesCounter
-
-    @classmethod
-    def choices(cls):
-        return [key.name for key in cls]
+    @property
+    def shares_counter(self):
+        return StatCounter(self.shares_count)
 
 
 @receiver(post_save, sender='recipe.Recipe')
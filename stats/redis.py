@@ -0,0 +1,78 @@
+from redis import Redis
+
+from utils.redis import get_redis_instance
+
+
+class DirtyObjectsCache:
+    """
+    Keeps ids of objects whose denormalized counters (rating, likes, views)
+    are out of date and should be recalculated by the next aggregation run
+    """
+    RATING = 'rating'
+    LIKES = 'likes'
+    VIEWS = 'views'
+
+    redis: Redis
+
+    def __init__(self):
+        self.redis = get_redis_instance()
+
+    @staticmethod
+    def _gen_key(model_name: str, counter: str):
+        return f'dirty_objects:{model_name}:{counter}'
+
+    def add(self, model_name: str, counter: str, *pks):
+        if pks:
+            self.redis.sadd(self._gen_key(model_name, counter), *pks)
+
+    def pop_all(self, model_name: str, counter: str) -> list:
+        """ Return all marked ids and clear the set in one transaction """
+        key = self._gen_key(model_name, counter)
+        pipe = self.redis.pipeline()
+        pipe.smembers(key)
+        pipe.delete(key)
+        members, _ = pipe.execute()
+        return [int(pk) for pk in members]
+
+
+class CountersBuffer:
+    """
+    Write-behind buffer: increments are accumulated in a Redis hash
+    and periodically applied to the database by a flusher task
+    """
+    KEY = None
+
+    redis: Redis
+
+    def __init__(self):
+        self.redis = get_redis_instance()
+
+    def _add(self, *key_parts, amount=1):
+        self.redis.hincrby(self.KEY, ':'.join(str(p) for p in key_parts), amount)
+
+    def _pop_all(self) -> list:
+        """ Return all accumulated (key parts, amount) pairs and clear the buffer """
+        pipe = self.redis.pipeline()
+        pipe.hgetall(self.KEY)
+        pipe.delete(self.KEY)
+        values, _ = pipe.execute()
+        return [
+            (field.decode('utf-8').split(':'), int(amount))
+            for field, amount in values.items()
+        ]
+
+
+class StatCountersBuffer(CountersBuffer):
+    """
+    Keyed by (content_type, object_id, date, counter)
+    """
+    KEY = 'stat_counters_buffer'
+
+    def add(self, content_type_id, object_id, date, counter: str, amount=1):
+        self._add(content_type_id, object_id, date, counter, amount=amount)
+
+    def pop_all(self) -> list:
+        return [
+            (int(content_type_id), int(object_id), date, counter, amount)
+            for (content_type_id, object_id, date, counter), amount in self._pop_all()
+        ]
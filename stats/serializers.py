@@ -6,6 +6,9 @@ from rest_framework.exceptions import ValidationError
 
 class StatSerializer(serializers.ModelSerializer):
 
+    views_counter = serializers.IntegerField(source='views_count', read_only=True)
+    shares_counter = serializers.IntegerField(source='shares_count', read_only=True)
+
     class Meta:
         model = StatRecord
         fields = [
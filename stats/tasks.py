@@ -0,0 +1,39 @@
+import logging
+
+from django.db import IntegrityError
+from main.celery_config import app
+
+from stats.models import CounterKeys, StatRecord
+from stats.redis import StatCountersBuffer
+from users.models import UserViewHistoryRecord
+from users.redis import ViewHistoryBuffer
+
+logger = logging.getLogger('django')
+
+
+@app.task(acks_late=True)
+def flush_stat_counters():
+    """
+    Apply counters accumulated in write-behind mode (see STATS_WRITE_BEHIND)
+    """
+    stat_counters = StatCountersBuffer()
+    for content_type_id, object_id, date, counter, amount in stat_counters.pop_all():
+        try:
+            StatRecord.objects.add_counts(
+                content_type_id, object_id, date, CounterKeys[counter], amount
+            )
+        except Exception as e:
+            logger.error(f'Unable to flush {counter} for #{object_id} ({content_type_id}): {e}')
+            # return counts back to be applied by the next run
+            stat_counters.add(content_type_id, object_id, date, counter, amount)
+
+    view_history = ViewHistoryBuffer()
+    for user_id, recipe_id, amount in view_history.pop_all():
+        try:
+            UserViewHistoryRecord.objects.add_counts(user_id, recipe_id, amount)
+        except IntegrityError:
+            # user or recipe was deleted in the meantime
+            pass
+        except Exception as e:
+            logger.error(f'Unable to flush view history for user #{user_id}, recipe #{recipe_id}: {e}')
+            view_history.add(user_id, recipe_id, amount)
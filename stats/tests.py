@@ -1,4 +1,6 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from django.contrib.contenttypes.models import ContentType
+from django.test import override_settings
 from django.utils import timezone
 from django.utils import timezone, dateformat
 import copy
@@ -6,11 +8,15 @@ import copy
 from users.enums import UserTypes
 from main.utils.test import IsAuthClientTestCase, TestDataService
 from rest_framework.reverse import reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
 from rest_framework import status
 from recipe.enums import RecipeTypes, Cuisines, Diets, CookingMethods, CookingSkills
 from recipe.models import Recipe
-from stats.models import StatRecord
-from recipe.tasks import calculate_views_for_recipes
+from stats.models import CounterKeys, StatRecord
+from recipe.tasks import calculate_counters_for_changed_objects
+from stats.tasks import flush_stat_counters
+from stats.views import StatsView
+from users.models import UserViewHistoryRecord
 
 
 class StatsTestCase(IsAuthClientTestCase):
@@ -112,16 +118,17 @@ class StatsTestCase(IsAuthClientTestCase):
         data = copy.deepcopy(self.BASIC_TEST_DATA)
         recipe = Recipe.objects.create(**data)
 
-        for i in range(3):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
 
-            response = self.anonymous_client.get(
-                reverse('recipe:recipe_retrieve_update_destroy', args=[recipe.pk]))
-            self.assertEqual(response.status_code, status.HTTP_200_OK)
+                response = self.anonymous_client.get(
+                    reverse('recipe:recipe_retrieve_update_destroy', args=[recipe.pk]))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         r = Recipe.objects.get(pk=recipe.pk)
         self.assertEqual(r.views_number, 0)
 
-        calculate_views_for_recipes()
+        calculate_counters_for_changed_objects()
 
         r = Recipe.objects.get(pk=recipe.pk)
         self.assertEqual(r.views_number, 3)
@@ -129,4 +136,90 @@ class StatsTestCase(IsAuthClientTestCase):
         response = self.anonymous_client.get(
             reverse('recipe:recipe_retrieve_update_destroy', args=[recipe.pk]))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data['views_number'], 4)
+        # served from the denormalized column, updated by the periodic task
+        self.assertEqual(response.data['views_number'], 3)
+
+    @override_settings(STATS_WRITE_BEHIND=True)
+    def test_views_write_behind(self):
+
+        data = copy.deepcopy(self.BASIC_TEST_DATA)
+        recipe = Recipe.objects.create(**data)
+        flush_stat_counters()
+
+        for i in range(3):
+
+            response = self.client.get(
+                reverse('recipe:recipe_retrieve_update_destroy', args=[recipe.pk]))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        stat = StatRecord.objects.get(
+            content_type__model=recipe.__class__.__name__.lower(),
+            object_id=recipe.pk,
+            date=dateformat.format(timezone.now(), 'Y-m-d')
+        )
+        self.assertEqual(stat.views_count, 0)
+        self.assertFalse(UserViewHistoryRecord.objects.filter(recipe=recipe).exists())
+
+        flush_stat_counters()
+
+        stat.refresh_from_db()
+        self.assertEqual(stat.views_count, 3)
+        self.assertEqual(UserViewHistoryRecord.objects.get(user=self.user, recipe=recipe).count, 3)
+
+    def test_add_counts_upsert(self):
+
+        data = copy.deepcopy(self.BASIC_TEST_DATA)
+        recipe = Recipe.objects.create(**data)
+        content_type = ContentType.objects.get_for_model(recipe)
+
+        for date in ['2021-08-01', '2021-08-01', '2021-08-02']:
+            StatRecord.objects.add_counts(content_type.pk, recipe.pk, date, CounterKeys.SHARES_COUNTER, 2)
+        StatRecord.objects.add_counts(content_type.pk, recipe.pk, '2021-08-01', CounterKeys.VIEWS_COUNTER, 5)
+
+        stat = StatRecord.objects.get(content_type=content_type, object_id=recipe.pk, date='2021-08-01')
+        self.assertEqual(stat.shares_count, 4)
+        self.assertEqual(stat.views_count, 5)
+        self.assertEqual(stat.views_counter.count, 5)
+        stat = StatRecord.objects.get(content_type=content_type, object_id=recipe.pk, date='2021-08-02')
+        self.assertEqual(stat.shares_count, 2)
+        self.assertEqual(stat.views_count, 0)
+
+    def test_stats_grouped_by_periods(self):
+
+        data = copy.deepcopy(self.BASIC_TEST_DATA)
+        recipe = Recipe.objects.create(**data)
+        content_type = ContentType.objects.get_for_model(recipe)
+        start = datetime(2021, 6, 7).date()  # monday
+        for day in range(70):
+            StatRecord.objects.add_counts(
+                content_type.pk, recipe.pk, start + timedelta(days=day), CounterKeys.VIEWS_COUNTER, 1)
+        StatRecord.objects.add_counts(content_type.pk, recipe.pk, start, CounterKeys.SHARES_COUNTER, 3)
+
+        view = StatsView.as_view()
+
+        def get_stats(**params):
+            request = APIRequestFactory().get('/', {'content_type': 'recipe', **params})
+            force_authenticate(request, user=self.user)
+            response = view(request, id=recipe.pk)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return response.data
+
+        # the number of queries doesn't depend on the number of periods
+        for end_date in ['2021-06-13', '2021-08-15']:
+            with self.assertNumQueries(1):
+                weeks = get_stats(group_by='weeks', start_date='2021-06-07', end_date=end_date)
+
+        self.assertEqual(len(weeks), 10)
+        self.assertEqual(weeks[0], {'date': '2021-06-07 - 2021-06-13', 'views_counter': 7, 'shares_counter': 3})
+
+        months = get_stats(group_by='months', end_date='2021-12-31')
+        self.assertEqual([m['date'] for m in months], ['June', 'July', 'August'])
+        self.assertEqual([m['views_counter'] for m in months], [24, 31, 15])
+
+        days = get_stats(group_by='days', end_date='2021-06-08')
+        self.assertEqual(days, [
+            {'date': '2021-06-07', 'views_counter': 1, 'shares_counter': 3},
+            {'date': '2021-06-08', 'views_counter': 1, 'shares_counter': 0},
+        ])
+
+        self.assertEqual(get_stats(content_type='chefpencilrecord', group_by='days'), [])
@@ -1,8 +1,8 @@
-from calendar import monthrange
-from datetime import timedelta, datetime
+from datetime import timedelta
 
 from django.db import IntegrityError
 from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import generics, serializers, status
 from rest_framework.permissions import AllowAny, IsAdminUser
@@ -23,17 +23,23 @@ class StatsView(generics.ListAPIView):
 
     serializer_class = StatSerializer
     queryset = StatRecord.objects.all()
+    DAYS = 'days'
     WEEKS = 'weeks'
     MONTHS = 'months'
 
+    PERIOD_FUNCTIONS = {
+        DAYS: TruncDay,
+        WEEKS: TruncWeek,
+        MONTHS: TruncMonth,
+    }
+
     def get_queryset(self):
         qs = StatRecord.objects.all() \
-            .select_related('views_counter', 'shares_counter') \
             .filter(
-                # TODO: content_type__model='content_type',
                 object_id=self.kwargs.get('id')
             )
         filter_args = dict(
+            content_type__model=self.request.query_params.get('content_type', None),
             date__gte=self.request.query_params.get('start_date', None),
             date__lte=self.request.query_params.get('end_date', None),
         )
@@ -43,53 +49,48 @@ class StatsView(generics.ListAPIView):
     class StatsViewQueryRequest(serializers.Serializer):
         start_date = serializers.DateField(write_only=True, required=False)
         end_date = serializers.DateField(write_only=True, required=False)
+        content_type = serializers.CharField(write_only=True, required=False)
+        group_by = serializers.ChoiceField(
+            choices=['days', 'weeks', 'months'],
+            write_only=True,
+            required=False
+        )
 
     @swagger_auto_schema(
         query_serializer=StatsViewQueryRequest(),
         responses={status.HTTP_200_OK: StatSerializer(many=False)})
     def get(self, request, *args, **kwargs):
         group_by = self.request.query_params.get('group_by')
+
+        if group_by in self.PERIOD_FUNCTIONS:
+            return Response(self._get_stats_by_periods(group_by))
+
         queryset = self.filter_queryset(self.get_queryset())
         serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
 
+    def _get_stats_by_periods(self, group_by):
+        """ Sum counters for every day, week or month of the range in one query """
+        periods = self.filter_queryset(self.get_queryset()) \
+            .annotate(period=self.PERIOD_FUNCTIONS[group_by]('date')) \
+            .values('period') \
+            .annotate(views_counter=Sum('views_count'), shares_counter=Sum('shares_count')) \
+            .order_by('period')
+        return [
+            {
+                'date': self._format_period(item['period'], group_by),
+                'views_counter': item['views_counter'],
+                'shares_counter': item['shares_counter'],
+            }
+            for item in periods
+        ]
+
+    def _format_period(self, first_date, group_by):
         if group_by == self.WEEKS:
-            data = self._get_stats_by_weeks()
-            return Response(data)
-
+            return f"{first_date} - {first_date + timedelta(days=6)}"
         if group_by == self.MONTHS:
-            data = self._get_stats_by_months()
-            return Response(data)
-
-        return Response(serializer.data)
-
-    def _get_stats_by_months(self):
-        data = []
-        months = self.filter_queryset(
-            self.get_queryset()).dates('date', 'month')
-        for first_date in months:
-            end_day_of_month = monthrange(first_date.year, first_date.month)[1]
-            end_date = datetime(
-                year=first_date.year, month=first_date.month, day=end_day_of_month).date()
-            item = {'date': first_date.strftime("%B")}
-            item.update(self._get_aggregate_period(first_date, end_date))
-            data.append(item)
-        return data
-
-    def _get_stats_by_weeks(self):
-        data = []
-        weeks = self.filter_queryset(self.get_queryset()).dates('date', 'week')
-        for monday in weeks:
-            sunday = monday + timedelta(days=6)
-            item = {'date': f"{monday} - {sunday}"}
-            item.update(self._get_aggregate_period(monday, sunday))
-            data.append(item)
-        return data
-
-    def _get_aggregate_period(self, start_day, end_day):
-        queryset = self.filter_queryset(self.get_queryset())
-        return queryset.filter(date__gte=start_day, date__lte=end_day) \
-            .aggregate(views_counter=Sum('views_counter__count'),
-                       shares_counter=Sum('shars_counter__count'))
+            return first_date.strftime("%B")
+        return str(first_date)
 
 
 class StatsIncrementView(generics.CreateAPIView):
@@ -104,7 +105,7 @@ class StatsIncrementView(generics.CreateAPIView):
         try:
             StatRecord.objects.increment(
                 serializer.validated_data['content_object'],
-                eval(f"CounterKeys.{serializer.validated_data['key']}.value")
+                CounterKeys[serializer.validated_data['key']]
             )
         except IntegrityError:
             return Response(status=status.HTTP_400_BAD_REQUEST)
@@ -1,3 +1,4 @@
+import time
 from datetime import timedelta
 
 from django.conf import settings
@@ -14,12 +15,15 @@ from main.validators import (
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.core.validators import MinLengthValidator
 from django.core.validators import EmailValidator
-from django.db import models, transaction
+from django.db import connection, models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from main.validators import validate_avatar_max_size
 from users.enums import UserStatuses, UserTypes
+from users.redis import ViewHistoryBuffer
 from utils.file_storage import avatar_property_avatar_path
 from users.services.user import UserService
 from utils.file_storage import role_model_image_file_path
@@ -333,6 +337,45 @@ class User(AbstractUser):
         return self.user_type
 
 
+class EatChefsAccount:
+    """
+    Process-level cache of the id of the EatChefs staff account
+    (settings.EATCHEFS_ACCOUNT_NAME), the author of imported recipes
+
+    Reset by User post_save/post_delete receivers. They reset the cache
+    of the current process only, so the value also expires after TIMEOUT
+    """
+    TIMEOUT = 10 * 60
+
+    _id = None
+    _expires_at = 0
+
+    @classmethod
+    def get_id(cls):
+        if time.monotonic() >= cls._expires_at:
+            cls._id = User.objects.filter(
+                full_name=settings.EATCHEFS_ACCOUNT_NAME,
+                is_staff=True
+            ).values_list('pk', flat=True).first()
+            cls._expires_at = time.monotonic() + cls.TIMEOUT
+        return cls._id
+
+    @classmethod
+    def reset(cls):
+        cls._expires_at = 0
+
+    @classmethod
+    def is_related(cls, user):
+        return user.pk == cls._id or user.full_name == settings.EATCHEFS_ACCOUNT_NAME
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def reset_eatchefs_account(sender, instance, **kwargs):
+    if EatChefsAccount.is_related(instance):
+        EatChefsAccount.reset()
+
+
 class FavoriteRecipe(models.Model):
 
     recipe = models.ForeignKey(
@@ -399,6 +442,31 @@ class RoleModel(models.Model):
         return f'#{self.pk} {self.user}: {self.name} {self.created_at}'
 
 
+class UserViewHistoryRecordManager(models.Manager):
+
+    def increment(self, user_id, recipe_id):
+        if settings.STATS_WRITE_BEHIND:
+            # applied later by stats.tasks.flush_stat_counters
+            ViewHistoryBuffer().add(user_id, recipe_id)
+        else:
+            self.add_counts(user_id, recipe_id, 1)
+
+    def add_counts(self, user_id, recipe_id, amount):
+        """ Create the record or increase its count in a single query """
+        table = self.model._meta.db_table
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                INSERT INTO {table} (user_id, recipe_id, count, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (user_id, recipe_id)
+                DO UPDATE SET count = {table}.count + EXCLUDED.count, updated_at = EXCLUDED.updated_at
+                ''',
+                [user_id, recipe_id, amount, now, now]
+            )
+
+
 class UserViewHistoryRecord(models.Model):
 
     recipe = models.ForeignKey(
@@ -417,6 +485,8 @@ class UserViewHistoryRecord(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     updated_at = models.DateTimeField(_('Updated at'), auto_now=True)
 
+    objects = UserViewHistoryRecordManager()
+
     def __str__(self):
         return f'#{self.pk} {self.recipe} count: {self.count} {self.created_at}'
 
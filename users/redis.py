@@ -1,5 +1,6 @@
 from redis import Redis
 
+from stats.redis import CountersBuffer
 from utils.redis import get_redis_instance
 
 
@@ -21,3 +22,19 @@ class NewMailCache:
         if value is None:
             return None
         return value.decode('utf-8')
+
+
+class ViewHistoryBuffer(CountersBuffer):
+    """
+    Accumulates UserViewHistoryRecord increments, keyed by (user, recipe)
+    """
+    KEY = 'view_history_buffer'
+
+    def add(self, user_id, recipe_id, amount=1):
+        self._add(user_id, recipe_id, amount=amount)
+
+    def pop_all(self) -> list:
+        return [
+            (int(user_id), int(recipe_id), amount)
+            for (user_id, recipe_id), amount in self._pop_all()
+        ]
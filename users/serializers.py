@@ -377,8 +377,8 @@ class UserStatSerializer(UserCustomerSerializer):
         ) \
             .select_related('user') \
             .annotate(
-            total_views=Sum('stat_records__views_counter__count'),
-            total_shares=Sum('stat_records__shares_counter__count')
+            total_views=Sum('stat_records__views_count'),
+            total_shares=Sum('stat_records__shares_count')
         ) \
         .values('pk', 'user', 'total_views', 'total_shares')
 
@@ -13,7 +13,7 @@ from utils.email import SEND_CONFIRM_EMAIL_SUBJECT
 
 from users.enums import UserStatuses, UserTypes
 from users.errors import UserIsHardBanned
-from users.models import RoleModel, User, WorkExperienceRecord
+from users.models import EatChefsAccount, RoleModel, User, WorkExperienceRecord
 
 from utils.test import get_test_avatar_file, get_test_files, get_alt_test_files
 
@@ -681,6 +681,29 @@ class UserTestCase(IsAuthClientTestCase):
         user = User.objects.get(pk=self.user.pk)
         self.assertTrue(str(user.avatar).endswith('.png'))
 
+    def test_eatchefs_account_cache(self):
+        EatChefsAccount.reset()
+        self.addCleanup(EatChefsAccount.reset)
+
+        account = User.objects.get(full_name=settings.EATCHEFS_ACCOUNT_NAME, is_staff=True)
+        self.assertEqual(EatChefsAccount.get_id(), account.pk)
+
+        # saving other users doesn't reset the cache
+        self.user.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(EatChefsAccount.get_id(), account.pk)
+
+        account.full_name = 'Not EatChefs'
+        account.save()
+        self.assertIsNone(EatChefsAccount.get_id())
+
+        account.full_name = settings.EATCHEFS_ACCOUNT_NAME
+        account.save()
+        self.assertEqual(EatChefsAccount.get_id(), account.pk)
+
+        account.delete()
+        self.assertIsNone(EatChefsAccount.get_id())
+
     @classmethod
     def tearDownClass(cls) -> None:
         try:
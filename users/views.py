@@ -12,7 +12,7 @@ from rest_framework.reverse import reverse
 from social_core.exceptions import MissingBackend
 from social_django.utils import load_backend, load_strategy
 from main.permissions import IsOwner
-from main.pagination import StandardResultsSetPagination
+from main.pagination import KeysetResultsSetPagination
 
 from users.models import User, UserViewHistoryRecord
 from users.serializers import (
@@ -333,7 +333,10 @@ class UserViewHistoryRecordView(generics.ListAPIView):
         .order_by("-updated_at")
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = UserViewHistoryRecordSerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetResultsSetPagination
 
     def get_queryset(self):
         return super().get_queryset().filter(user=self.request.user)
+
+    def get_keyset_ordering(self):
+        return ['-updated_at']